@@ -37,24 +37,20 @@ def auth_login(email, password):
     if not re.search(REGEX, email):
         raise InputError('Invalid email address entered')
 
-    if not any(email == user['email'] for _, user in data['users'].items()):
+    u_id = data.user_by_email(email)
+    if u_id is None:
         raise InputError('Email entered does not belong to a user')
 
-    for user in data['users']:
-        if data['users'][user]['email'] == email and data['users'][user]['password'] != password:
-            raise InputError('Password entered is incorrect')
+    if data.get_user(u_id)['password'] != password:
+        raise InputError('Password entered is incorrect')
 
-    token = generate_token(data)
-
-    u_id = 0
-    for user in data['users']:
-        if data['users'][user]['email'] == email and data['users'][user]['password'] == password:
-            data['users'][user]['token'] = str(token)
-            u_id = data['users'][user]['u_id']
+    # each login starts a new session, earlier sessions of the user stay active
+    token = generate_token()
+    data.add_session(token, u_id)
 
     return {
         'u_id': u_id,
-        'token': str(token),
+        'token': token,
     }
 
 def auth_logout(token):
@@ -67,13 +63,10 @@ def auth_logout(token):
     false. The function returns a dictionary containing is_success, which is
     either True or False.
     '''
-    for user in data['users']:
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                del data['users'][user]['token']
-                return {
-                    'is_success': True,
-                }
+    if data.remove_session(token):
+        return {
+            'is_success': True,
+        }
     return {
         'is_success': False,
     }
@@ -103,36 +96,36 @@ def auth_register(email, password, name_first, name_last):
     if len(password) < 6:
         raise InputError('Password cannot be less than 6 characters long')
 
-    if any(email == user['email'] for _, user in data['users'].items()):
-        raise InputError('Email address is already being used by another user')
+    with data.users_lock:
+        if data.user_by_email(email) is not None:
+            raise InputError('Email address is already being used by another user')
 
-    if not re.search(REGEX, email):
-        raise InputError('Invalid email address entered')
+        if not re.search(REGEX, email):
+            raise InputError('Invalid email address entered')
 
-    u_id = len(data['users']) + 1
-    handle = generate_handle(name_first, name_last, data)
-
-    token = generate_token(data)
-
-    permission_id = 2
-    if u_id == 1:
-        permission_id = 1
-
-    data['users'][u_id] = {
-        'email': email,
-        'password' : password,
-        'name_first' : name_first,
-        'name_last' : name_last,
-        'u_id' : u_id,
-        'token' : str(token),
-        'handle_str' : handle,
-        'channel_membership' : [],
-        'permission_id': permission_id
-    }
+        u_id = data.user_count() + 1
+        handle = generate_handle(name_first, name_last, data)
+
+        token = generate_token()
+
+        permission_id = 2
+        if u_id == 1:
+            permission_id = 1
+
+        data.add_user({
+            'email': email,
+            'password' : password,
+            'name_first' : name_first,
+            'name_last' : name_last,
+            'u_id' : u_id,
+            'handle_str' : handle,
+            'permission_id': permission_id
+        })
+        data.add_session(token, u_id)
 
     return {
-        'u_id': data['users'][u_id]['u_id'],
-        'token': data['users'][u_id]['token'],
+        'u_id': u_id,
+        'token': token,
     }
 
 def auth_passwordreset_request(email):
@@ -141,15 +134,16 @@ def auth_passwordreset_request(email):
     user is sent an email contaning a reset code that authenticates
     the user as the individual who is trying to reset their password
     '''
-    reset_code = str(random.randrange(10000000, 90000000))
-    is_registered = False
-    for user in data['users']:
-        if data['users'][user]['email'] == email:
-            is_registered = True
-            data['users'][user]['reset_code'] = reset_code
-    if not is_registered:
+    u_id = data.user_by_email(email)
+    if u_id is None:
         raise InputError("User is not registered")
 
+    # a new reset code replaces any reset code the user was sent before
+    reset_code = str(random.randrange(10000000, 90000000))
+    while data.reset_code_user(reset_code) is not None:
+        reset_code = str(random.randrange(10000000, 90000000))
+    data.set_reset_code(u_id, reset_code)
+
     port = 0
     smtp_server = "smtp.gmail.com"
     sender_email = "deathofthebachelor1@gmail.com"
@@ -177,15 +171,10 @@ def auth_passwordreset_reset(reset_code, new_password):
     if len(new_password) < 6:
         raise InputError('Password cannot be less than 6 characters long')
 
-    valid_reset_code = False
-    for user in data['users']:
-        if 'reset_code' in data['users'][user]:
-            if data['users'][user]['reset_code'] == reset_code:
-                valid_reset_code = True
-                data['users'][user]['password'] = new_password
-                del data['users'][user]['reset_code']
-
-    if not valid_reset_code:
+    u_id = data.remove_reset_code(reset_code)
+    if u_id is None:
         raise InputError('Invalid reset code entered')
 
+    data.update_user(u_id, password=new_password)
+
     return {}
@@ -2,7 +2,7 @@
 import pytest
 from auth import auth_register, auth_login, auth_logout
 from auth import auth_passwordreset_request, auth_passwordreset_reset
-from error import InputError
+from error import InputError, AccessError
 from other import clear
 from user import user_profile
 
@@ -176,6 +176,26 @@ def test_auth_register_handle_lowercase_only():
     profile = user_profile(user_dict['token'], user_dict['u_id'])
     assert profile['user']['handle_str'] == "tomhardy"
 
+def test_auth_register_handle_taken():
+    '''
+    test to check that handles stay unique and follow the suffixing rules
+    when many users register with the same name
+    '''
+    clear()
+    handle_list = []
+    for i in range(500):
+        user_dict = auth_register(str(i) + "ankitrai@gmail.com", "12345678", "tom", "hardy")
+        profile = user_profile(user_dict['token'], user_dict['u_id'])
+        handle_list.append(profile['user']['handle_str'])
+
+    assert handle_list[0] == "tomhardy"
+    assert handle_list[1] == "tomhardy_"
+    assert handle_list[12] == "tomhardy____________"
+    assert handle_list[13] == "tomhardy___________a"
+    assert all(len(handle) <= 20 for handle in handle_list)
+    # if size of list and set is equal, then no duplicate handles
+    assert len(handle_list) == len(set(handle_list))
+
 # Tests for auth_login:
 def test_auth_login_unregistered_email():
     '''
@@ -215,6 +235,19 @@ def test_auth_login_return():
     profile = user_profile(user_dict2['token'], user_dict2['u_id'])
     assert profile['user']['u_id'] == user_dict2['u_id']
 
+def test_auth_login_unique_token():
+    '''
+    test to check if tokens generated by logging in many times are unique
+    '''
+    clear()
+    user_info = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    token_list = [user_info['token']]
+    for _ in range(1000):
+        token_list.append(auth_login("ankitrai326@gmail.com", "12345678")['token'])
+
+    # if size of list and set is equal, then no duplicate tokens
+    assert len(token_list) == len(set(token_list))
+
 # Tests for auth_logout:
 def test_auth_logout_invalid_token():
     '''
@@ -260,6 +293,23 @@ def test_auth_logout_token_invalidated():
     assert user_dict['is_success']
     assert not user_dict1['is_success']
 
+def test_auth_logout_concurrent_sessions():
+    '''
+    tests that logging in again starts a second session, and logging out of
+    one session does not invalidate the other session of the same user
+    '''
+    clear()
+    user_info = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    user_info1 = auth_login("ankitrai326@gmail.com", "12345678")
+    assert user_info['token'] != user_info1['token']
+    assert user_info['u_id'] == user_info1['u_id']
+
+    assert auth_logout(user_info['token'])['is_success']
+    profile = user_profile(user_info1['token'], user_info1['u_id'])
+    assert profile['user']['u_id'] == user_info['u_id']
+    with pytest.raises(AccessError):
+        assert user_profile(user_info['token'], user_info['u_id'])
+
 # Tests for auth_passwordreset_request:
 def test_auth_passwordreset_request_unregistered_email():
     '''
@@ -2,7 +2,8 @@
 from data import data
 from error import InputError, AccessError
 from helper_functions import channel_is_member, channel_has_owner_permissions
-from helper_functions import u_id_finder, valid_user_id, valid_channel
+from helper_functions import u_id_finder, valid_user_id, valid_channel, member_details
+from helper_functions import message_details
 
 
 def channel_invite(token, channel_id, u_id):
@@ -20,35 +21,21 @@ def channel_invite(token, channel_id, u_id):
     u_id_inviter = u_id_finder(token, data)
 
     # checking if u_id_inviter is a member of the channel with helper_function
-    is_member = channel_is_member(channel_id, u_id_inviter, data)
-    if not is_member:
-        raise AccessError("User is not a member of this channel")
-
-    # checking if u_id_invitee is already a member
-    is_member = channel_is_member(channel_id, u_id, data)
-    if is_member:
-        raise AccessError("User is already a member of this channel")
-
-    # adding user_details into channel 'all_members' data
-    user_detail = {
-        'u_id': u_id,
-        'name_first': data['users'][u_id]['name_first'],
-        'name_last': data['users'][u_id]['name_last']
-    }
-    if 'profile_img_url' in data['users'][u_id]:
-        user_detail['profile_img_url'] = data['users'][u_id]['profile_img_url']
-    data['channels'][channel_id]['all_members'].append(user_detail)
-    # if u_id is a global owner, becomes a local owner as well
-    if data['users'][u_id]['permission_id'] == 1:
-        if user_detail not in data['channels'][channel_id]['owner_members']:
-            data['channels'][channel_id]['owner_members'].append(user_detail)
-
-    # adding channel_details into user 'channel_membership' data
-    channel_detail = {
-        'channel_id': channel_id,
-        'name': data['channels'][channel_id]['name']
-    }
-    data['users'][u_id]['channel_membership'].append(channel_detail)
+    with data.channel_lock(channel_id):
+        is_member = channel_is_member(channel_id, u_id_inviter, data)
+        if not is_member:
+            raise AccessError("User is not a member of this channel")
+
+        # checking if u_id_invitee is already a member
+        is_member = channel_is_member(channel_id, u_id, data)
+        if is_member:
+            raise AccessError("User is already a member of this channel")
+
+        # adding u_id as a member of the channel
+        data.add_member(channel_id, u_id)
+        # if u_id is a global owner, becomes a local owner as well
+        if data.get_user(u_id)['permission_id'] == 1:
+            data.add_owner(channel_id, u_id)
 
     return {
     }
@@ -66,21 +53,24 @@ def channel_details(token, channel_id):
     u_id = u_id_finder(token, data)
 
     # checking if u_id is a member of the channel with helper_function
-    is_member = channel_is_member(channel_id, u_id, data)
-    if not is_member:
-        raise AccessError("User is not a member of this channel")
-
-    # creating returned dictionary
-    channel_name = data['channels'][channel_id]['name']
-    owner_members = data['channels'][channel_id]['owner_members']
-    all_members = data['channels'][channel_id]['all_members']
+    with data.channel_lock(channel_id):
+        is_member = channel_is_member(channel_id, u_id, data)
+        if not is_member:
+            raise AccessError("User is not a member of this channel")
+
+        # creating returned dictionary
+        channel_name = data.get_channel(channel_id)['name']
+        # the owners are members as well, so their details are only made once
+        details_cache = {}
+        owner_members = member_details(data.channel_owners(channel_id), data, details_cache)
+        all_members = member_details(data.channel_members(channel_id), data, details_cache)
     return {
         'name': channel_name,
         'owner_members': owner_members,
         'all_members': all_members,
     }
 
-def channel_messages(token, channel_id, start):
+def channel_messages(token, channel_id, start, before_message_id=None, after_message_id=None):
     '''
     Given a channel with the channel_id that the user with the token is a part
     of, return up to 50 messages bewtween index start and start + 50. Message
@@ -88,6 +78,13 @@ def channel_messages(token, channel_id, start):
     returns a new index "end" which is the value of "start + 50", or, if this
     function has returned the least recent messages in the channel, returns -1
     in "end" to indicate there are no more messages to load after this return.
+
+    Instead of start, a message_id can be given as before_message_id to return
+    up to 50 messages sent before that message, or as after_message_id to
+    return up to 50 messages sent after it. "end" is then the message_id to
+    give as the next before_message_id (or after_message_id) to keep loading,
+    or -1 if there are no more messages. Messages sent while loading do not
+    move these pages, so no message is returned twice or skipped.
     '''
     # catching InputError
     if not valid_channel(channel_id, data):
@@ -97,41 +94,81 @@ def channel_messages(token, channel_id, start):
     u_id = u_id_finder(token, data)
 
     # checking if u_id is a member of the channel with helper_function
-    is_member = channel_is_member(channel_id, u_id, data)
-    if not is_member:
-        raise AccessError("User is not a member of this channel")
+    with data.channel_lock(channel_id):
+        is_member = channel_is_member(channel_id, u_id, data)
+        if not is_member:
+            raise AccessError("User is not a member of this channel")
 
-    # accessing message from channel data
-    for message in data['channels'][channel_id]['messages']:
-        for react in message['reacts']:
-            if u_id in react['u_ids']:
-                react['is_this_user_reacted'] = True
-            else:
-                react['is_this_user_reacted'] = False
-    message_list = data['channels'][channel_id]['messages']
+        if before_message_id is not None or after_message_id is not None:
+            return channel_messages_from_cursor(u_id, channel_id, before_message_id,
+                                                after_message_id)
 
-    oldest_message = len(message_list) - 1
+        # accessing the number of messages from channel data
+        message_count = data.message_count(channel_id)
+        oldest_message = message_count - 1
 
-    if len(message_list) == 0:
-        oldest_message = 0
+        if message_count == 0:
+            oldest_message = 0
 
-    # catching InputError
-    if start > oldest_message:
-        raise InputError("Start is greater than the total number of messages in this channel")
-
-    # creating message list and returned dictionary
-    end_point = start + 49
-    end_value = start + 50
-    if end_point >= oldest_message:
-        end_point = oldest_message + 1
-        end_value = -1
+        # catching InputError
+        if start > oldest_message:
+            raise InputError("Start is greater than the total number of messages in this channel")
+
+        end_value = start + 50
+        if end_value >= message_count:
+            end_value = -1
+        page = []
+        for message in data.channel_messages(channel_id, start, 50):
+            page.append(message_details(message, u_id))
+
+    # creating returned dictionary
     return_val = {
-        'messages': message_list[start:end_point],
+        'messages': page,
         'start': start,
         'end': end_value,
     }
     return return_val
 
+def channel_messages_from_cursor(u_id, channel_id, before_message_id, after_message_id):
+    '''
+    Used by channel_messages to return the page of messages before
+    before_message_id or after after_message_id in the channel with channel_id
+    '''
+    # catching InputError
+    if before_message_id is not None and after_message_id is not None:
+        raise InputError("Only one of before_message_id and after_message_id can be given")
+    cursor = before_message_id if before_message_id is not None else after_message_id
+    if data.message_channel(cursor) != channel_id:
+        raise InputError("Message cannot be found in this channel")
+
+    # finding the page on either side of the message, with one message more
+    # than the page to show whether there are more after it
+    if before_message_id is not None:
+        messages = data.messages_before(cursor, 51)
+        has_more = len(messages) > 50
+        messages = messages[:50]
+    else:
+        messages = data.messages_after(cursor, 51)
+        has_more = len(messages) > 50
+        messages = messages[-50:]
+
+    page = []
+    for message in messages:
+        page.append(message_details(message, u_id))
+
+    # end is the message to carry on from, the oldest message of the page when
+    # loading older messages and the newest message when loading newer ones
+    end_value = -1
+    if has_more and before_message_id is not None:
+        end_value = page[-1]['message_id']
+    elif has_more:
+        end_value = page[0]['message_id']
+    return {
+        'messages': page,
+        'start': cursor,
+        'end': end_value,
+    }
+
 def channel_leave(token, channel_id):
     '''
     Given a channel with the channel_id, user with the token is removed as a
@@ -145,31 +182,14 @@ def channel_leave(token, channel_id):
     u_id = u_id_finder(token, data)
 
     # checking if u_id is a member of the channel with helper_function
-    is_member = channel_is_member(channel_id, u_id, data)
-    if not is_member:
-        raise AccessError("User is not a member of this channel")
-
-    # removing channel_detail from user 'channel_membership' data
-    channel_detail = {
-        'channel_id': channel_id,
-        'name': data['channels'][channel_id]['name']
-    }
-    data['users'][u_id]['channel_membership'].remove(channel_detail)
-
-    # removing user_detail from channel 'all_members' data
-    user_detail = user_detail = {
-        'u_id': u_id,
-        'name_first': data['users'][u_id]['name_first'],
-        'name_last': data['users'][u_id]['name_last']
-    }
-    if 'profile_img_url' in data['users'][u_id]:
-        user_detail['profile_img_url'] = data['users'][u_id]['profile_img_url']
-    data['channels'][channel_id]['all_members'].remove(user_detail)
-
-    # by the assumption we made, owners who leave the channel have their
-    # 'owner' status taken away
-    if user_detail in data['channels'][channel_id]['owner_members']:
-        data['channels'][channel_id]['owner_members'].remove(user_detail)
+    with data.channel_lock(channel_id):
+        is_member = channel_is_member(channel_id, u_id, data)
+        if not is_member:
+            raise AccessError("User is not a member of this channel")
+
+        # removing u_id as a member of the channel, by the assumption we made,
+        # owners who leave the channel have their 'owner' status taken away
+        data.remove_member(channel_id, u_id)
     return {
     }
 
@@ -186,39 +206,25 @@ def channel_join(token, channel_id):
     u_id = u_id_finder(token, data)
 
     # raises AccessError if user is already a member of said channel
-    is_member = channel_is_member(channel_id, u_id, data)
-    if is_member:
-        raise AccessError("User is already a member of this channel")
-
-    is_owner = False
-    # if user has a permisssion_id of an owner, user can join private channels
-    if data['users'][u_id]['permission_id'] == 1:
-        is_owner = True
-
-    # catching AccessError
-    if not data['channels'][channel_id]['is_public'] and not is_owner:
-        raise AccessError("Channel is not public")
-
-    # creating user_detail dict and adding it into channel 'all_members' data
-    user_detail = {
-        'u_id': u_id,
-        'name_first': data['users'][u_id]['name_first'],
-        'name_last': data['users'][u_id]['name_last']
-    }
-    if 'profile_img_url' in data['users'][u_id]:
-        user_detail['profile_img_url'] = data['users'][u_id]['profile_img_url']
-    data['channels'][channel_id]['all_members'].append(user_detail)
-    # if u_id is a global owner, becomes a local owner as well
-    if data['users'][u_id]['permission_id'] == 1:
-        if user_detail not in data['channels'][channel_id]['owner_members']:
-            data['channels'][channel_id]['owner_members'].append(user_detail)
-
-    # creating channel_detail dict and adding it into user 'channel_membership' data
-    channel_detail = {
-        'channel_id': channel_id,
-        'name': data['channels'][channel_id]['name']
-    }
-    data['users'][u_id]['channel_membership'].append(channel_detail)
+    with data.channel_lock(channel_id):
+        is_member = channel_is_member(channel_id, u_id, data)
+        if is_member:
+            raise AccessError("User is already a member of this channel")
+
+        is_owner = False
+        # if user has a permisssion_id of an owner, user can join private channels
+        if data.get_user(u_id)['permission_id'] == 1:
+            is_owner = True
+
+        # catching AccessError
+        if not data.get_channel(channel_id)['is_public'] and not is_owner:
+            raise AccessError("Channel is not public")
+
+        # adding u_id as a member of the channel
+        data.add_member(channel_id, u_id)
+        # if u_id is a global owner, becomes a local owner as well
+        if data.get_user(u_id)['permission_id'] == 1:
+            data.add_owner(channel_id, u_id)
 
     return {
     }
@@ -236,33 +242,26 @@ def channel_addowner(token, channel_id, u_id):
 
     # catching errors to do with ownership
     # checking for owner permissions of inviter
-    is_owner = channel_has_owner_permissions(channel_id, u_id_inviter, data)
-    if not is_owner:
-        raise AccessError("Given token is not an owner of the channel")
+    with data.channel_lock(channel_id):
+        is_owner = channel_has_owner_permissions(channel_id, u_id_inviter, data)
+        if not is_owner:
+            raise AccessError("Given token is not an owner of the channel")
 
-    # checking whether u_id is already an owner
-    for member in data['channels'][channel_id]['owner_members']:
-        if member['u_id'] == u_id:
+        # checking whether u_id is already an owner
+        if data.is_owner(channel_id, u_id):
             raise InputError('User is already an owner of this channel')
 
-    # catching invalid u_id
-    if not valid_user_id(u_id, data):
-        raise InputError("Invalid user ID entered")
+        # catching invalid u_id
+        if not valid_user_id(u_id, data):
+            raise InputError("Invalid user ID entered")
 
-    # checking if u_id is a member of the channel with helper_function
-    is_member = channel_is_member(channel_id, u_id, data)
-    if not is_member:
-        raise InputError("User is not a member of this channel")
-
-    # creating owner_detail dict and adding it into channel "owner_members" data
-    owner_detail = {
-        'u_id': u_id,
-        'name_first': data['users'][u_id]['name_first'],
-        'name_last': data['users'][u_id]['name_last']
-    }
-    if 'profile_img_url' in data['users'][u_id]:
-        owner_detail['profile_img_url'] = data['users'][u_id]['profile_img_url']
-    data['channels'][channel_id]['owner_members'].append(owner_detail)
+        # checking if u_id is a member of the channel with helper_function
+        is_member = channel_is_member(channel_id, u_id, data)
+        if not is_member:
+            raise InputError("User is not a member of this channel")
+
+        # adding u_id as an owner of the channel
+        data.add_owner(channel_id, u_id)
 
     return {
     }
@@ -280,31 +279,21 @@ def channel_removeowner(token, channel_id, u_id):
     u_id_inviter = u_id_finder(token, data)
 
     # checking if user has owner permissions on this channel
-    is_owner = channel_has_owner_permissions(channel_id, u_id_inviter, data)
-    if not is_owner:
-        raise AccessError("Given token is not an owner of the channel")
+    with data.channel_lock(channel_id):
+        is_owner = channel_has_owner_permissions(channel_id, u_id_inviter, data)
+        if not is_owner:
+            raise AccessError("Given token is not an owner of the channel")
 
-    # catching invalid u_id
-    if not valid_user_id(u_id, data):
-        raise InputError("Invalid user ID entered")
+        # catching invalid u_id
+        if not valid_user_id(u_id, data):
+            raise InputError("Invalid user ID entered")
 
-    # catching InputError
-    is_owner = False
-    for member in data['channels'][channel_id]['owner_members']:
-        if member['u_id'] == u_id:
-            is_owner = True
-    if not is_owner:
-        raise InputError('User is not an owner of this channel')
-
-    # creating owner_detail dict and removing it from channel 'owner_members' data
-    owner_detail = {
-        'u_id': u_id,
-        'name_first': data['users'][u_id]['name_first'],
-        'name_last': data['users'][u_id]['name_last']
-    }
-    if 'profile_img_url' in data['users'][u_id]:
-        owner_detail['profile_img_url'] = data['users'][u_id]['profile_img_url']
-    data['channels'][channel_id]['owner_members'].remove(owner_detail)
+        # catching InputError
+        if not data.is_owner(channel_id, u_id):
+            raise InputError('User is not an owner of this channel')
+
+        # removing u_id as an owner of the channel
+        data.remove_owner(channel_id, u_id)
 
     return {
 
@@ -582,6 +582,45 @@ def test_channel_messages_http_more_50(url):
         assert message_dict['message_id'] == expected_id
         expected_id -= 1
 
+def test_channel_messages_http_before_message_id(url):
+    '''
+    function is used as intended to load older messages with before_message_id
+    this test requires implementation of message_send function
+    '''
+    requests.delete(f'{url}/clear')
+    response = requests.post(f'{url}/auth/register', json={
+        'email': 'ankitrai326@gmail.com',
+        'password': '12345678',
+        'name_first': 'tom',
+        'name_last': 'hardy'
+    })
+    user = response.json()
+
+    response = requests.post(f'{url}/channels/create', json={
+        'token': user['token'],
+        'name': 'channel',
+        'is_public': True
+    })
+    channel = response.json()
+
+    for i in range(0, 60):
+        # sends 60 messages
+        response = requests.post(f'{url}/message/send', json={
+            'token': user['token'],
+            'channel_id': channel['channel_id'],
+            'message': str(i)
+        })
+
+    in_url = f"{url}/channel/messages?token={user['token']}&"
+    in_url2 = f"channel_id={channel['channel_id']}&before_message_id=11"
+    response = requests.get(in_url + in_url2)
+    messages = response.json()
+
+    assert messages['start'] == 11
+    assert messages['end'] == -1
+    assert [message_dict['message_id'] for message_dict in messages['messages']] == \
+        list(range(10, 0, -1))
+
 # tests for channel_addowner
 
 def test_channel_addowner_http_invalid_channel_id(url):
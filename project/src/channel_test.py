@@ -243,6 +243,112 @@ def test_channel_messages_more_50():
         assert message_dict['message_id'] == expected_id
         expected_id -= 1
 
+def test_channel_messages_all_pages():
+    '''
+    function is used as intended to load every page of a channel, each
+    message is returned exactly once and in the right order
+    this test requires implementation of message_send function
+    '''
+    clear()
+    user = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    channel = channels_create(user['token'], 'channel', True)
+
+    for i in range(0, 120):
+        # sends 120 messages
+        message_send(user['token'], channel['channel_id'], str(i))
+
+    message_ids = []
+    start = 0
+    while start != -1:
+        messages = channel_messages(user['token'], channel['channel_id'], start)
+        assert messages['start'] == start
+        assert len(messages['messages']) <= 50
+        message_ids += [message_dict['message_id'] for message_dict in messages['messages']]
+        start = messages['end']
+
+    assert message_ids == list(range(120, 0, -1))
+
+def test_channel_messages_before_message_id():
+    '''
+    function is used as intended to load older messages with
+    before_message_id, messages sent in between do not change the pages
+    this test requires implementation of message_send function
+    '''
+    clear()
+    user = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    channel = channels_create(user['token'], 'channel', True)
+
+    for i in range(0, 120):
+        # sends 120 messages
+        message_send(user['token'], channel['channel_id'], str(i))
+
+    messages = channel_messages(user['token'], channel['channel_id'], 0)
+    message_ids = [message_dict['message_id'] for message_dict in messages['messages']]
+    cursor = message_ids[-1]
+    while cursor != -1:
+        # new messages sent while loading older messages
+        message_send(user['token'], channel['channel_id'], "new message")
+        messages = channel_messages(user['token'], channel['channel_id'], 0,
+                                    before_message_id=cursor)
+        assert messages['start'] == cursor
+        message_ids += [message_dict['message_id'] for message_dict in messages['messages']]
+        cursor = messages['end']
+
+    assert message_ids == list(range(120, 0, -1))
+
+def test_channel_messages_after_message_id():
+    '''
+    function is used as intended to load newer messages with after_message_id
+    this test requires implementation of message_send function
+    '''
+    clear()
+    user = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    channel = channels_create(user['token'], 'channel', True)
+    last_seen = message_send(user['token'], channel['channel_id'], "seen")
+
+    messages = channel_messages(user['token'], channel['channel_id'], 0,
+                                after_message_id=last_seen['message_id'])
+    assert messages['messages'] == []
+    assert messages['end'] == -1
+
+    for i in range(0, 70):
+        # sends 70 messages
+        message_send(user['token'], channel['channel_id'], str(i))
+
+    messages = channel_messages(user['token'], channel['channel_id'], 0,
+                                after_message_id=last_seen['message_id'])
+    assert [message_dict['message'] for message_dict in messages['messages']] == \
+        [str(i) for i in range(49, -1, -1)]
+    assert messages['end'] == messages['messages'][0]['message_id']
+
+    messages = channel_messages(user['token'], channel['channel_id'], 0,
+                                after_message_id=messages['end'])
+    assert [message_dict['message'] for message_dict in messages['messages']] == \
+        [str(i) for i in range(69, 49, -1)]
+    assert messages['end'] == -1
+
+def test_channel_messages_invalid_cursor():
+    '''
+    given a message_id that is not in the channel, or both before_message_id
+    and after_message_id, should raise InputError
+    '''
+    clear()
+    user = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    channel1 = channels_create(user['token'], 'channel', True)
+    channel2 = channels_create(user['token'], 'channel2', True)
+    message1 = message_send(user['token'], channel1['channel_id'], "hello")
+    message2 = message_send(user['token'], channel1['channel_id'], "world")
+    with pytest.raises(InputError):
+        assert channel_messages(user['token'], channel2['channel_id'], 0,
+                                before_message_id=message1['message_id'])
+    with pytest.raises(InputError):
+        assert channel_messages(user['token'], channel1['channel_id'], 0,
+                                before_message_id=12345)
+    with pytest.raises(InputError):
+        assert channel_messages(user['token'], channel1['channel_id'], 0,
+                                before_message_id=message2['message_id'],
+                                after_message_id=message1['message_id'])
+
 # tests for channel_addowner
 
 def test_channel_addowner_invalid_channel_id():
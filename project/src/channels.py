@@ -1,6 +1,6 @@
 '''no other external modules were used'''
 from data import data
-from error import InputError, AccessError
+from error import InputError
 from helper_functions import u_id_finder
 
 def channels_list(token):
@@ -9,16 +9,9 @@ def channels_list(token):
     authorised user is part of
     Returns a list of channels
     '''
-    is_part_of = []
-    for user in data['users']:
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                u_id = user
-                is_part_of = data['users'][user]['channel_membership']
-    try:
-        data['users'][u_id]
-    except:
-        raise AccessError("Invalid token entered")
+    # using helper function to find u_id from token, raises AccessError if token is invalid
+    u_id = u_id_finder(token, data)
+    is_part_of = data.user_channels(u_id)
 
     return {
         'channels': is_part_of
@@ -33,11 +26,11 @@ def channels_listall(token):
     u_id_finder(token, data)
 
     all_channels = []
-    for channels in data['channels']:
+    for channels in data.all_channels():
         channel_data = {}
         #extract name and channel id for each channels_list
-        channel_data['channel_id'] = data['channels'][channels]['channel_id']
-        channel_data['name'] = data['channels'][channels]['name']
+        channel_data['channel_id'] = channels['channel_id']
+        channel_data['name'] = channels['name']
         all_channels.append(channel_data)
 
     return {
@@ -50,7 +43,6 @@ def channels_create(token, name, is_public):
     channel
     returns a channel_id (integer)
     '''
-    channel_id = len(data["channels"]) + 1
     # raising InputError
     if len(name) == 0:
         raise InputError("Channel name cannot be empty")
@@ -60,33 +52,22 @@ def channels_create(token, name, is_public):
     # using helper function to find u_id from token, raises InputError if token is invalid
     u_id = u_id_finder(token, data)
 
-    # creating channel dict for data
-    data["channels"][channel_id] = {
-        "name": name,
-        "creator": token,
-        "is_public": is_public,
-        "channel_id": channel_id,
-        "owner_members": [],
-        "all_members": [],
-        "messages": [],
-    }
+    # the channel_id is given out and used with the lock held, so two
+    # channels created at once do not get the same one
+    with data.channels_lock:
+        channel_id = data.channel_count() + 1
+        # creating channel dict for data
+        data.add_channel({
+            "name": name,
+            "creator": u_id,
+            "is_public": is_public,
+            "channel_id": channel_id
+        })
 
-    owner_detail = {
-        'u_id': u_id,
-        'name_first': data['users'][u_id]['name_first'],
-        'name_last': data['users'][u_id]['name_last']
-    }
-    if 'profile_img_url' in data['users'][u_id]:
-        owner_detail['profile_img_url'] = data['users'][u_id]['profile_img_url']
-    # adds channel creator as a member
-    data['channels'][channel_id]['all_members'].append(owner_detail)
-    channel_detail = {
-        'channel_id': channel_id,
-        'name': data['channels'][channel_id]['name']
-    }
-    data['users'][u_id]['channel_membership'].append(channel_detail)
-    # adds channel creator as an owner
-    data['channels'][channel_id]['owner_members'].append(owner_detail)
+        # adds channel creator as a member
+        data.add_member(channel_id, u_id)
+        # adds channel creator as an owner
+        data.add_owner(channel_id, u_id)
 
     return {
         "channel_id": channel_id
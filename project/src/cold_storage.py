@@ -0,0 +1,514 @@
+'''
+Storage backend that keeps only the most recent messages of each channel in
+memory, moving older ones into immutable segment files read through mmap
+array module provides the columns of a segment file as they are written
+bisect module provides binary search for finding a message in the columns
+or segments of its channel, and the segment a position of a channel is in
+mmap module maps segment files into memory, so their pages are read from disk
+when they are used and can be dropped by the operating system again
+logging module reports segment files that cannot be written
+os module provides fsync, the rename that puts a segment file in place in one
+step, and the removal of segment files no longer used
+re module is used to find the segment files and the name parts of each
+struct module provides the header of a segment file
+threading module provides the thread a new segment file is written on
+'''
+from array import array
+from bisect import bisect_left, bisect_right
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+from storage import IndexedStorage
+from records import MessageRecord
+from columnar_storage import MessageColumns, TEXT_ERRORS, find_positions
+from helper_functions import query_terms, message_has_terms
+
+# each channel keeps at least this many of its most recent messages in
+# memory, once it has SEGMENT_MESSAGES more than that the oldest
+# SEGMENT_MESSAGES of them are moved into a new segment file
+HOT_MESSAGES = 5000
+SEGMENT_MESSAGES = 5000
+
+# segment files are named {channel_id}.{first seq}.{generation}.seg, the
+# generation goes up each time a message in the segment is changed, as the
+# segment is then written again into a new file
+SEGMENT_FILE = re.compile(r'^(\d+)\.(\d+)\.(\d+)\.seg$')
+SEGMENT_MAGIC = b'FLOCKSEG'
+SEGMENT_HEADER = struct.Struct('<8sq')
+
+LOGGER = logging.getLogger(__name__)
+
+class Segment:
+    '''
+    An immutable file of messages of one channel (oldest first), mapped into
+    memory. After the header (SEGMENT_MAGIC and the number of messages, count)
+    it has, in native byte order:
+
+    - the columns message_ids, u_ids, seqs (8 byte integers) and times
+      (8 byte floats), with count values each
+    - text_starts and folded_starts, count + 1 integers each, where the text
+      of the message at position i is text[text_starts[i]:text_starts[i + 1]]
+      (utf-8), and the same for the lowercase text in folded
+    - is_pinned, count bytes padded to a multiple of 8
+    - the text and folded arenas
+
+    Only the path is pickled (in snapshots), the file is mapped again when it
+    is loaded.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.open()
+
+    def open(self):
+        '''Maps the file into memory and makes a view of each column'''
+        with open(self.path, 'rb') as segment_file:
+            self.map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = SEGMENT_HEADER.unpack_from(self.map)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f'{self.path} is not a segment file')
+        self.count = count
+        view = memoryview(self.map)
+        offset = SEGMENT_HEADER.size
+
+        def column(type_code, length):
+            nonlocal offset
+            values = view[offset:offset + 8 * length].cast(type_code)
+            offset += 8 * length
+            return values
+
+        self.message_ids = column('q', count)
+        self.u_ids = column('q', count)
+        self.seqs = column('q', count)
+        self.times = column('d', count)
+        self.text_starts = column('q', count + 1)
+        self.folded_starts = column('q', count + 1)
+        self.is_pinned = view[offset:offset + count]
+        self.text_offset = offset + padded(count)
+        self.folded_offset = self.text_offset + self.text_starts[count]
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.open()
+
+    def __len__(self):
+        return self.count
+
+    def message_text(self, position):
+        '''Returns the text of the message at position'''
+        start = self.text_offset + self.text_starts[position]
+        end = self.text_offset + self.text_starts[position + 1]
+        return self.map[start:end].decode('utf-8', TEXT_ERRORS)
+
+    def record(self, position, reacts, text=None):
+        '''
+        Returns the message at position as a MessageRecord, reacts is the
+        reacts of the channel's messages that have any (MessageColumns.reacts)
+        and text is its text if it has already been read
+        '''
+        message_id = self.message_ids[position]
+        return MessageRecord({
+            'message_id': message_id,
+            'u_id': self.u_ids[position],
+            'message': self.message_text(position) if text is None else text,
+            'time_created': self.times[position],
+            'reacts': reacts.get(message_id, {}),
+            'is_pinned': bool(self.is_pinned[position])
+        })
+
+    def messages(self):
+        '''Returns every message as a dictionary (with its seq, without its reacts)'''
+        return [{
+            'message_id': self.message_ids[position],
+            'u_id': self.u_ids[position],
+            'seq': self.seqs[position],
+            'time_created': self.times[position],
+            'is_pinned': bool(self.is_pinned[position]),
+            'message': self.message_text(position)
+        } for position in range(self.count)]
+
+    def positions_containing(self, needle):
+        '''See MessageColumns.positions_containing'''
+        return find_positions(self.map, self.folded_starts, self.count, needle,
+                              self.folded_offset)
+
+def padded(length):
+    '''Returns length rounded up to a multiple of 8'''
+    return (length + 7) // 8 * 8
+
+def write_segment(path, messages):
+    '''
+    Writes messages (dictionaries from MessageColumns.oldest, oldest
+    first) into a temporary file, renames it to path and returns it as a
+    Segment
+    '''
+    count = len(messages)
+    text = bytearray()
+    folded = bytearray()
+    text_starts = array('q', [0])
+    folded_starts = array('q', [0])
+    for message in messages:
+        text += message['message'].encode('utf-8', TEXT_ERRORS)
+        folded += message['message'].lower().encode('utf-8', TEXT_ERRORS)
+        text_starts.append(len(text))
+        folded_starts.append(len(folded))
+    is_pinned = bytes(bool(message['is_pinned']) for message in messages)
+
+    with open(path + '.tmp', 'wb') as segment_file:
+        segment_file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, count))
+        for values in (array('q', (message['message_id'] for message in messages)),
+                       array('q', (message['u_id'] for message in messages)),
+                       array('q', (message['seq'] for message in messages)),
+                       array('d', (message['time_created'] for message in messages)),
+                       text_starts, folded_starts):
+            segment_file.write(values.tobytes())
+        segment_file.write(is_pinned.ljust(padded(count), b'\0'))
+        segment_file.write(text)
+        segment_file.write(folded)
+        segment_file.flush()
+        os.fsync(segment_file.fileno())
+    os.replace(path + '.tmp', path)
+    return Segment(path)
+
+def write_segment_job(job, messages):
+    '''Runs on a thread of its own, writing messages into the segment file of job'''
+    try:
+        job['segment'] = write_segment(job['path'], messages)
+    except Exception: # pylint: disable=broad-except
+        LOGGER.exception('segment %s could not be written', job['path'])
+
+class ColdStorage(IndexedStorage):
+    '''
+    IndexedStorage (users, channels and pending messages are indexed the same
+    way) with the HOT_MESSAGES or so most recent messages of each channel in
+    MessageColumns, and the older ones in Segments in directory, so the
+    memory used, and the size of a snapshot, do not grow with the history of
+    the channels. The messages of a channel are its segments (oldest first)
+    followed by its columns.
+
+    - self.data['segments'][channel_id] is the list of Segments of the channel
+    - self.data['message_channels'][message_id] is the channel_id of the
+      message (or -1) and self.data['message_seqs'][message_id] is its seq,
+      as in ColumnarStorage, so a message is found in the columns or its
+      channel's segments by binary searches over their seqs
+    - the oldest messages of a channel are written into a new segment file
+      on another thread (self.segment_writes[channel_id]), so a request
+      adding a message does not wait for the file. They stay in the columns
+      until a later change puts the segment in their place, or writes it
+      again if one of them has changed since.
+    - the reacts of every message of a channel are in its columns' reacts, as
+      they change too often to be in a segment. A change to a message in a
+      segment writes the segment again into a new file (messages that old are
+      seldom changed).
+    - there is no search index, searches look through the lowercase text of
+      each segment and the columns with find and check each match
+
+    Segment files no longer used are removed straight away, or once
+    release_files is called if it has been (by data_log, once no snapshot
+    needs them).
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.release_deferred = False
+        self.segment_writes = {}
+        os.makedirs(directory, exist_ok=True)
+        super().__init__()
+
+    def clear(self):
+        '''See Storage.clear, the segment files are no longer used'''
+        unused = self.files() if getattr(self, 'data', None) else set()
+        self.discard_segment_writes()
+        super().clear()
+        self.data['segments'] = {}
+        self.data['message_channels'] = array('q')
+        self.data['message_seqs'] = array('q')
+        self.retire(unused)
+
+    def load_state(self, state):
+        '''See DictStorage.load_state'''
+        self.discard_segment_writes()
+        super().load_state(state)
+
+    def files(self):
+        '''See DictStorage.files, the segment files of every channel'''
+        return {segment.path for segments in self.data['segments'].values()
+                for segment in segments}
+
+    def release_files(self, keep):
+        '''See DictStorage.release_files, the unused segment files in directory are removed'''
+        self.release_deferred = True
+        used = self.files() | set(keep)
+        used.update(job['path'] for job in self.segment_writes.values())
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            if SEGMENT_FILE.match(file_name) and path not in used:
+                os.remove(path)
+
+    def retire(self, paths):
+        '''Removes the segment files in paths, unless release_files is to remove them'''
+        if self.release_deferred:
+            return
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def segment_path(self, channel_id, first_seq, generation):
+        '''Returns the path of a segment file'''
+        return os.path.join(self.directory, f'{channel_id}.{first_seq}.{generation}.seg')
+
+    def add_channel(self, channel):
+        '''See Storage.add_channel'''
+        super().add_channel(channel)
+        self.data['channels'][channel['channel_id']].messages = MessageColumns()
+        self.data['segments'][channel['channel_id']] = []
+
+    # segment files written on another thread
+    def start_segment_write(self, channel_id):
+        '''
+        Starts writing the oldest SEGMENT_MESSAGES messages of the channel
+        into a new segment file on another thread
+        '''
+        messages = self.data['channels'][channel_id].messages.oldest(SEGMENT_MESSAGES)
+        job = {
+            'path': self.segment_path(channel_id, messages[0]['seq'], 0),
+            'count': len(messages),
+            'changed': False,
+            'segment': None
+        }
+        job['thread'] = threading.Thread(target=write_segment_job, args=(job, messages),
+                                         daemon=True)
+        job['thread'].start()
+        self.segment_writes[channel_id] = job
+
+    def finish_segment_write(self, channel_id, wait=False):
+        '''
+        Once the segment file being written for the channel is done (or
+        after waiting for it) puts it in place of the messages it has, or
+        removes it if one of them has changed since
+        '''
+        job = self.segment_writes.get(channel_id)
+        if job is None:
+            return
+        if wait:
+            job['thread'].join()
+        if job['thread'].is_alive():
+            return
+        del self.segment_writes[channel_id]
+        if job['segment'] is None or job['changed']:
+            # the messages are written again by a later add_message
+            if os.path.exists(job['path']):
+                os.remove(job['path'])
+            return
+        self.data['channels'][channel_id].messages.remove_oldest(job['count'])
+        self.data['segments'][channel_id].append(job['segment'])
+
+    def finish_segment_writes(self):
+        '''Waits for the segment files being written, and puts them in place'''
+        for channel_id in list(self.segment_writes):
+            self.finish_segment_write(channel_id, wait=True)
+
+    def discard_segment_writes(self):
+        '''Waits for the segment files being written, and removes them'''
+        for job in self.segment_writes.values():
+            job['changed'] = True
+        self.finish_segment_writes()
+
+    def note_change(self, channel_id, position):
+        '''
+        Used when the message at position of the channel's columns is changed
+        or removed, so a segment file being written with it is not used
+        '''
+        job = self.segment_writes.get(channel_id)
+        if job is not None and position < job['count']:
+            job['changed'] = True
+
+    # messages
+    def add_message(self, channel_id, message):
+        '''
+        See Storage.add_message, the oldest messages move to a segment once
+        there are enough. Only if the segment file before has not been
+        written by the time there are enough again is it waited for.
+        '''
+        columns = self.data['channels'][channel_id].messages
+        seq = columns.append(message)
+        message_channels = self.data['message_channels']
+        message_id = message['message_id']
+        if message_id >= len(message_channels):
+            missing = message_id + 1 - len(message_channels)
+            message_channels.extend(array('q', [-1]) * missing)
+            self.data['message_seqs'].extend(array('q', [0]) * missing)
+        message_channels[message_id] = channel_id
+        self.data['message_seqs'][message_id] = seq
+
+        self.finish_segment_write(channel_id,
+                                  wait=len(columns) >= HOT_MESSAGES + 2 * SEGMENT_MESSAGES)
+        if channel_id not in self.segment_writes and \
+                len(columns) >= HOT_MESSAGES + SEGMENT_MESSAGES:
+            self.start_segment_write(channel_id)
+
+    def find_message(self, message_id):
+        '''
+        Returns (channel_id, segment index, position) of the message with
+        message_id, where segment index is None for a message in the
+        columns, or None if there is no such message
+        '''
+        channel_id = self.message_channel(message_id)
+        if channel_id is None:
+            return None
+        seq = self.data['message_seqs'][message_id]
+        columns = self.data['channels'][channel_id].messages
+        if columns.seqs and seq >= columns.seqs[0]:
+            return channel_id, None, bisect_left(columns.seqs, seq)
+        # the message is in the last segment starting at or before its seq
+        segments = self.data['segments'][channel_id]
+        index = bisect_right([segment.seqs[0] for segment in segments], seq) - 1
+        return channel_id, index, bisect_left(segments[index].seqs, seq)
+
+    def message_channel(self, message_id):
+        '''See Storage.message_channel'''
+        message_channels = self.data['message_channels']
+        if not isinstance(message_id, int) or not 0 <= message_id < len(message_channels):
+            return None
+        channel_id = message_channels[message_id]
+        return None if channel_id == -1 else channel_id
+
+    def get_message(self, message_id):
+        '''See Storage.get_message'''
+        found = self.find_message(message_id)
+        if found is None:
+            return None
+        channel_id, index, position = found
+        columns = self.data['channels'][channel_id].messages
+        if index is None:
+            return columns.record(position)
+        return self.data['segments'][channel_id][index].record(position, columns.reacts)
+
+    def message_offset(self, message_id):
+        '''See DictStorage.message_offset'''
+        channel_id, index, position = self.find_message(message_id)
+        segments = self.data['segments'][channel_id]
+        before = sum(len(segment) for segment in segments[:index])
+        return self.message_count(channel_id) - 1 - before - position
+
+    def update_message(self, message_id, **changes):
+        '''See Storage.update_message'''
+        channel_id, index, position = self.find_message(message_id)
+        if index is not None:
+            self.rewrite_segment(channel_id, index, position, changes)
+            return
+        columns = self.data['channels'][channel_id].messages
+        self.note_change(channel_id, position)
+        if 'message' in changes:
+            columns.set_text(position, changes['message'])
+        if 'is_pinned' in changes:
+            columns.is_pinned[position] = bool(changes['is_pinned'])
+
+    def rewrite_segment(self, channel_id, index, position, changes=None):
+        '''
+        Writes the segment at index of the channel again with the message at
+        position changed by changes, or removed if changes is None
+        '''
+        segments = self.data['segments'][channel_id]
+        segment = segments[index]
+        messages = segment.messages()
+        if changes is None:
+            del messages[position]
+        else:
+            messages[position].update(changes)
+        if messages:
+            _, first_seq, generation = SEGMENT_FILE.match(os.path.basename(segment.path)).groups()
+            path = self.segment_path(channel_id, first_seq, int(generation) + 1)
+            segments[index] = write_segment(path, messages)
+        else:
+            del segments[index]
+        self.retire({segment.path})
+
+    def add_react(self, message_id, react_id, u_id):
+        '''See Storage.add_react'''
+        columns = self.data['channels'][self.message_channel(message_id)].messages
+        columns.reacts.setdefault(message_id, {}).setdefault(react_id, set()).add(u_id)
+
+    def remove_react(self, message_id, react_id, u_id):
+        '''See Storage.remove_react'''
+        columns = self.data['channels'][self.message_channel(message_id)].messages
+        columns.reacts.get(message_id, {}).get(react_id, set()).discard(u_id)
+
+    def remove_message(self, message_id):
+        '''See Storage.remove_message'''
+        channel_id, index, position = self.find_message(message_id)
+        columns = self.data['channels'][channel_id].messages
+        if index is None:
+            self.note_change(channel_id, position)
+            columns.remove(position)
+        else:
+            columns.reacts.pop(message_id, None)
+            self.rewrite_segment(channel_id, index, position)
+        self.data['message_channels'][message_id] = -1
+
+    def message_count(self, channel_id):
+        '''See Storage.message_count'''
+        segments = self.data['segments'][channel_id]
+        return sum(len(segment) for segment in segments) + \
+            len(self.data['channels'][channel_id].messages)
+
+    def channel_messages(self, channel_id, start, count):
+        '''See Storage.channel_messages, older pages are read from the segments'''
+        columns = self.data['channels'][channel_id].messages
+        segments = self.data['segments'][channel_id]
+        # segment_starts[i] is the position in the channel of segment i's first message
+        segment_starts = [0]
+        for segment in segments:
+            segment_starts.append(segment_starts[-1] + len(segment))
+        cold_count = segment_starts.pop()
+        newest_position = cold_count + len(columns) - start
+        oldest_position = max(newest_position - count, 0)
+        page = []
+        for position in range(newest_position - 1, oldest_position - 1, -1):
+            if position >= cold_count:
+                page.append(columns.record(position - cold_count))
+            else:
+                index = bisect_right(segment_starts, position) - 1
+                page.append(segments[index].record(position - segment_starts[index],
+                                                   columns.reacts))
+        return page
+
+    def search_messages(self, query_str, channel_ids, substring=False):
+        '''
+        See Storage.search_messages, the lowercase text of each segment and of
+        the columns of each channel is looked through for query_str (or the
+        longest query term) and each message it is found in is checked
+        '''
+        terms = query_terms(query_str)
+        query_str = query_str.lower()
+        if substring:
+            needle = query_str
+        else:
+            needle = max((term.rstrip('*') for term in terms), key=len, default='')
+        if not needle:
+            return
+        for channel_id in channel_ids:
+            channel = self.data['channels'].get(channel_id)
+            if channel is None:
+                continue
+            columns = channel.messages
+            for segment in self.data['segments'][channel_id]:
+                for position in segment.positions_containing(needle):
+                    text = segment.message_text(position)
+                    if substring and query_str in text.lower() or \
+                            not substring and message_has_terms(text, terms):
+                        yield segment.record(position, columns.reacts, text)
+            for position in columns.positions_containing(needle):
+                text = columns.message_text(position)
+                if substring and query_str in text.lower() or \
+                        not substring and message_has_terms(text, terms):
+                    yield columns.record(position, text)
+
+    def use_trigram_index(self, enabled):
+        '''See Storage.use_trigram_index, there is no trigram index here'''
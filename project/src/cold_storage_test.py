@@ -0,0 +1,173 @@
+'''Importing the storage backends to test cold_storage.py'''
+import os
+import threading
+import pytest
+import cold_storage
+from cold_storage import ColdStorage
+from data_log import LoggedStorage
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    '''Keeps 3 messages of each channel in memory and moves them 2 at a time to segments'''
+    monkeypatch.setattr(cold_storage, 'HOT_MESSAGES', 3)
+    monkeypatch.setattr(cold_storage, 'SEGMENT_MESSAGES', 2)
+
+def new_storage(directory):
+    '''Returns a storage with segments in directory, with a user in a channel'''
+    storage = ColdStorage(str(directory))
+    add_channel(storage)
+    return storage
+
+def add_channel(storage):
+    '''Adds a user and a channel they are in to storage'''
+    storage.add_user({
+        'u_id': 1,
+        'email': 'bruce@gmail.com',
+        'password': 'password1234',
+        'name_first': 'bruce',
+        'name_last': 'lee',
+        'handle_str': 'brucelee',
+        'permission_id': 1
+    })
+    storage.add_channel({'channel_id': 1, 'name': 'channel_one', 'creator': 1, 'is_public': True})
+    storage.add_member(1, 1)
+
+def add_messages(storage, count, first=1, channel_id=1, wait=True):
+    '''
+    Adds count messages 'message 1', 'message 2', ... with message_ids from
+    first to a channel, then waits for the segment files being written
+    '''
+    for message_id in range(first, first + count):
+        storage.add_message(channel_id, {
+            'message_id': message_id,
+            'u_id': 1,
+            'message': f'message {message_id}',
+            'time_created': 1600000000.0 + message_id,
+            'reacts': {},
+            'is_pinned': False
+        })
+    if wait:
+        storage.finish_segment_writes()
+
+def page_ids(storage, start=0, count=50):
+    '''Returns the message_ids of a page of the channel's messages'''
+    return [message['message_id'] for message in storage.channel_messages(1, start, count)]
+
+def search(storage, query_str, substring=False):
+    '''Returns the sorted message_ids of the messages found by a search'''
+    return sorted(message['message_id']
+                  for message in storage.search_messages(query_str, {1}, substring))
+
+def segment_files(directory):
+    '''Returns the names of the segment files in directory'''
+    return sorted(name for name in os.listdir(directory) if name.endswith('.seg'))
+
+def test_cold_segments(tmp_path):
+    '''Older messages move to segment files and are read like the ones in memory'''
+    storage = new_storage(tmp_path)
+    add_messages(storage, 9)
+    # 9 messages keep 3 in memory, the 6 before them are in 3 segments
+    assert len(storage.data['segments'][1]) == 3
+    assert len(segment_files(tmp_path)) == 3
+    assert list(storage.data['channels'][1].messages.message_ids) == [7, 8, 9]
+
+    assert storage.message_count(1) == 9
+    assert page_ids(storage) == list(range(9, 0, -1))
+    assert page_ids(storage, 2, 4) == [7, 6, 5, 4]
+    assert storage.get_message(2)['message'] == 'message 2'
+    assert storage.get_message(2)['time_created'] == 1600000002.0
+    assert storage.get_message(10) is None
+    assert storage.message_channel(3) == 1
+    assert storage.message_offset(1) == 8
+    assert search(storage, 'message') == list(range(1, 10))
+    assert search(storage, 'ge 2', True) == [2]
+
+def test_cold_changes(tmp_path):
+    '''Messages in segments can still be edited, pinned, reacted to and removed'''
+    storage = new_storage(tmp_path)
+    add_messages(storage, 9)
+    storage.update_message(2, message='edited', is_pinned=True)
+    storage.add_react(3, 1, 1)
+    assert storage.get_message(2)['message'] == 'edited'
+    assert storage.get_message(2)['is_pinned']
+    assert storage.get_message(3)['reacts'] == {1: {1}}
+    assert search(storage, 'edited') == [2]
+    assert search(storage, 'message 2') == []
+    # the segment was written again, and the old file removed
+    assert len(segment_files(tmp_path)) == 3
+
+    storage.remove_message(3)
+    storage.remove_message(4)
+    assert storage.get_message(3) is None
+    assert page_ids(storage) == [9, 8, 7, 6, 5, 2, 1]
+    assert storage.message_offset(2) == 5
+    assert len(storage.data['segments'][1]) == 2
+
+    storage.clear()
+    assert segment_files(tmp_path) == []
+
+def test_cold_find_message(tmp_path):
+    '''Messages are found in the columns or segments of their channel only'''
+    storage = new_storage(tmp_path)
+    storage.add_channel({'channel_id': 2, 'name': 'channel_two', 'creator': 1, 'is_public': True})
+    add_messages(storage, 9)
+    add_messages(storage, 10, 10, channel_id=2)
+    assert [storage.message_channel(message_id) for message_id in (1, 9, 10, 19)] == [1, 1, 2, 2]
+    assert storage.get_message(12)['message'] == 'message 12'
+    assert storage.message_offset(10) == 9
+    for message_id in (0, 20, 1000, -1, None, 'x'):
+        assert storage.message_channel(message_id) is None
+        assert storage.get_message(message_id) is None
+    storage.remove_message(3)
+    assert storage.get_message(3) is None
+    assert storage.get_message(4)['message'] == 'message 4'
+
+def test_cold_background_write(tmp_path, monkeypatch):
+    '''A new segment file is written without holding up add_message, and not used if changed'''
+    written = threading.Event()
+    write_segment = cold_storage.write_segment
+
+    def slow_write_segment(path, messages):
+        written.wait(5)
+        return write_segment(path, messages)
+
+    monkeypatch.setattr(cold_storage, 'write_segment', slow_write_segment)
+    storage = new_storage(tmp_path)
+    add_messages(storage, 5, wait=False)
+    # messages 1 and 2 are being written, and are still read from the columns
+    assert storage.segment_writes
+    assert page_ids(storage) == [5, 4, 3, 2, 1]
+    storage.update_message(1, message='edited')
+    written.set()
+    storage.finish_segment_writes()
+    # the segment file had the text from before the edit, so it is not used
+    assert storage.data['segments'][1] == []
+    assert segment_files(tmp_path) == []
+
+    add_messages(storage, 1, 6)
+    assert len(storage.data['segments'][1]) == 1
+    assert storage.get_message(1)['message'] == 'edited'
+    assert page_ids(storage) == [6, 5, 4, 3, 2, 1]
+
+def test_cold_restart(tmp_path):
+    '''Segments are kept through a snapshot and log, and removed once no snapshot needs them'''
+    log_directory = str(tmp_path / 'log')
+    segment_directory = tmp_path / 'segments'
+    storage = LoggedStorage(ColdStorage(str(segment_directory)))
+    storage.open_log(log_directory)
+    add_channel(storage)
+    add_messages(storage, 7)
+    storage.snapshot()
+    storage.update_message(1, message='edited')
+    # the file of the segment before the edit is kept for the snapshot
+    assert len(segment_files(segment_directory)) == 3
+    storage.close_log()
+
+    restarted = LoggedStorage(ColdStorage(str(segment_directory)))
+    assert restarted.open_log(log_directory) == 1
+    assert page_ids(restarted) == list(range(7, 0, -1))
+    assert restarted.get_message(1)['message'] == 'edited'
+    assert len(segment_files(segment_directory)) == 3
+    restarted.snapshot()
+    assert len(segment_files(segment_directory)) == 2
+    restarted.close_log()
@@ -0,0 +1,357 @@
+'''
+Storage backend for very large channels, keeping the messages of each channel
+in columns instead of one record per message
+array module provides the typed columns (8 bytes a value, with no object per
+value)
+bisect module provides binary search for finding a message in its channel and
+the message a search match is in
+'''
+from array import array
+from bisect import bisect_left, bisect_right
+from storage import IndexedStorage
+from records import MessageRecord
+from helper_functions import query_terms, message_has_terms
+
+# message text may have lone surrogates (JSON allows them), which are kept as
+# they are in the text arenas
+TEXT_ERRORS = 'surrogatepass'
+
+class MessageColumns:
+    '''
+    The messages of one channel, oldest first. Position i of each column is
+    the message at position i of the channel:
+
+    - message_ids, u_ids, seqs (the order the messages were added in, as in
+      IndexedStorage) and times are arrays, is_pinned is a bytearray
+    - text is every message's text (utf-8) one after another and
+      text_starts/text_ends are where each message's text is in it. folded is
+      the same for the lowercase text, in the order of the messages, with
+      folded_starts, so searches look through it with bytes.find instead of
+      one message at a time
+    - edited is the lowercase text of edited messages, in the order they were
+      edited, with edited_starts and edited_seqs (the seq of the message each
+      is the text of). An edited message's text in folded is left where it is
+      (so folded stays in order), and is only checked by searches like any
+      other match.
+    - reacts[message_id] is the reacts of the messages that have any
+    - garbage is the number of bytes of text no longer used by any message,
+      compact writes the arenas again without it
+
+    Only the methods that change the messages change the columns, so any
+    number of searches can read them at once.
+    '''
+    __slots__ = ('message_ids', 'u_ids', 'seqs', 'times', 'is_pinned', 'text', 'text_starts',
+                 'text_ends', 'folded', 'folded_starts', 'edited', 'edited_starts',
+                 'edited_seqs', 'reacts', 'last_seq', 'garbage')
+
+    def __init__(self):
+        self.message_ids = array('q')
+        self.u_ids = array('q')
+        self.seqs = array('q')
+        self.times = array('d')
+        self.is_pinned = bytearray()
+        self.text = bytearray()
+        self.text_starts = array('q')
+        self.text_ends = array('q')
+        self.folded = bytearray()
+        self.folded_starts = array('q')
+        self.edited = bytearray()
+        self.edited_starts = array('q')
+        self.edited_seqs = array('q')
+        self.reacts = {}
+        self.last_seq = 0
+        self.garbage = 0
+
+    def __len__(self):
+        return len(self.message_ids)
+
+    def append_text(self, text):
+        '''
+        Adds text at the end of the arenas, returns where it is as
+        (text_start, text_end, folded_start)
+        '''
+        text_start = len(self.text)
+        self.text += text.encode('utf-8', TEXT_ERRORS)
+        folded_start = len(self.folded)
+        self.folded += text.lower().encode('utf-8', TEXT_ERRORS)
+        return text_start, len(self.text), folded_start
+
+    def append(self, message):
+        '''Adds message as the most recent message, returns its seq'''
+        self.last_seq += 1
+        text_start, text_end, folded_start = self.append_text(message['message'])
+        self.message_ids.append(message['message_id'])
+        self.u_ids.append(message['u_id'])
+        self.seqs.append(self.last_seq)
+        self.times.append(message['time_created'])
+        self.is_pinned.append(bool(message['is_pinned']))
+        self.text_starts.append(text_start)
+        self.text_ends.append(text_end)
+        self.folded_starts.append(folded_start)
+        if message['reacts']:
+            self.reacts[message['message_id']] = {
+                react_id: set(u_ids) for react_id, u_ids in message['reacts'].items()
+            }
+        return self.last_seq
+
+    def message_text(self, position):
+        '''Returns the text of the message at position'''
+        text = self.text[self.text_starts[position]:self.text_ends[position]]
+        return text.decode('utf-8', TEXT_ERRORS)
+
+    def record(self, position, text=None):
+        '''
+        Returns the message at position as a MessageRecord, text is its text
+        if it has already been read
+        '''
+        message_id = self.message_ids[position]
+        return MessageRecord({
+            'message_id': message_id,
+            'u_id': self.u_ids[position],
+            'message': self.message_text(position) if text is None else text,
+            'time_created': self.times[position],
+            'reacts': self.reacts.get(message_id, {}),
+            'is_pinned': bool(self.is_pinned[position])
+        })
+
+    def set_text(self, position, text):
+        '''
+        Changes the text of the message at position, the new text goes at the
+        end of text and its lowercase text at the end of edited
+        '''
+        self.garbage += self.text_ends[position] - self.text_starts[position]
+        self.text_starts[position] = len(self.text)
+        self.text += text.encode('utf-8', TEXT_ERRORS)
+        self.text_ends[position] = len(self.text)
+        self.edited_starts.append(len(self.edited))
+        self.edited_seqs.append(self.seqs[position])
+        self.edited += text.lower().encode('utf-8', TEXT_ERRORS)
+        self.compact_if_wasteful()
+
+    def remove(self, position):
+        '''Removes the message at position'''
+        self.garbage += self.text_ends[position] - self.text_starts[position]
+        self.reacts.pop(self.message_ids[position], None)
+        for column in (self.message_ids, self.u_ids, self.seqs, self.times, self.is_pinned,
+                       self.text_starts, self.text_ends, self.folded_starts):
+            del column[position]
+        self.compact_if_wasteful()
+
+    def compact_if_wasteful(self):
+        '''Compacts the arenas once most of their text is no longer used'''
+        if self.garbage > len(self.text) // 2:
+            self.compact()
+
+    def compact(self):
+        '''
+        Writes the arenas again with only the text of the messages still in
+        the channel, in the order of the messages
+        '''
+        texts = [self.message_text(position) for position in range(len(self))]
+        self.text = bytearray()
+        self.folded = bytearray()
+        for position, text in enumerate(texts):
+            text_start, text_end, folded_start = self.append_text(text)
+            self.text_starts[position] = text_start
+            self.text_ends[position] = text_end
+            self.folded_starts[position] = folded_start
+        self.edited = bytearray()
+        self.edited_starts = array('q')
+        self.edited_seqs = array('q')
+        self.garbage = 0
+
+    def positions_containing(self, needle):
+        '''
+        Returns the positions (in order) of the messages whose lowercase text
+        might contain needle (lowercase). A match can be in a message's text
+        from before an edit, or run over the end of a message, so each one
+        must still be checked.
+        '''
+        positions = find_positions(self.folded, self.folded_starts, len(self), needle)
+        if self.edited_starts:
+            positions = set(positions)
+            for index in find_positions(self.edited, self.edited_starts,
+                                        len(self.edited_starts), needle):
+                seq = self.edited_seqs[index]
+                position = bisect_left(self.seqs, seq)
+                # the message may have been removed since
+                if position < len(self) and self.seqs[position] == seq:
+                    positions.add(position)
+            positions = sorted(positions)
+        return positions
+
+    def oldest(self, count):
+        '''
+        Returns the count oldest messages as dictionaries (with their seq,
+        without their reacts)
+        '''
+        return [{
+            'message_id': self.message_ids[position],
+            'u_id': self.u_ids[position],
+            'seq': self.seqs[position],
+            'time_created': self.times[position],
+            'is_pinned': bool(self.is_pinned[position]),
+            'message': self.message_text(position)
+        } for position in range(count)]
+
+    def remove_oldest(self, count):
+        '''Removes the count oldest messages (their reacts stay in reacts)'''
+        for column in (self.message_ids, self.u_ids, self.seqs, self.times, self.is_pinned,
+                       self.text_starts, self.text_ends, self.folded_starts):
+            del column[:count]
+        self.compact()
+
+def find_positions(arena, starts, count, needle, base=0):
+    '''
+    Returns the positions of the messages whose lowercase text might contain
+    needle (lowercase), where arena has the lowercase text of count messages
+    one after another, the message at position i starting at base + starts[i].
+    A match can run over the end of a message, so each one must still be
+    checked.
+    '''
+    needle = needle.encode('utf-8', TEXT_ERRORS)
+    positions = []
+    position = 0
+    found = arena.find(needle, base)
+    while found != -1:
+        # matches are found in order, so each is after the last one's message
+        position = bisect_right(starts, found - base, position) - 1
+        positions.append(position)
+        # only the first match in each message is needed
+        if position + 1 == count:
+            break
+        found = arena.find(needle, max(base + starts[position + 1], found + 1))
+        position += 1
+    return positions
+
+class ColumnarStorage(IndexedStorage):
+    '''
+    IndexedStorage (users, channels and pending messages are indexed the same
+    way) with each channel's messages kept in MessageColumns instead of a
+    list of records, which takes several times less memory for each message.
+    Messages are returned as MessageRecords made from the columns when they
+    are asked for.
+
+    - self.data['message_channels'][message_id] is the channel_id of the
+      message (or -1) and self.data['message_seqs'][message_id] is its seq
+      in the channel, both are arrays with a place for every message_id
+    - there is no search index, searches look through the lowercase text of
+      each channel with bytes.find and check each match
+    '''
+
+    def clear(self):
+        '''See Storage.clear'''
+        super().clear()
+        self.data['message_channels'] = array('q')
+        self.data['message_seqs'] = array('q')
+
+    def add_channel(self, channel):
+        '''See Storage.add_channel'''
+        super().add_channel(channel)
+        self.data['channels'][channel['channel_id']].messages = MessageColumns()
+
+    # messages
+    def add_message(self, channel_id, message):
+        '''See Storage.add_message'''
+        seq = self.data['channels'][channel_id].messages.append(message)
+        message_channels = self.data['message_channels']
+        message_id = message['message_id']
+        if message_id >= len(message_channels):
+            missing = message_id + 1 - len(message_channels)
+            message_channels.extend(array('q', [-1]) * missing)
+            self.data['message_seqs'].extend(array('q', [0]) * missing)
+        message_channels[message_id] = channel_id
+        self.data['message_seqs'][message_id] = seq
+
+    def message_channel(self, message_id):
+        '''See Storage.message_channel'''
+        message_channels = self.data['message_channels']
+        if not isinstance(message_id, int) or not 0 <= message_id < len(message_channels):
+            return None
+        channel_id = message_channels[message_id]
+        return None if channel_id == -1 else channel_id
+
+    def message_position(self, message_id):
+        '''
+        Returns the (MessageColumns, position) of the message with message_id,
+        with a binary search over the seqs of its channel
+        '''
+        columns = self.data['channels'][self.data['message_channels'][message_id]].messages
+        return columns, bisect_left(columns.seqs, self.data['message_seqs'][message_id])
+
+    def get_message(self, message_id):
+        '''See Storage.get_message'''
+        if self.message_channel(message_id) is None:
+            return None
+        columns, position = self.message_position(message_id)
+        return columns.record(position)
+
+    def message_offset(self, message_id):
+        '''See DictStorage.message_offset'''
+        columns, position = self.message_position(message_id)
+        return len(columns) - 1 - position
+
+    def update_message(self, message_id, **changes):
+        '''See Storage.update_message'''
+        columns, position = self.message_position(message_id)
+        if 'message' in changes:
+            columns.set_text(position, changes['message'])
+        if 'is_pinned' in changes:
+            columns.is_pinned[position] = bool(changes['is_pinned'])
+
+    def add_react(self, message_id, react_id, u_id):
+        '''See Storage.add_react'''
+        columns, _ = self.message_position(message_id)
+        columns.reacts.setdefault(message_id, {}).setdefault(react_id, set()).add(u_id)
+
+    def remove_react(self, message_id, react_id, u_id):
+        '''See Storage.remove_react'''
+        columns, _ = self.message_position(message_id)
+        columns.reacts.get(message_id, {}).get(react_id, set()).discard(u_id)
+
+    def remove_message(self, message_id):
+        '''See Storage.remove_message'''
+        columns, position = self.message_position(message_id)
+        columns.remove(position)
+        self.data['message_channels'][message_id] = -1
+
+    def message_count(self, channel_id):
+        '''See Storage.message_count'''
+        return len(self.data['channels'][channel_id].messages)
+
+    def channel_messages(self, channel_id, start, count):
+        '''See Storage.channel_messages, the page is made from slices of the columns'''
+        columns = self.data['channels'][channel_id].messages
+        newest_position = len(columns) - start
+        oldest_position = max(newest_position - count, 0)
+        return [columns.record(position)
+                for position in range(newest_position - 1, oldest_position - 1, -1)]
+
+    def search_messages(self, query_str, channel_ids, substring=False):
+        '''
+        See Storage.search_messages, the lowercase text of each channel is
+        looked through for query_str (or the longest query term) and each
+        message it is found in is checked
+        '''
+        terms = query_terms(query_str)
+        query_str = query_str.lower()
+        if substring:
+            needle = query_str
+        else:
+            needle = max((term.rstrip('*') for term in terms), key=len, default='')
+        if not needle:
+            return
+        for channel_id in channel_ids:
+            channel = self.data['channels'].get(channel_id)
+            if channel is None:
+                continue
+            columns = channel.messages
+            for position in columns.positions_containing(needle):
+                text = columns.message_text(position)
+                if substring and query_str in text.lower():
+                    yield columns.record(position, text)
+                elif not substring and message_has_terms(text, terms):
+                    yield columns.record(position, text)
+
+    def use_trigram_index(self, enabled):
+        '''See Storage.use_trigram_index, there is no trigram index here'''
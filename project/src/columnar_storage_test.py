@@ -0,0 +1,101 @@
+'''Importing the storage backends to test columnar_storage.py'''
+import pickle
+import tracemalloc
+from storage import IndexedStorage
+from columnar_storage import ColumnarStorage
+
+def new_storage(backend):
+    '''Returns a storage of backend with a user in a channel'''
+    storage = backend()
+    storage.add_user({
+        'u_id': 1,
+        'email': 'bruce@gmail.com',
+        'password': 'password1234',
+        'name_first': 'bruce',
+        'name_last': 'lee',
+        'handle_str': 'brucelee',
+        'permission_id': 1
+    })
+    storage.add_channel({'channel_id': 1, 'name': 'channel_one', 'creator': 1, 'is_public': True})
+    storage.add_member(1, 1)
+    return storage
+
+def add_messages(storage, texts):
+    '''Adds a message for each of texts, with message_ids from 1'''
+    for message_id, text in enumerate(texts, 1):
+        storage.add_message(1, {
+            'message_id': message_id,
+            'u_id': 1,
+            'message': text,
+            'time_created': 1600000000.0 + message_id,
+            'reacts': {},
+            'is_pinned': False
+        })
+
+def search(storage, query_str, substring=False):
+    '''Returns the sorted message_ids of the messages found by a search'''
+    return sorted(message['message_id']
+                  for message in storage.search_messages(query_str, {1}, substring))
+
+def test_columnar_edits():
+    '''Edited and removed messages are found by their new text only, before and after compacting'''
+    storage = new_storage(ColumnarStorage)
+    add_messages(storage, ['hello world', 'world peace', 'goodbye'])
+    storage.update_message(1, message='hello there')
+    assert search(storage, 'world') == [2]
+    assert search(storage, 'there') == [1]
+    assert storage.channel_messages(1, 0, 3)[2]['message'] == 'hello there'
+
+    storage.remove_message(2)
+    storage.update_message(3, message='goodbye world', is_pinned=True)
+    assert search(storage, 'world') == [3]
+    assert search(storage, 'e w', True) == [3]
+    assert storage.get_message(3)['is_pinned']
+    assert storage.get_message(2) is None
+    assert [message['message_id'] for message in storage.channel_messages(1, 0, 50)] == [3, 1]
+
+def test_columnar_search_reads_only():
+    '''Searches after edits do not change the columns, so they can run at the same time'''
+    storage = new_storage(ColumnarStorage)
+    add_messages(storage, ['hello world', 'world peace', 'goodbye and see you next time'])
+    storage.update_message(2, message='world peace again')
+    before = pickle.dumps(storage.state())
+    assert search(storage, 'world') == [1, 2]
+    assert search(storage, 'peace', True) == [2]
+    assert pickle.dumps(storage.state()) == before
+
+def test_columnar_unusual_text():
+    '''Text that changes length when lowercased, or is not valid utf-8, is kept as it is'''
+    storage = new_storage(ColumnarStorage)
+    texts = ['İstanbul trip', 'surrogate \ud800 here', 'the end']
+    add_messages(storage, texts)
+    assert [message['message'] for message in storage.channel_messages(1, 0, 3)] == \
+        list(reversed(texts))
+    assert search(storage, 'trip') == [1]
+    assert search(storage, 'end') == [3]
+    assert search(storage, '\ud800', True) == [2]
+
+def test_columnar_snapshot():
+    '''The columns are saved in snapshots and loaded back the same'''
+    storage = new_storage(ColumnarStorage)
+    add_messages(storage, ['hello world', 'world peace'])
+    storage.add_react(2, 1, 1)
+    loaded = ColumnarStorage()
+    loaded.load_state(pickle.loads(pickle.dumps(storage.state())))
+    assert loaded.get_message(2) == storage.get_message(2)
+    assert search(loaded, 'world') == [1, 2]
+
+def bytes_per_message(backend, count=10000):
+    '''Returns the memory used by each of count messages added to a storage of backend'''
+    storage = new_storage(backend)
+    texts = [f'message number {message_id}' for message_id in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    add_messages(storage, texts)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+def test_columnar_memory():
+    '''Columns take several times less memory than a record and index entries per message'''
+    assert bytes_per_message(ColumnarStorage) * 3 < bytes_per_message(IndexedStorage)
@@ -1,41 +1,65 @@
 '''
 file to store global variables (in data variable)
+os module provides the environment variable the storage backend is chosen with
 '''
+import os
+from storage import DictStorage, IndexedStorage
+from sqlite_storage import SqliteStorage
+from columnar_storage import ColumnarStorage
+from cold_storage import ColdStorage
+from data_log import LoggedStorage
+from locked_storage import LockedStorage
 
-global data
-data = {
-    'users': {},
-    'channels': {},
-    'msg_later_list': []
+# the directory of the segment files of the cold backend, e.g.
+# FLOCKR_STORAGE=cold FLOCKR_SEGMENTS=/var/flockr_segments python3 src/server.py
+COLD_STORAGE_DIR = os.environ.get('FLOCKR_SEGMENTS', 'flockr_segments')
+# storage backends that can be chosen with the FLOCKR_STORAGE environment
+# variable, e.g. FLOCKR_STORAGE=dict python3 src/server.py
+STORAGE_BACKENDS = {
+    'dict': DictStorage,
+    'indexed': IndexedStorage,
+    'columnar': ColumnarStorage,
+    'cold': lambda: ColdStorage(COLD_STORAGE_DIR),
+    'sqlite': SqliteStorage
 }
+# the database file of the sqlite backend, e.g.
+# FLOCKR_STORAGE=sqlite FLOCKR_DB=/var/flockr.db python3 src/server.py
+SQLITE_DB_PATH = os.environ.get('FLOCKR_DB', 'flockr.db')
+
+global data
+if os.environ.get('FLOCKR_STORAGE', 'indexed') == 'sqlite':
+    data = SqliteStorage(SQLITE_DB_PATH)
+else:
+    # the in-memory backends are kept on disk by a snapshot and log once
+    # server.py opens it (see data_log.py)
+    data = LoggedStorage(STORAGE_BACKENDS[os.environ.get('FLOCKR_STORAGE', 'indexed')]())
+# request threads and the scheduler thread use data at the same time (see
+# locked_storage.py)
+data = LockedStorage(data)
 
 '''
 Note on usage:
 
-- Format:
-
-data['users'][u_id] = {
-        'email': email,
-        'password' : password,
-        'name_first' : name_first,
-        'name_last' : name_last,
-        'u_id' : u_id,
-        'token' : str(token),
-        'handle' : handle,
-        'channel_membership': []
-    }
-
-e.g data['users'][u_id]['token'] would give access to token value
-
-data['channels'][channel_id] = {
-        "name": name,
-        "owner": token,
-        "is_public": True,
-        "channel_id": channel_id,
-        "owner_members": [],
-        "all_members": [],
-        "messages": []
-    }
+- data is a Storage (see storage.py for the format of each record), every
+  module reads and changes the users, sessions, channels, messages, pending
+  messages and standups through its methods rather than through the
+  dictionaries of a backend
+
+e.g data.get_user(u_id)['email'] gives the email of the user with u_id, and
+data.update_user(u_id, email=email) changes it
+
+e.g data.is_member(channel_id, u_id) checks whether a user is a member of a
+channel, the member details shown by channel_details are made from
+data.get_user when they are asked for (see member_details)
+
+e.g data.channel_messages(channel_id, start, 50) gives the page of messages
+shown by channel_messages, the most recent message first
+
+e.g with data.channel_lock(channel_id): is held while checking that a user
+is a member of a channel and sending a message to it, so they cannot leave
+in between
 
 - u_id and channel_id start from 0 and it increases
+- message_id starts from 1 and is given out by data.next_message_id, so
+  message_ids are never reused
 '''
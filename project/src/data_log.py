@@ -0,0 +1,335 @@
+'''
+Snapshots and a write-ahead log of changes for the in-memory storage
+backends, so their data survives a restart while requests are still served
+from memory
+gc module is turned off while a snapshot is loaded, as it would otherwise
+look through the objects loaded so far many times over
+logging module reports logged changes that fail again and snapshots that
+cannot be saved
+os module provides fsync, the rename that replaces a snapshot in one step and
+the fork that saves a snapshot in a child process
+pickle module provides the format of the snapshot and of the log records
+re module is used to find the log files and the first seq of each
+threading module provides the lock that keeps changes in the same order as
+their log records, and the thread that syncs the log to disk
+'''
+import gc
+import logging
+import os
+import pickle
+import re
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+# the log is synced to disk (one fsync for every change since the last sync)
+# at most this many seconds after a change
+LOG_SYNC_INTERVAL = 0.5
+# a snapshot is saved, and a new log file started, once the log has this many
+# changes, so a restart never makes more than about this many changes again
+SNAPSHOT_EVERY = 10000
+
+SNAPSHOT_FILE = 'snapshot.pickle'
+# each log file is named after the seq of its first record, a new one is
+# started with each snapshot and the ones before it are removed once it is saved
+LOG_FILE = re.compile(r'^log\.(\d+)\.pickle$')
+
+# the methods of Storage that change it, each call of one is a log record
+LOGGED_METHODS = (
+    'clear', 'add_user', 'update_user', 'set_handle_suffix', 'add_session', 'remove_session',
+    'set_reset_code', 'remove_reset_code', 'add_channel', 'add_member', 'remove_member',
+    'add_owner', 'remove_owner', 'next_message_id', 'reserve_message_id', 'add_message',
+    'update_message', 'add_react', 'remove_react', 'remove_message', 'add_pending_message',
+    'remove_pending_message', 'start_standup', 'add_standup_message', 'end_standup'
+)
+
+class LoggedStorage:
+    '''
+    Wraps an in-memory storage backend (DictStorage or one based on it) and
+    has all of its methods. Until open_log is called, calls are just passed
+    on to the backend. Once it is open, every call of a method in
+    LOGGED_METHODS is appended to the log as (seq, method, args, kwargs)
+    before it is made, and the log is synced to disk in batches by a
+    background thread. open_log loads the last snapshot and makes the calls
+    logged after it again.
+
+    Snapshots are saved by a forked child process, which has a copy-on-write
+    copy of the backend as it was when the snapshot was started, so changes
+    carry on being made (into a new log file) while it is written. A backend
+    with files outside its state (ColdStorage's segment files) keeps the ones
+    the last snapshot refers to until the next snapshot is saved, see
+    DictStorage.release_files.
+    '''
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.RLock()
+        self.sync_condition = threading.Condition(self.lock)
+        self.directory = None
+        self.log = None
+        self.thread = None
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.snapshot_job = None
+        self.unsynced = False
+
+    def __getattr__(self, name):
+        # methods that only read are the backend's own, they are kept on the
+        # instance so later lookups do not come through here
+        if name == 'storage':
+            raise AttributeError(name)
+        attribute = getattr(self.storage, name)
+        if callable(attribute):
+            self.__dict__[name] = attribute
+        return attribute
+
+    def path(self, file_name):
+        '''Returns the path of file_name in the directory of the log'''
+        return os.path.join(self.directory, file_name)
+
+    def log_files(self):
+        '''Returns the (first seq, path) of each log file, in order'''
+        files = []
+        for file_name in os.listdir(self.directory):
+            match = LOG_FILE.match(file_name)
+            if match:
+                files.append((int(match.group(1)), self.path(file_name)))
+        return sorted(files)
+
+    def open_log(self, directory):
+        '''
+        Loads the snapshot and log in directory (creating it if needed) into
+        the backend, then logs every change from now on. Returns the number
+        of logged changes made again.
+        '''
+        with self.lock:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+            replayed = self.recover()
+            # the log file stays open for the changes until close_log (or the
+            # next snapshot) closes it, so it is not opened in a with block
+            self.log = open( # pylint: disable=consider-using-with
+                self.path(f'log.{self.seq + 1}.pickle'), 'ab')
+            self.thread = threading.Thread(target=self.sync_log, daemon=True)
+            self.thread.start()
+        return replayed
+
+    def recover(self):
+        '''
+        Used by open_log, loads the snapshot and makes the calls in the log
+        files after it again
+        '''
+        self.seq = 0
+        if os.path.exists(self.path(SNAPSHOT_FILE)):
+            gc.disable()
+            try:
+                with open(self.path(SNAPSHOT_FILE), 'rb') as snapshot:
+                    self.seq, state = pickle.load(snapshot)
+            finally:
+                gc.enable()
+            self.storage.load_state(state)
+        self.snapshot_seq = self.seq
+        # files the snapshot refers to are kept until a newer snapshot is
+        # saved, files made after it are made again by the calls in the log
+        self.storage.release_files(self.storage.files())
+
+        replayed = 0
+        for _, path in self.log_files():
+            with open(path, 'r+b') as log:
+                end = 0
+                while True:
+                    try:
+                        seq, name, args, kwargs = pickle.load(log)
+                    except Exception: # pylint: disable=broad-except
+                        # the end of the log, or a record cut short by a crash
+                        break
+                    end = log.tell()
+                    # records already in the snapshot (the server stopped
+                    # before the log files it covers were removed) are skipped
+                    if seq <= self.seq:
+                        continue
+                    self.seq = seq
+                    replayed += 1
+                    try:
+                        getattr(self.storage, name)(*args, **kwargs)
+                    except Exception: # pylint: disable=broad-except
+                        # the call failed the first time as well
+                        LOGGER.warning('logged change %s (seq %s) failed', name, seq,
+                                       exc_info=True)
+                # new records are appended after the last whole record
+                log.truncate(end)
+        return replayed
+
+    def close_log(self):
+        '''Syncs and closes the log, if it is open, once a snapshot being saved is done'''
+        with self.lock:
+            log, thread = self.log, self.thread
+            self.log = None
+            self.thread = None
+            self.sync_condition.notify()
+        if log is None:
+            return
+        thread.join()
+        with self.lock:
+            self.finish_snapshot(wait=True)
+        log.flush()
+        os.fsync(log.fileno())
+        log.close()
+
+    def sync_log(self):
+        '''
+        Runs on the log's thread, syncing the changes logged since the last
+        sync to disk and starting a snapshot once the log is long enough
+        '''
+        while True:
+            with self.lock:
+                if self.log is not None:
+                    self.sync_condition.wait(LOG_SYNC_INTERVAL)
+                if self.log is None:
+                    return
+                self.finish_snapshot()
+                if self.seq - self.snapshot_seq >= SNAPSHOT_EVERY:
+                    self.start_snapshot()
+                    continue
+                if not self.unsynced:
+                    continue
+                self.log.flush()
+                self.unsynced = False
+                fileno = self.log.fileno()
+            # changes carry on being logged while the log is synced
+            os.fsync(fileno)
+
+    def snapshot(self):
+        '''Saves a snapshot of the backend now and waits for it, if the log is open'''
+        with self.lock:
+            if self.log is None:
+                return
+            self.finish_snapshot(wait=True)
+            self.start_snapshot()
+            self.finish_snapshot(wait=True)
+
+    def start_snapshot(self):
+        '''
+        Used with the lock held, starts saving a snapshot of the backend as it
+        is now (unless one is being saved already) and starts a new log file
+        for the changes after it
+        '''
+        if self.snapshot_job is not None:
+            return
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.log.close()
+        # as in open_log, the new log file stays open until it is closed
+        self.log = open( # pylint: disable=consider-using-with
+            self.path(f'log.{self.seq + 1}.pickle'), 'ab')
+        self.unsynced = False
+        self.snapshot_seq = self.seq
+
+        snapshot = (self.seq, self.storage.state())
+        files = self.storage.files()
+        if hasattr(os, 'fork'):
+            pid = os.fork()
+            if pid == 0:
+                # the child process only writes the snapshot, its gc is off
+                # so it does not touch (and copy) every page of the backend
+                gc.disable()
+                status = 1
+                try:
+                    write_snapshot(self.directory, snapshot)
+                    status = 0
+                except Exception: # pylint: disable=broad-except
+                    LOGGER.exception('snapshot of seq %s could not be written', self.seq)
+                finally:
+                    os._exit(status) # pylint: disable=protected-access
+            self.snapshot_job = {'seq': self.seq, 'files': files, 'pid': pid}
+        else:
+            # without fork the backend is copied while the lock is held, and
+            # written by another thread
+            snapshot = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+            job = {'seq': self.seq, 'files': files, 'saved': False}
+            job['thread'] = threading.Thread(target=write_snapshot_job,
+                                             args=(self.directory, snapshot, job), daemon=True)
+            job['thread'].start()
+            self.snapshot_job = job
+
+    def finish_snapshot(self, wait=False):
+        '''
+        Used with the lock held, once the snapshot being saved is done (or
+        after waiting for it) removes the log files it covers, and the
+        backend's files that neither it nor the backend use any more
+        '''
+        job = self.snapshot_job
+        if job is None:
+            return
+        if 'pid' in job:
+            pid, status = os.waitpid(job['pid'], 0 if wait else os.WNOHANG)
+            if pid == 0:
+                return
+            saved = status == 0
+        else:
+            if wait:
+                job['thread'].join()
+            if job['thread'].is_alive():
+                return
+            saved = job['saved']
+        self.snapshot_job = None
+
+        if not saved:
+            # the log files are kept, and replayed on top of the last snapshot
+            LOGGER.error('snapshot of seq %s failed, its log files are kept', job['seq'])
+            return
+        for first_seq, path in self.log_files():
+            if first_seq <= job['seq']:
+                os.remove(path)
+        self.storage.release_files(job['files'])
+
+def write_snapshot(directory, snapshot):
+    '''
+    Writes snapshot (or the bytes of one already pickled) into a temporary
+    file, then renames it over the snapshot in directory
+    '''
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    with open(path + '.tmp', 'wb') as snapshot_file:
+        if isinstance(snapshot, bytes):
+            snapshot_file.write(snapshot)
+        else:
+            pickle.dump(snapshot, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(path + '.tmp', path)
+    sync_directory(directory)
+
+def write_snapshot_job(directory, snapshot, job):
+    '''Runs on a thread where there is no fork, writing snapshot and noting it is saved'''
+    try:
+        write_snapshot(directory, snapshot)
+    except Exception: # pylint: disable=broad-except
+        LOGGER.exception('snapshot of seq %s could not be written', job['seq'])
+        return
+    job['saved'] = True
+
+def sync_directory(directory):
+    '''Syncs directory to disk, so a file renamed in it stays renamed'''
+    fileno = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fileno)
+    finally:
+        os.close(fileno)
+
+def logged_method(name):
+    '''Returns the method of LoggedStorage for the backend method name'''
+    def method(self, *args, **kwargs):
+        with self.lock:
+            if self.log is not None:
+                self.seq += 1
+                pickle.dump((self.seq, name, args, kwargs), self.log, pickle.HIGHEST_PROTOCOL)
+                self.unsynced = True
+                if self.seq - self.snapshot_seq >= SNAPSHOT_EVERY:
+                    self.sync_condition.notify()
+            return getattr(self.storage, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = f'See Storage.{name}, the call is logged once the log is open'
+    return method
+
+for method_name in LOGGED_METHODS:
+    setattr(LoggedStorage, method_name, logged_method(method_name))
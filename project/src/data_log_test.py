@@ -0,0 +1,180 @@
+'''Importing the storage backends to test data_log.py'''
+import os
+import time
+import data_log
+from data_log import LoggedStorage, SNAPSHOT_FILE
+from storage import DictStorage, IndexedStorage
+
+def add_data(storage):
+    '''Adds a user, a channel and two messages (one edited and reacted to) to storage'''
+    storage.add_user({
+        'u_id': 1,
+        'email': 'bruce@gmail.com',
+        'password': 'password1234',
+        'name_first': 'bruce',
+        'name_last': 'lee',
+        'handle_str': 'brucelee',
+        'permission_id': 1
+    })
+    storage.add_session('token', 1)
+    storage.add_channel({'channel_id': 1, 'name': 'channel_one', 'creator': 1, 'is_public': True})
+    storage.add_member(1, 1)
+    for message_id in (1, 2):
+        storage.reserve_message_id(message_id)
+        storage.add_message(1, {
+            'message_id': message_id,
+            'u_id': 1,
+            'message': 'hello world',
+            'time_created': float(message_id),
+            'reacts': {},
+            'is_pinned': False
+        })
+    storage.update_message(1, message='edited')
+    storage.add_react(1, 1, 1)
+
+def test_data_log_replay(tmp_path):
+    '''Every change logged is made again when the log is opened after a restart'''
+    for backend in (DictStorage, IndexedStorage):
+        directory = str(tmp_path / backend.__name__)
+        storage = LoggedStorage(backend())
+        assert storage.open_log(directory) == 0
+        add_data(storage)
+        storage.close_log()
+
+        restarted = LoggedStorage(backend())
+        assert restarted.open_log(directory) > 0
+        assert restarted.state() == storage.state()
+        assert restarted.session_user('token') == 1
+        assert restarted.get_message(1)['reacts'] == {1: {1}}
+        assert [message['message_id'] for message in restarted.search_messages('edited', {1})] \
+            == [1]
+        restarted.close_log()
+
+def test_data_log_not_open(tmp_path):
+    '''Changes are only logged once the log is open'''
+    storage = LoggedStorage(IndexedStorage())
+    add_data(storage)
+    assert storage.user_count() == 1
+
+    directory = str(tmp_path / 'data')
+    storage.open_log(directory)
+    storage.close_log()
+    assert [(first_seq, os.path.getsize(path)) for first_seq, path in storage.log_files()] == \
+        [(1, 0)]
+
+def test_data_log_snapshot(tmp_path, monkeypatch):
+    '''Once the log is long enough a snapshot is saved, and the log files it covers removed'''
+    monkeypatch.setattr(data_log, 'SNAPSHOT_EVERY', 5)
+    monkeypatch.setattr(data_log, 'LOG_SYNC_INTERVAL', 0.01)
+    directory = str(tmp_path / 'data')
+    storage = LoggedStorage(IndexedStorage())
+    storage.open_log(directory)
+    add_data(storage)
+    waited = 0
+    while (storage.snapshot_seq == 0 or storage.snapshot_job is not None) and waited < 2:
+        time.sleep(0.01)
+        waited += 0.01
+    assert storage.snapshot_seq == storage.seq
+    assert os.path.exists(os.path.join(directory, SNAPSHOT_FILE))
+    assert [first_seq for first_seq, _ in storage.log_files()] == [storage.seq + 1]
+    storage.remove_message(2)
+    storage.close_log()
+
+    restarted = LoggedStorage(IndexedStorage())
+    assert restarted.open_log(directory) == 1
+    assert restarted.state() == storage.state()
+    assert restarted.get_message(2) is None
+    restarted.close_log()
+
+def test_data_log_cut_short(tmp_path):
+    '''A record cut short by a crash is dropped and the log carries on after it'''
+    directory = str(tmp_path / 'data')
+    storage = LoggedStorage(IndexedStorage())
+    storage.open_log(directory)
+    add_data(storage)
+    storage.close_log()
+    with open(storage.log_files()[-1][1], 'ab') as log:
+        log.write(b'\x80\x05\x95')
+
+    restarted = LoggedStorage(IndexedStorage())
+    restarted.open_log(directory)
+    assert restarted.state() == storage.state()
+    restarted.add_session('token2', 1)
+    restarted.close_log()
+
+    restarted_again = LoggedStorage(IndexedStorage())
+    restarted_again.open_log(directory)
+    assert restarted_again.session_user('token2') == 1
+    restarted_again.close_log()
+
+def test_data_log_changes_during_snapshot(tmp_path):
+    '''Changes made while a snapshot is being saved are in the log after it'''
+    directory = str(tmp_path / 'data')
+    storage = LoggedStorage(IndexedStorage())
+    storage.open_log(directory)
+    add_data(storage)
+    with storage.lock:
+        storage.start_snapshot()
+    storage.add_session('token2', 1)
+    storage.remove_message(2)
+    storage.close_log()
+
+    restarted = LoggedStorage(IndexedStorage())
+    assert restarted.open_log(directory) == 2
+    assert restarted.state() == storage.state()
+    assert restarted.session_user('token2') == 1
+    restarted.close_log()
+
+def test_data_log_snapshot_now(tmp_path):
+    '''snapshot saves a snapshot straight away, so nothing is made again on a restart'''
+    directory = str(tmp_path / 'data')
+    storage = LoggedStorage(DictStorage())
+    storage.open_log(directory)
+    add_data(storage)
+    storage.snapshot()
+    storage.close_log()
+
+    restarted = LoggedStorage(DictStorage())
+    assert restarted.open_log(directory) == 0
+    assert restarted.state() == storage.state()
+    restarted.close_log()
+
+def test_data_log_snapshot_without_fork(tmp_path, monkeypatch):
+    '''Where there is no fork, the snapshot is copied and written by a thread'''
+    monkeypatch.delattr(os, 'fork')
+    directory = str(tmp_path / 'data')
+    storage = LoggedStorage(IndexedStorage())
+    storage.open_log(directory)
+    add_data(storage)
+    storage.snapshot()
+    storage.add_session('token2', 1)
+    storage.close_log()
+
+    restarted = LoggedStorage(IndexedStorage())
+    assert restarted.open_log(directory) == 1
+    assert restarted.state() == storage.state()
+    restarted.close_log()
+
+def test_data_log_snapshot_failed(tmp_path, monkeypatch, caplog):
+    '''A snapshot that cannot be written is logged, and its log files are kept'''
+    monkeypatch.delattr(os, 'fork')
+    directory = str(tmp_path / 'data')
+    storage = LoggedStorage(IndexedStorage())
+    storage.open_log(directory)
+    add_data(storage)
+
+    def fail(*_):
+        raise OSError('no space left on device')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(data_log, 'write_snapshot', fail)
+        storage.snapshot()
+    assert [record.levelname for record in caplog.records] == ['ERROR', 'ERROR']
+    assert caplog.records[0].exc_info[0] is OSError
+    assert 'log files are kept' in caplog.records[1].getMessage()
+    storage.close_log()
+
+    restarted = LoggedStorage(IndexedStorage())
+    restarted.open_log(directory)
+    assert restarted.state() == storage.state()
+    restarted.close_log()
@@ -1,144 +1,174 @@
 '''
 Helper functions for all functions
 string module provides alphabet list for handle management
-random module provides support for generating random number as token
-re, signal, time and subprocess is used for url function
+secrets module provides support for generating random tokens
+scheduler and schedule_store are used for scheduling again the saved messages
+from message_sendlater and standups when the server restarts
+re is used for splitting messages into search terms
+re, os, signal, time and subprocess is used for url function
 '''
 
 from datetime import datetime, timezone
 import string
-import random
+import secrets
 import re
+import os
 import signal
 from time import sleep
 from subprocess import Popen, PIPE
 import pytest
 from error import AccessError, InputError
+from scheduler import schedule
+from schedule_store import stored_schedule, unstore_msg_later, unstore_standup
+
+# a search term is a run of letters, digits or underscores, a query term
+# ending with * matches every search term starting with it
+SEARCH_TERM = re.compile(r'\w+')
+QUERY_TERM = re.compile(r'\w+\*?')
 
 def generate_handle(name_first, name_last, data):
     '''
     This function generates a handle based on a user's first name and
-    last name and ensures the handle is unique by checking it with data. The
+    last name and ensures the handle is unique by looking it up in data. The
     handle will be altered if the handle generated is already in use, making
-    each handle unique to their respective users.
+    each handle unique to their respective users. Where the suffixing stopped
+    for a handle is remembered (by storage backends that can), so registering
+    many users with the same name does not retry every earlier suffix.
     '''
     handle = name_first + name_last
     handle = handle.lower()
     handle = handle[:20]
+    base_handle = handle
 
     alphabet = 0
     replace_position = -1
-    alphabet_string = string.ascii_lowercase
-    alphabet_list = list(alphabet_string)
-    restart_loop = True
-    while restart_loop:
-        restart_loop = False
-        for user in data['users']:
-            if data['users'][user]['handle_str'] == handle:
-                restart_loop = True
-                if len(handle) < 20:
-                    handle = handle + '_'
-                elif len(handle) == 20:
-                    handle = handle[:replace_position] + alphabet_list[alphabet]
-                    alphabet += 1
-                    if alphabet == 26:
-                        alphabet = 0
-                        replace_position += -1
+    alphabet_list = list(string.ascii_lowercase)
+    if data.handle_suffix(base_handle) is not None:
+        handle, alphabet, replace_position = data.handle_suffix(base_handle)
+
+    while data.user_by_handle(handle) is not None:
+        if len(handle) < 20:
+            handle = handle + '_'
+        elif len(handle) == 20:
+            handle = handle[:replace_position] + alphabet_list[alphabet]
+            alphabet += 1
+            if alphabet == 26:
+                alphabet = 0
+                replace_position += -1
+
+    data.set_handle_suffix(base_handle, (handle, alphabet, replace_position))
     return handle
 
-def generate_token(data):
+def generate_token():
     '''
-    This function generates a token, which is a random number that is
-    converted to a string. The token is then checked with data to ensure that
-    the token is unique.
+    This function generates a token, which is a random string of 32 hex
+    characters (128 bits) from a cryptographically secure source. Tokens are
+    practically impossible to guess or to collide, so the token does not need
+    to be checked against the active sessions.
     '''
-    token = random.randrange(10000, 99000)
-    restart_loop = True
-    while restart_loop:
-        restart_loop = False
-        for user in data['users']:
-            if 'token' in data['users'][user]:
-                if data['users'][user]['token'] == str(token):
-                    token += 1
-                    restart_loop = True
+    return secrets.token_hex(16)
 
-    return token
+def normalise_email(email):
+    '''
+    Given an email, returns the form of the email used to look up users by
+    email, so that the same address in different cases is treated as one email
+    '''
+    return email.lower()
 
 def channel_is_member(channel_id, u_id, data):
     '''
     helper function used to check whether a given u_id is a member of a given
     channel
     '''
-    is_member = False
-    for channel in data['users'][u_id]['channel_membership']:
-        if channel['channel_id'] == channel_id:
-            is_member = True
-    return is_member
+    return data.is_member(channel_id, u_id)
 
 def channel_has_owner_permissions(channel_id, u_id, data):
     '''
     helper function used to check whether a given u_id has owner permissions of
     a given channel
     '''
-    has_owner = False
     # checking for global owner
-    if data['users'][u_id]['permission_id'] == 1:
-        has_owner = True
+    if data.get_user(u_id)['permission_id'] == 1:
+        return True
 
     # checking for creator of the channel
-    token = data['users'][u_id]['token']
-    if data['channels'][channel_id]['creator'] == token:
-        has_owner = True
+    if data.get_channel(channel_id)['creator'] == u_id:
+        return True
 
-    for member in data['channels'][channel_id]['owner_members']:
-        # checking for local owner
-        if member['u_id'] == u_id:
-            has_owner = True
-    return has_owner
+    # checking for local owner
+    return data.is_owner(channel_id, u_id)
 
 def is_channel_owner(token, channel_id, data):
     '''Helper function for AccessError condition in message_remove function'''
-
-    for owner_member in data['channels'][channel_id]['owner_members']:
-        u_id = owner_member['u_id']
-        if data['users'][u_id]['token'] == token:
-            return True
-    return False
+    return data.is_owner(channel_id, data.session_user(token))
 
 def u_id_finder(token, data):
-    '''Given a token, search through the data variable to match validated token to a user_id'''
-    u_id = -1
-    for user in data['users']:
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                u_id = user
-
-    if u_id == -1:
+    '''Given a token, look up the active sessions to match validated token to a user_id'''
+    u_id = data.session_user(token)
+    if u_id is None:
         raise AccessError("Invalid token entered")
     return u_id
 
 def valid_token(token, data):
-    '''Given a token, search through users list to ensure that token is valid
+    '''Given a token, check the active sessions to ensure that token is valid
     Returns True if token is indeed valid '''
-    for user in data['users']:
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                return True
-    return False
+    return data.session_user(token) is not None
 
 def valid_channel(channel_id, data):
     '''Given a channel_id, check that it is a valid channel and is in channels list'''
-    for channels in data['channels']:
-        if data['channels'][channels]['channel_id'] == channel_id:
-            return True
-    return False
+    return data.get_channel(channel_id) is not None
 
 def valid_user_id(u_id, data):
     '''Given a u_id, check that it is a valid u_id'''
-    for users in data['users']:
-        if data['users'][users]['u_id'] == u_id:
-            return True
-    return False
+    return data.get_user(u_id) is not None
+
+def member_details(u_ids, data, cache=None):
+    '''
+    Given a set of u_ids (e.g. the owners or members of a channel), returns
+    the list of member details shown for a channel, in u_id order. The
+    details are made from the user records when they are asked for, cache is
+    a dict that can be passed to each call made for one request so each
+    user's details are only made once
+    '''
+    if cache is None:
+        cache = {}
+    details = []
+    for u_id in sorted(u_ids):
+        if u_id not in cache:
+            user = data.get_user(u_id)
+            member = {
+                'u_id': u_id,
+                'name_first': user['name_first'],
+                'name_last': user['name_last']
+            }
+            if 'profile_img_url' in user:
+                member['profile_img_url'] = user['profile_img_url']
+            cache[u_id] = member
+        details.append(cache[u_id])
+    return details
+
+def message_details(message, u_id):
+    '''
+    Given a message stored in a channel and the u_id of the user viewing it,
+    returns the message as it is shown to that user. is_this_user_reacted is
+    worked out here for the viewer, so reading messages never changes the
+    stored message
+    '''
+    reacts = []
+    for react_id, u_ids in message['reacts'].items():
+        reacts.append({
+            'react_id': react_id,
+            'u_ids': sorted(u_ids),
+            'is_this_user_reacted': u_id in u_ids
+        })
+    return {
+        'message_id': message['message_id'],
+        'u_id': message['u_id'],
+        'message': message['message'],
+        'time_created': message['time_created'],
+        'reacts': reacts,
+        'is_pinned': message['is_pinned']
+    }
 
 def message_send_future(u_id, channel_id, message, message_id, data):
     '''Used for sending messages in the future'''
@@ -151,59 +181,118 @@ def message_send_future(u_id, channel_id, message, message_id, data):
         'u_id': u_id,
         'message': message,
         'time_created': timestamp,
-        'reacts': [],
+        'reacts': {},
         'is_pinned': False
     }
 
-    for messages in data['msg_later_list']:
-        if messages['message_id'] == message_id:
-            del messages
+    with data.channel_lock(channel_id):
+        # removing the message from the pending messages of message_sendlater
+        if data.remove_pending_message(message_id):
+            unstore_msg_later(message_id)
 
-    #Inserting into the messages data structure within global var data
-    msg_list = data['channels'][channel_id]['messages']
-    msg_list.insert(0, message_dict)
-    data['channels'][channel_id]['messages'] = msg_list
+        #Inserting the message into its channel
+        data.add_message(channel_id, message_dict)
 
     return {
         'message_id': message_id,
     }
 
-def standup_end(channel_id, token, message_id, data):
+def standup_end(channel_id, u_id, message_id, data):
     '''Function is called when startup ends (in startup_start function)'''
-    standup_msg = "\n".join(data['channels'][channel_id]['standup']['messages'])
-    del data['channels'][channel_id]['standup']
-    u_id = u_id_finder(token, data)
-    message_send_future(u_id, channel_id, standup_msg, message_id, data)
+    with data.channel_lock(channel_id):
+        standup = data.end_standup(channel_id)
+        standup_msg = "\n".join(standup['messages'])
+        unstore_standup(channel_id)
+        message_send_future(u_id, channel_id, standup_msg, message_id, data)
 
-def message_id_in_which_channel(message_id, data):
+def replay_schedule(data):
     '''
-    Finding the channel_id of a channel in which the message with message_id exists
+    Schedules again the messages from message_sendlater and the standups saved
+    in the schedule store (called when the server starts). Ones that were due
+    while the server was down are all sent straight away, one after another,
+    by the scheduler thread. Ones whose channel or user does not exist are
+    left in the store. Returns the number of messages and standups scheduled.
     '''
-    for channel_id in data['channels']:
-        for message_dict in data['channels'][channel_id]['messages']:
-            if message_dict['message_id'] == message_id:
-                return channel_id
+    saved = stored_schedule()
+    replayed = 0
+    for future_msg in saved['msg_later']:
+        # message_ids given out before the restart must not be given out again
+        data.reserve_message_id(future_msg['message_id'])
+        if not valid_channel(future_msg['channel_id'], data) or \
+                not valid_user_id(future_msg['u_id'], data):
+            continue
+        data.add_pending_message(future_msg)
+        schedule(future_msg['time_sent'], message_send_future, [
+            future_msg['u_id'], future_msg['channel_id'], future_msg['message'],
+            future_msg['message_id'], data
+        ])
+        replayed += 1
 
-    raise InputError("Message cannot be found in any channel")
+    for standup in saved['standups']:
+        data.reserve_message_id(standup['message_id'])
+        if not valid_channel(standup['channel_id'], data) or \
+                not valid_user_id(standup['u_id'], data):
+            continue
+        data.start_standup(standup['channel_id'], {
+            'messages': standup['messages'],
+            'time_finish': standup['time_finish'],
+            'u_id': standup['u_id'],
+            'message_id': standup['message_id']
+        })
+        schedule(standup['time_finish'], standup_end, [
+            standup['channel_id'], standup['u_id'], standup['message_id'], data
+        ])
+        replayed += 1
+    return replayed
 
-def is_user_in_channel(channel_id, u_id, data):
+def message_terms(message):
     '''
-    Check to see whether a user of u_id is in the channel with channel_id
+    Returns the set of search terms (lowercase words) in the text of a message
     '''
-    user_in_channel = False
+    return set(SEARCH_TERM.findall(message.lower()))
 
-    for owner in data['channels'][channel_id]['owner_members']:
-        if owner['u_id'] == u_id:
-            user_in_channel = True
-            break
+def message_trigrams(message):
+    '''
+    Returns the set of every 3 character long piece of the text of a message
+    (lowercase), used by the trigram index for substring search
+    '''
+    message = message.lower()
+    return {message[i:i + 3] for i in range(len(message) - 2)}
 
-    if not user_in_channel:
-        for member in data['channels'][channel_id]['all_members']:
-            if member['u_id'] == u_id:
-                user_in_channel = True
-                break
+def query_terms(query_str):
+    '''
+    Returns the set of terms of a search query (lowercase words, a word ending
+    with * matches every word starting with it)
+    '''
+    return set(QUERY_TERM.findall(query_str.lower()))
 
-    return user_in_channel
+def message_has_terms(message, terms):
+    '''
+    Returns whether the text of a message has every one of the query terms
+    '''
+    words = message_terms(message)
+    for term in terms:
+        if term.endswith('*'):
+            if not any(word.startswith(term[:-1]) for word in words):
+                return False
+        elif term not in words:
+            return False
+    return True
+
+def message_id_in_which_channel(message_id, data):
+    '''
+    Finding the channel_id of a channel in which the message with message_id exists
+    '''
+    channel_id = data.message_channel(message_id)
+    if channel_id is None:
+        raise InputError("Message cannot be found in any channel")
+    return channel_id
+
+def is_user_in_channel(channel_id, u_id, data):
+    '''
+    Check to see whether a user of u_id is in the channel with channel_id
+    '''
+    return data.is_owner(channel_id, u_id) or data.is_member(channel_id, u_id)
 
 # Use this fixture to get the URL of the server.
 @pytest.fixture
@@ -212,7 +301,10 @@ def url():
     function to find base url
     '''
     url_re = re.compile(r' \* Running on ([^ ]*)')
-    server = Popen(["python3", "src/server.py"], stderr=PIPE, stdout=PIPE)
+    # each server starts empty, with nothing kept on disk
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('FLOCKR_DATA', 'FLOCKR_SCHEDULE')}
+    server = Popen(["python3", "src/server.py"], stderr=PIPE, stdout=PIPE, env=env)
     line = server.stderr.readline()
     local_url = url_re.match(line.decode())
     if local_url:
@@ -0,0 +1,181 @@
+'''
+Locking for the storage backends, so request threads (and the scheduler
+thread) can use data at the same time
+contextlib module provides the context managers that hold a lock for a block
+threading module provides the locks and the per-thread count of reads held
+data_log provides the names of the Storage methods that change the storage
+'''
+from contextlib import contextmanager
+import threading
+from data_log import LOGGED_METHODS
+
+# channels share this many channel locks (each one is the lock of the channels
+# whose channel_id hashes to it), so the number of locks does not grow with
+# the channel_ids asked for
+CHANNEL_LOCK_STRIPES = 64
+
+class ReadWriteLock:
+    '''
+    A lock held by any number of readers at once, or by one writer. Writers
+    waiting go before new readers, so reads coming in all the time do not
+    keep a writer out. A thread already reading can read again (even with a
+    writer waiting), and the writer can read and write again, but a thread
+    cannot start writing while it is reading.
+    '''
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writer = None
+        self.write_depth = 0
+        # reads held by each thread, so its nested reads do not wait
+        self.local = threading.local()
+
+    def acquire_read(self):
+        '''Waits until there is no writer (or one waiting), then holds the lock for reading'''
+        if self.writer == threading.get_ident():
+            self.write_depth += 1
+            return
+        reads = getattr(self.local, 'reads', 0)
+        if reads == 0:
+            with self.condition:
+                while self.writer is not None or self.writers_waiting:
+                    self.condition.wait()
+                self.readers += 1
+        self.local.reads = reads + 1
+
+    def release_read(self):
+        '''Releases a read held by this thread'''
+        if self.writer == threading.get_ident():
+            self.write_depth -= 1
+            return
+        self.local.reads -= 1
+        if self.local.reads == 0:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    def acquire_write(self):
+        '''Waits until there are no readers or writer, then holds the lock for writing'''
+        ident = threading.get_ident()
+        if self.writer == ident:
+            self.write_depth += 1
+            return
+        if getattr(self.local, 'reads', 0):
+            raise RuntimeError('cannot write while reading')
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writer is not None or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writer = ident
+            self.write_depth = 1
+
+    def release_write(self):
+        '''Releases a write held by this thread'''
+        self.write_depth -= 1
+        if self.write_depth == 0:
+            with self.condition:
+                self.writer = None
+                self.condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        '''Holds the lock for reading in a with block'''
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        '''Holds the lock for writing in a with block'''
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+class LockedStorage:
+    '''
+    Wraps a storage backend (or a LoggedStorage) and has all of its methods.
+    Each call of a method that changes the storage (LOGGED_METHODS) holds
+    lock for writing, every other call holds it for reading, so a change is
+    never seen half made and reads run side by side. search_messages holds
+    it for reading until its results have all been read.
+
+    Records returned by the backend may be changed by later calls, so code
+    that reads them across several calls holds a lock too:
+
+    - channel_lock(channel_id) is held while checking and changing a
+      channel, its members, messages (and their reacts) and standup, e.g. by
+      message_send from the check that the user is a member to adding the
+      message. It is also held while reading the reacts of the channel's
+      messages, as they are only changed with it held. Several channels share
+      each lock, and a thread never holds two channels' locks at once (so two
+      threads cannot each wait for the lock the other holds).
+    - users_lock is held while checking and changing the emails and handles
+      that must be unique, and while giving out a u_id
+    - channels_lock is held while giving out a channel_id
+    - reading() holds lock for reading for a with block, e.g. while search
+      reads the reacts of messages from many channels
+
+    Locks are taken in that order (a channel's, then lock), never the other
+    way round.
+    '''
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = ReadWriteLock()
+        self.users_lock = threading.RLock()
+        self.channels_lock = threading.RLock()
+        self.channel_locks = [threading.RLock() for _ in range(CHANNEL_LOCK_STRIPES)]
+
+    def __getattr__(self, name):
+        # methods that only read are the backend's own, called holding the
+        # lock for reading, they are kept on the instance so later lookups do
+        # not come through here
+        if name == 'storage':
+            raise AttributeError(name)
+        attribute = getattr(self.storage, name)
+        if callable(attribute):
+            attribute = locked_method(attribute, self.lock.reading)
+            self.__dict__[name] = attribute
+        return attribute
+
+    def channel_lock(self, channel_id):
+        '''Returns the lock of the channel with channel_id'''
+        return self.channel_locks[hash(channel_id) % CHANNEL_LOCK_STRIPES]
+
+    def reading(self):
+        '''Holds lock for reading in a with block'''
+        return self.lock.reading()
+
+    def search_messages(self, query_str, channel_ids, substring=False):
+        '''See Storage.search_messages, lock is held for reading until every result is read'''
+        with self.lock.reading():
+            yield from self.storage.search_messages(query_str, channel_ids, substring)
+
+def locked_method(method, lock):
+    '''Returns method called with lock (a context manager) held'''
+    def call(*args, **kwargs):
+        with lock():
+            return method(*args, **kwargs)
+    call.__name__ = method.__name__
+    call.__doc__ = method.__doc__
+    return call
+
+def write_method(name):
+    '''Returns the method of LockedStorage for the backend method name'''
+    def method(self, *args, **kwargs):
+        with self.lock.writing():
+            return getattr(self.storage, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = f'See Storage.{name}, the call holds the lock for writing'
+    return method
+
+for method_name in LOGGED_METHODS:
+    setattr(LockedStorage, method_name, write_method(method_name))
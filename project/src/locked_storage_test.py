@@ -0,0 +1,236 @@
+'''Importing the locks and the functions that use data to test locked_storage.py'''
+import sys
+import time
+import threading
+import pytest
+import cold_storage
+from locked_storage import ReadWriteLock, CHANNEL_LOCK_STRIPES
+from columnar_storage import ColumnarStorage
+from cold_storage import ColdStorage
+from data_log import LoggedStorage
+from data import data
+from auth import auth_register
+from channels import channels_create
+from channel import channel_messages, channel_join, channel_leave
+from message import message_send, message_react, message_unreact, message_remove
+from message import message_edit
+from other import clear, search, standup_start, standup_send
+from error import InputError, AccessError
+
+@pytest.fixture(params=['default', 'columnar', 'cold'])
+def backend(request, monkeypatch, tmp_path):
+    '''Runs a test with data kept by the default backend, then the columnar and cold backends'''
+    if request.param == 'default':
+        return
+    if request.param == 'cold':
+        # a few messages of each channel are kept in memory, the rest in segments
+        monkeypatch.setattr(cold_storage, 'HOT_MESSAGES', 30)
+        monkeypatch.setattr(cold_storage, 'SEGMENT_MESSAGES', 20)
+        storage = ColdStorage(str(tmp_path))
+    else:
+        storage = ColumnarStorage()
+    monkeypatch.setattr(data, 'storage', LoggedStorage(storage))
+    # methods of the default backend looked up before are kept on data
+    for name in [name for name, value in vars(data).items() if callable(value)]:
+        monkeypatch.delattr(data, name)
+
+def run_threads(targets):
+    '''Runs each of targets on its own thread, returns the exceptions they raised'''
+    errors = []
+
+    def run(target):
+        try:
+            target()
+        except Exception as err: # pylint: disable=broad-except
+            errors.append(err)
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+def test_read_write_lock():
+    '''Readers hold the lock together, a writer on its own, and a waiting writer goes first'''
+    lock = ReadWriteLock()
+    events = []
+    both_reading = threading.Barrier(2, timeout=5)
+
+    def read():
+        with lock.reading():
+            both_reading.wait()
+            events.append('read')
+
+    assert run_threads([read, read]) == []
+
+    def write():
+        with lock.writing():
+            events.append('write')
+
+    lock.acquire_read()
+    writer = threading.Thread(target=write)
+    writer.start()
+    while not lock.writers_waiting:
+        time.sleep(0.001)
+    # a thread already reading can read again with a writer waiting
+    with lock.reading():
+        events.append('nested read')
+    with pytest.raises(RuntimeError):
+        lock.acquire_write()
+    lock.release_read()
+    writer.join(5)
+    assert events == ['read', 'read', 'nested read', 'write']
+
+def test_locked_storage_channel_locks():
+    '''Unknown channels and messages are turned away before a lock is taken, and locks are shared'''
+    clear()
+    user = auth_register('locks@gmail.com', 'password1234', 'bruce', 'lee')
+    for channel_id in range(1000, 1100):
+        with pytest.raises(AccessError):
+            message_send(user['token'], channel_id, 'hello')
+    for message_id in (None, 12345):
+        with pytest.raises(InputError):
+            message_react(user['token'], message_id, 1)
+        with pytest.raises(InputError):
+            message_edit(user['token'], message_id, 'hello')
+    locks = {id(data.channel_lock(channel_id)) for channel_id in range(10000)}
+    assert len(locks) == len(data.channel_locks) == CHANNEL_LOCK_STRIPES
+
+@pytest.mark.usefixtures("backend")
+def test_locked_storage_stress():
+    '''
+    Messages are sent, read, searched, edited, reacted to and removed,
+    members join and leave, and a standup is sent to from many threads at
+    once, with every result the same as if they had been made one at a time
+    '''
+    clear()
+    users = [auth_register(f'stress{number}@gmail.com', 'password1234', 'bruce', 'lee')
+             for number in range(4)]
+    channel_ids = [channels_create(users[0]['token'], name, True)['channel_id']
+                   for name in ('channel_one', 'channel_two')]
+    for user in users[1:3]:
+        for channel_id in channel_ids:
+            channel_join(user['token'], channel_id)
+    sent = {channel_id: [] for channel_id in channel_ids}
+    removed = []
+    # a long channel, so searches take long enough to overlap with edits
+    for number in range(3000):
+        message = message_send(users[0]['token'], channel_ids[0], f'hello {number}')
+        sent[channel_ids[0]].append(message['message_id'])
+
+    def send(user, channel_id):
+        def target():
+            for number in range(100):
+                message = message_send(user['token'], channel_id, f'hello {number}')
+                sent[channel_id].append(message['message_id'])
+        return target
+
+    edits_done = threading.Event()
+
+    def read(user):
+        def target():
+            # reads go on until the edits are done, so searches run between them
+            while not edits_done.is_set():
+                for channel_id in channel_ids:
+                    page = channel_messages(user['token'], channel_id, 0)['messages']
+                    times = [message['time_created'] for message in page]
+                    assert times == sorted(times, reverse=True)
+                assert all('hello' in message['message']
+                           for message in search(user['token'], 'hello', limit=20)['messages'])
+        return target
+
+    def react(user):
+        def target():
+            for _ in range(50):
+                message_ids = sent[channel_ids[0]][:5]
+                for message_id in message_ids:
+                    message_react(user['token'], message_id, 1)
+                for message_id in message_ids:
+                    message_unreact(user['token'], message_id, 1)
+        return target
+
+    edited = set()
+
+    def edit():
+        try:
+            for number in range(200):
+                message_id = sent[channel_ids[0]][5 + number % 20]
+                message_edit(users[0]['token'], message_id, f'hello edited {number}')
+                edited.add(message_id)
+        finally:
+            edits_done.set()
+
+    def remove():
+        for _ in range(20):
+            if sent[channel_ids[1]][20:]:
+                message_id = sent[channel_ids[1]][20]
+                try:
+                    message_remove(users[0]['token'], message_id)
+                    removed.append(message_id)
+                except InputError:
+                    # removed by the other thread first
+                    pass
+
+    def join_leave():
+        for _ in range(50):
+            channel_join(users[3]['token'], channel_ids[0])
+            channel_leave(users[3]['token'], channel_ids[0])
+
+    standup_start(users[0]['token'], channel_ids[1], 1)
+    standup_sent = []
+
+    def send_to_standup(user):
+        def target():
+            for number in range(200):
+                try:
+                    standup_send(user['token'], channel_ids[1], f'standup {number}')
+                    standup_sent.append(number)
+                except InputError:
+                    # the standup has ended
+                    return
+                time.sleep(0.01)
+        return target
+
+    targets = [send(user, channel_id) for user in users[:3] for channel_id in channel_ids]
+    targets += [read(user) for user in users[:3] * 2]
+    targets += [react(user) for user in users[1:3]]
+    targets += [edit, remove, remove, join_leave]
+    targets += [send_to_standup(user) for user in users[1:3]]
+    # threads are switched between far more often than usual, so more of
+    # their calls overlap
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        assert run_threads(targets) == []
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    # every message sent and not removed is in its channel once, with no
+    # reacts left, and the standup was sent as one message
+    time.sleep(0.5)
+    for channel_id in channel_ids:
+        messages = []
+        start = 0
+        while start != -1:
+            page = channel_messages(users[0]['token'], channel_id, start)
+            messages += page['messages']
+            start = page['end']
+        message_ids = [message['message_id'] for message in messages]
+        assert len(message_ids) == len(set(message_ids))
+        expected = set(sent[channel_id]) - set(removed)
+        if channel_id == channel_ids[1]:
+            standup_message = next(message for message in messages
+                                   if message['message'].startswith('brucelee'))
+            assert standup_message['message'].count('standup') == len(standup_sent)
+            message_ids.remove(standup_message['message_id'])
+        assert set(message_ids) == expected
+        assert all(react['u_ids'] == [] for message in messages for react in message['reacts'])
+        assert all(message['message'].startswith('hello') for message in messages
+                   if message['message_id'] in expected)
+    assert len(removed) == len(set(removed))
+    # searches find every message by its text, and edited messages by their new text
+    found = {message['message_id'] for message in search(users[0]['token'], 'hello')['messages']}
+    assert found == (set(sent[channel_ids[0]]) | set(sent[channel_ids[1]])) - set(removed)
+    found = search(users[0]['token'], 'edited')['messages']
+    assert {message['message_id'] for message in found} == edited
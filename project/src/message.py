@@ -1,9 +1,10 @@
 '''Relevant modules that allow us to give timestamps to when mesesages are sent, access global
 data variable and throw relevant errors '''
 from datetime import datetime, timezone
-import threading
 from error import InputError, AccessError
 from data import data
+from scheduler import schedule
+from schedule_store import store_msg_later
 from helper_functions import is_channel_owner, u_id_finder, channel_is_member
 from helper_functions import valid_token, valid_channel, message_send_future
 from helper_functions import channel_has_owner_permissions, is_user_in_channel
@@ -18,36 +19,33 @@ def message_send(token, channel_id, message, message_id=None):
 
     u_id = u_id_finder(token, data)
     #Access Error handling using helper function
-    is_channel_member = channel_is_member(channel_id, u_id, data)
-    if not is_channel_member:
+    if not valid_channel(channel_id, data):
         raise AccessError("User is not a member of given channel")
-    #Populating messages dictionary
-    if message_id is None:
-        total_msgs = 0
-        for channels in data['channels']:
-            total_msgs += len(data['msg_later_list']) + len(data['channels'][channels]['messages'])
-            if channels == channel_id:
-                msg_id = total_msgs + 1
-    else:
-        msg_id = message_id
-
-    #Time_created
-    curr_time = datetime.now()
-    timestamp = curr_time.replace(tzinfo=timezone.utc).timestamp()
-    #Populating the new messages dictionary
-    message_dict = {
-        'message_id': msg_id,
-        'u_id': u_id,
-        'message': message,
-        'time_created': timestamp,
-        'reacts': [],
-        'is_pinned': False
-    }
-
-    #Inserting into the messages data structure within global var data
-    msg_list = data['channels'][channel_id]['messages']
-    msg_list.insert(0, message_dict)
-    data['channels'][channel_id]['messages'] = msg_list
+    with data.channel_lock(channel_id):
+        is_channel_member = channel_is_member(channel_id, u_id, data)
+        if not is_channel_member:
+            raise AccessError("User is not a member of given channel")
+        #Populating messages dictionary
+        if message_id is None:
+            msg_id = data.next_message_id()
+        else:
+            msg_id = message_id
+
+        #Time_created
+        curr_time = datetime.now()
+        timestamp = curr_time.replace(tzinfo=timezone.utc).timestamp()
+        #Populating the new messages dictionary
+        message_dict = {
+            'message_id': msg_id,
+            'u_id': u_id,
+            'message': message,
+            'time_created': timestamp,
+            'reacts': {},
+            'is_pinned': False
+        }
+
+        #Inserting the message into its channel
+        data.add_message(channel_id, message_dict)
 
     return {
         'message_id': msg_id,
@@ -61,34 +59,24 @@ def message_remove(token, message_id):
 
     # InputError Handling
     # Also obtain u_id and channel_id
-    u_id_sender = ''
-    message_exists = False
-    for channel in data['channels']:
-        for message in data['channels'][channel]['messages']:
-            if message_id == message['message_id']:
-                message_exists = True
-                u_id_sender = message['u_id']
-                channel_id = channel
-                break
-
-    if not message_exists:
+    channel_id = data.message_channel(message_id)
+    if channel_id is None:
         raise InputError("Message no longer exists")
-
-    #AccessError handling
-    u_id = u_id_finder(token, data)
-    if data['users'][u_id]['permission_id'] == 2:
-        if (u_id != u_id_sender) and (not is_channel_owner(token, channel_id, data)):
-            raise AccessError("You do not have permissions to delete this message")
-
-    #Deletion
-    index = 0
-    for message in data['channels'][channel_id]['messages']:
-        if message_id == message['message_id']:
-            message_list = data['channels'][channel_id]['messages']
-            message_list.pop(index)
-            data['channels'][channel_id]['messages'] = message_list
-            break
-        index += 1
+    with data.channel_lock(channel_id):
+        # looked up again with the lock held, it may have been removed since
+        message_dict = data.get_message(message_id)
+        if message_dict is None:
+            raise InputError("Message no longer exists")
+        u_id_sender = message_dict['u_id']
+
+        #AccessError handling
+        u_id = u_id_finder(token, data)
+        if data.get_user(u_id)['permission_id'] == 2:
+            if (u_id != u_id_sender) and (not is_channel_owner(token, channel_id, data)):
+                raise AccessError("You do not have permissions to delete this message")
+
+        #Deletion
+        data.remove_message(message_id)
     return {
 
     }
@@ -98,24 +86,24 @@ def message_edit(token, message_id, message):
     Takes in token, message_id and message and updates the message's text with new text
     according to message given. If the new message is an empty string, the message is deleted.
     '''
-    # catching AccessError
-    u_id_sender = ''
-    for channel in data['channels']:
-        for message_dict in data['channels'][channel]['messages']:
-            if message_dict['message_id'] == message_id:
-                u_id_sender = message_dict['u_id']
-                channel_id = channel
-                break
+    # catching InputError
+    channel_id = data.message_channel(message_id)
+    if channel_id is None:
+        raise InputError("Message no longer exists")
+    with data.channel_lock(channel_id):
+        # looked up again with the lock held, it may have been removed since
+        message_dict = data.get_message(message_id)
+        if message_dict is None:
+            raise InputError("Message no longer exists")
 
-    u_id = u_id_finder(token, data)
-    if data['users'][u_id]['permission_id'] == 2:
-        if (u_id != u_id_sender) and (not is_channel_owner(token, channel_id, data)):
-            raise AccessError("You do not have permissions to delete this message")
+        # catching AccessError
+        u_id = u_id_finder(token, data)
+        if data.get_user(u_id)['permission_id'] == 2:
+            if (message_dict['u_id'] != u_id) and (not is_channel_owner(token, channel_id, data)):
+                raise AccessError("You do not have permissions to delete this message")
 
-    # edit the message in the data structure
-    for message_dict in data['channels'][channel_id]['messages']:
-        if message_dict['message_id'] == message_id:
-            message_dict['message'] = message
+        # edit the message in the data structure
+        data.update_message(message_id, message=message)
 
     return {}
 
@@ -142,28 +130,46 @@ def message_sendlater(token, channel_id, message, time_sent):
         raise AccessError("User is not a member of given channel")
 
     #Generating new message_id for future message
-    total_messages = 0
-    for channels in data['channels']:
-        total_messages += len(data['msg_later_list']) + len(data['channels'][channels]['messages'])
-        if channels == channel_id:
-            msg_id = total_messages + 1
+    msg_id = data.next_message_id()
 
     future_msg = {
         'message_id': msg_id,
-        'user_id': u_id,
+        'u_id': u_id,
+        'channel_id': channel_id,
         'message': message,
-        'time_created': time_sent,
-        'reacts': [],
-        'is_pinned': False
+        'time_sent': time_sent
     }
-    data['msg_later_list'].append(future_msg)
-    time_dif = time_sent - datetime.now(timezone.utc).timestamp()
-    time = threading.Timer(time_dif, message_send_future, [u_id, channel_id, message, msg_id, data])
-    time.start()
+    # recording the pending message (in memory and in the schedule store, so
+    # it is not lost if the server restarts) until message_send_future sends it
+    data.add_pending_message(future_msg)
+    store_msg_later(future_msg)
+    schedule(time_sent, message_send_future, [u_id, channel_id, message, msg_id, data])
     return {
         'message_id': future_msg['message_id']
     }
 
+def message_sendlater_pending(token):
+    '''
+    Returns the messages that the user with the token has sent with
+    message_sendlater which have not been sent to their channel yet, in the
+    order they will be sent
+    '''
+    u_id = u_id_finder(token, data)
+
+    pending_messages = []
+    for future_msg in data.pending_messages(u_id):
+        pending_messages.append({
+            'message_id': future_msg['message_id'],
+            'channel_id': future_msg['channel_id'],
+            'message': future_msg['message'],
+            'time_sent': future_msg['time_sent']
+        })
+    pending_messages.sort(key=lambda future_msg:
+                          (future_msg['time_sent'], future_msg['message_id']))
+    return {
+        'messages': pending_messages
+    }
+
 def message_react(token, message_id, react_id):
     '''
     Takes in token, message_id, and react_id to give a react to a message
@@ -174,38 +180,23 @@ def message_react(token, message_id, react_id):
 
     # invalid message_id
     channel_id = message_id_in_which_channel(message_id, data)
-    valid_message_id = is_user_in_channel(channel_id, u_id, data)
-
-    if not valid_message_id:
-        raise InputError("Message is not in a channel that the user is in.")
-
-    # invalid react_id
-    if react_id != 1:
-        raise InputError("Invalid react id")
-
-    # check whether message with message_id already contains an active react from the user
-    for message in data['channels'][channel_id]['messages']:
-        if message['message_id'] == message_id:
-            react_exists = False
-            for react in message['reacts']:
-                if react['react_id'] == react_id:
-                    react_exists = True
-                    if u_id in react['u_ids']:
-                        raise InputError("Message already contains an active react from the user")
-                    react['u_ids'].append(u_id)
-                    if message['u_id'] == u_id:
-                        react['is_this_user_reacted'] = True
-
-            if not react_exists:
-                react_dict = {
-                    'react_id': react_id,
-                    'u_ids': [],
-                    'is_this_user_reacted': False
-                }
-                if message['u_id'] == u_id:
-                    react_dict['is_this_user_reacted'] = True
-                react_dict['u_ids'].append(u_id)
-                message['reacts'].append(react_dict)
+    with data.channel_lock(channel_id):
+        # checked again with the lock held, it may have been removed since
+        message_id_in_which_channel(message_id, data)
+        valid_message_id = is_user_in_channel(channel_id, u_id, data)
+
+        if not valid_message_id:
+            raise InputError("Message is not in a channel that the user is in.")
+
+        # invalid react_id
+        if react_id != 1:
+            raise InputError("Invalid react id")
+
+        # check whether message with message_id already contains an active react from the user
+        message = data.get_message(message_id)
+        if u_id in message['reacts'].get(react_id, set()):
+            raise InputError("Message already contains an active react from the user")
+        data.add_react(message_id, react_id, u_id)
     return {}
 
 def message_unreact(token, message_id, react_id):
@@ -218,28 +209,23 @@ def message_unreact(token, message_id, react_id):
 
     # invalid message_id
     channel_id = message_id_in_which_channel(message_id, data)
-    valid_message_id = is_user_in_channel(channel_id, u_id, data)
-
-    if not valid_message_id:
-        raise InputError("Message is not in a channel that the user is in.")
-
-    # invalid react_id
-    if react_id != 1:
-        raise InputError("Invalid react id")
-
-    # message with message_id does not contain an active react from the user
-    for message in data['channels'][channel_id]['messages']:
-        if message['message_id'] == message_id:
-            if message['reacts'] == []:
-                raise InputError("Message does not contain an active react from the user")
-            for react in message['reacts']:
-                if react['react_id'] == react_id:
-                    if u_id in react['u_ids']:
-                        react['u_ids'].remove(u_id)
-                    else:
-                        raise InputError("Message does not contain an active react from the user")
-                    if message['u_id'] == u_id:
-                        react['is_this_user_reacted'] = False
+    with data.channel_lock(channel_id):
+        # checked again with the lock held, it may have been removed since
+        message_id_in_which_channel(message_id, data)
+        valid_message_id = is_user_in_channel(channel_id, u_id, data)
+
+        if not valid_message_id:
+            raise InputError("Message is not in a channel that the user is in.")
+
+        # invalid react_id
+        if react_id != 1:
+            raise InputError("Invalid react id")
+
+        # message with message_id does not contain an active react from the user
+        message = data.get_message(message_id)
+        if u_id not in message['reacts'].get(react_id, set()):
+            raise InputError("Message does not contain an active react from the user")
+        data.remove_react(message_id, react_id, u_id)
     return {}
 
 def message_pin(token, message_id):
@@ -251,24 +237,26 @@ def message_pin(token, message_id):
 
     # check whether user is an owner of the channel
     channel_id = message_id_in_which_channel(message_id, data)
-    is_user_owner = channel_has_owner_permissions(channel_id, u_id, data)
-
-    # check whether user is a member of the channel
-    if not is_user_owner:
-        raise AccessError("User has no permissions to pin message")
-
-    # invalid message_id
-    valid_message_id = is_user_in_channel(channel_id, u_id, data)
-
-    if not valid_message_id:
-        raise InputError("Message is not in a channel that the user is in.")
-
-    # check whether the message with message_id is already pinned or not
-    for message in data['channels'][channel_id]['messages']:
-        if message['message_id'] == message_id:
-            if message['is_pinned']:
-                raise InputError("Message is already pinned")
-            message['is_pinned'] = True
+    with data.channel_lock(channel_id):
+        # checked again with the lock held, it may have been removed since
+        message_id_in_which_channel(message_id, data)
+        is_user_owner = channel_has_owner_permissions(channel_id, u_id, data)
+
+        # check whether user is a member of the channel
+        if not is_user_owner:
+            raise AccessError("User has no permissions to pin message")
+
+        # invalid message_id
+        valid_message_id = is_user_in_channel(channel_id, u_id, data)
+
+        if not valid_message_id:
+            raise InputError("Message is not in a channel that the user is in.")
+
+        # check whether the message with message_id is already pinned or not
+        message = data.get_message(message_id)
+        if message['is_pinned']:
+            raise InputError("Message is already pinned")
+        data.update_message(message_id, is_pinned=True)
     return {}
 
 def message_unpin(token, message_id):
@@ -280,22 +268,24 @@ def message_unpin(token, message_id):
 
     # check whether user is an owner of the channel
     channel_id = message_id_in_which_channel(message_id, data)
-    is_user_owner = channel_has_owner_permissions(channel_id, u_id, data)
-
-    # check whether user is a member of the channel IF user is not an owner of the channel
-    if not is_user_owner:
-        raise AccessError("User has no permissions to unpin message")
-
-    # invalid message_id
-    valid_message_id = is_user_in_channel(channel_id, u_id, data)
-
-    if not valid_message_id:
-        raise InputError("Message is not in a channel that the user is in.")
-
-    # check whether the message with message_id is already unpinned or not
-    for message in data['channels'][channel_id]['messages']:
-        if message['message_id'] == message_id:
-            if not message['is_pinned']:
-                raise InputError("Message is already unpinned")
-            message['is_pinned'] = False
+    with data.channel_lock(channel_id):
+        # checked again with the lock held, it may have been removed since
+        message_id_in_which_channel(message_id, data)
+        is_user_owner = channel_has_owner_permissions(channel_id, u_id, data)
+
+        # check whether user is a member of the channel IF user is not an owner of the channel
+        if not is_user_owner:
+            raise AccessError("User has no permissions to unpin message")
+
+        # invalid message_id
+        valid_message_id = is_user_in_channel(channel_id, u_id, data)
+
+        if not valid_message_id:
+            raise InputError("Message is not in a channel that the user is in.")
+
+        # check whether the message with message_id is already unpinned or not
+        message = data.get_message(message_id)
+        if not message['is_pinned']:
+            raise InputError("Message is already unpinned")
+        data.update_message(message_id, is_pinned=False)
     return {}
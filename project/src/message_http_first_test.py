@@ -705,3 +705,43 @@ def test_message_sendlater_http_success(url):
     channel_messages = message_list.json()
     #The message should appear now
     assert channel_messages['messages'][0]['message'] == "Future message"
+
+def test_message_sendlater_pending_http(url):
+    '''Pending messages are listed until they are sent
+    '''
+    requests.delete(f'{url}/clear')
+    response1 = requests.post(f'{url}/auth/register', json={
+        'email': 'example@gmail.com',
+        'password':'12345678',
+        'name_first': 'john',
+        'name_last':'smith'
+    })
+    register_payload = response1.json()
+
+    response2 = requests.post(f'{url}/channels/create', json={
+        'token': register_payload['token'],
+        'name': 'channel1',
+        'is_public': True
+    })
+    channel_payload = response2.json()
+
+    future_time = datetime.now(timezone.utc).timestamp() + 2
+    response3 = requests.post(f'{url}/message/sendlater', json={
+        'token': register_payload['token'],
+        'channel_id': channel_payload['channel_id'],
+        'message': 'Future message',
+        'time_sent': future_time
+    })
+    future_message = response3.json()
+
+    response = requests.get(f"{url}/message/sendlater/pending?token={register_payload['token']}")
+    assert response.json()['messages'] == [{
+        'message_id': future_message['message_id'],
+        'channel_id': channel_payload['channel_id'],
+        'message': 'Future message',
+        'time_sent': future_time
+    }]
+
+    time.sleep(4)
+    response = requests.get(f"{url}/message/sendlater/pending?token={register_payload['token']}")
+    assert response.json()['messages'] == []
@@ -1,5 +1,6 @@
 '''Importing functions to test message.py'''
 import time
+import threading
 from datetime import datetime, timezone
 import pytest
 from auth import auth_register
@@ -9,6 +10,7 @@ from other import clear
 from error import InputError, AccessError
 from message import message_send, message_edit, message_remove, message_sendlater
 from message import message_react, message_unreact, message_pin, message_unpin
+from message import message_sendlater_pending
 
 # tests for message_send
 def test_message_send_input_error():
@@ -34,6 +36,13 @@ def test_message_send_access_error():
     with pytest.raises(AccessError):
         assert message_send(user2['token'], channel['channel_id'], message)
 
+def test_message_send_unknown_channel():
+    '''Raises AccessError if the channel does not exist'''
+    clear()
+    user = auth_register("examplemail1@gmail.com", "password1234", "bruce", "lee")
+    with pytest.raises(AccessError):
+        message_send(user['token'], 999, "hi")
+
 def test_message_send_invalid_token():
     '''raises InputError if invalid token is used to send message'''
     clear()
@@ -87,6 +96,43 @@ def test_message_send_multiple_messages():
     assert example_message_id3['message_id'] == 3
     assert message_list['messages'][0]['message'] == message3  # this has to be the most recent
 
+def test_message_send_unique_id_after_remove():
+    '''Checks that a message sent after a removal does not reuse the
+    message_id of a message that is still in the channel'''
+    clear()
+    user = auth_register("examplemail@gmail.com", "password1234", "bruce", "lee")
+    channel = channels_create(user['token'], 'channel_one', True)
+    message1 = message_send(user['token'], channel['channel_id'], "first")
+    message2 = message_send(user['token'], channel['channel_id'], "second")
+    message_remove(user['token'], message1['message_id'])
+    message3 = message_send(user['token'], channel['channel_id'], "third")
+
+    assert message3['message_id'] not in (message1['message_id'], message2['message_id'])
+    message_list = channel_messages(user['token'], channel['channel_id'], 0)
+    assert [msg['message'] for msg in message_list['messages']] == ["third", "second"]
+
+def test_message_send_unique_id_concurrent():
+    '''Checks that messages sent from several threads at once all get
+    different message_ids'''
+    clear()
+    user = auth_register("examplemail@gmail.com", "password1234", "bruce", "lee")
+    channel = channels_create(user['token'], 'channel_one', True)
+    message_ids = []
+
+    def send_messages():
+        for _ in range(100):
+            message = message_send(user['token'], channel['channel_id'], "hello")
+            message_ids.append(message['message_id'])
+
+    threads = [threading.Thread(target=send_messages) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(message_ids) == 800
+    assert len(set(message_ids)) == 800
+
 # tests for message_remove
 def test_message_remove_invalid_token():
     '''
@@ -213,6 +259,24 @@ def test_message_remove_multiple_messages():
     assert message_list['messages'][0]['message'] == message1
     assert message_list['messages'][0]['message_id'] == example_message_id1['message_id']
 
+def test_message_removed_cannot_be_used():
+    '''Once a message is removed, editing, reacting to, pinning or removing it
+    again raises InputError'''
+    clear()
+    user = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    channel = channels_create(user['token'], 'channel', True)
+    message = message_send(user['token'], channel['channel_id'], "what is up")
+    message_remove(user['token'], message['message_id'])
+
+    with pytest.raises(InputError):
+        assert message_edit(user['token'], message['message_id'], "hello")
+    with pytest.raises(InputError):
+        assert message_react(user['token'], message['message_id'], 1)
+    with pytest.raises(InputError):
+        assert message_pin(user['token'], message['message_id'])
+    with pytest.raises(InputError):
+        assert message_remove(user['token'], message['message_id'])
+
 # tests for message_edit
 def test_message_edit_invalid_token():
     '''
@@ -466,6 +530,49 @@ def test_message_sendlater_success_multiple():
             in_list = True
     assert in_list
 
+def test_message_sendlater_pending():
+    '''Pending messages of a user are listed in the order they will be sent,
+    and are removed from the list once they have been sent
+    '''
+    clear()
+    user1 = auth_register("ankitrai326@gmail.com", "12345678", "kobe", "bryant")
+    user2 = auth_register("ankitrai327@gmail.com", "12345678", "tom", "hardy")
+    channel = channels_create(user1['token'], 'channel', True)
+    channel_join(user2['token'], channel['channel_id'])
+    future_time1 = datetime.now(timezone.utc).timestamp() + 2
+    future_time2 = datetime.now(timezone.utc).timestamp() + 60
+
+    future_message2 = message_sendlater(user1['token'], channel['channel_id'], "ex2", future_time2)
+    future_message1 = message_sendlater(user1['token'], channel['channel_id'], "ex1", future_time1)
+    message_sendlater(user2['token'], channel['channel_id'], "other user", future_time1)
+
+    pending = message_sendlater_pending(user1['token'])
+    assert pending['messages'] == [
+        {
+            'message_id': future_message1['message_id'],
+            'channel_id': channel['channel_id'],
+            'message': "ex1",
+            'time_sent': future_time1
+        },
+        {
+            'message_id': future_message2['message_id'],
+            'channel_id': channel['channel_id'],
+            'message': "ex2",
+            'time_sent': future_time2
+        }
+    ]
+
+    time.sleep(4)
+    pending = message_sendlater_pending(user1['token'])
+    assert [message['message'] for message in pending['messages']] == ["ex2"]
+    assert message_sendlater_pending(user2['token'])['messages'] == []
+
+def test_message_sendlater_pending_invalid_token():
+    '''Raises AccessError if an invalid token is given'''
+    clear()
+    with pytest.raises(AccessError):
+        assert message_sendlater_pending("invalid")
+
 # tests for message_react
 def test_message_react_invalid_token():
     '''
@@ -542,6 +649,29 @@ def test_message_react_all_valid():
     message_list = channel_messages(user['token'], channel['channel_id'], start)
     assert user['u_id'] in message_list['messages'][0]['reacts'][0]['u_ids']
 
+def test_message_react_is_this_user_reacted():
+    '''
+    check that is_this_user_reacted is worked out for the user viewing the
+    messages, and that another user viewing the messages does not change it
+    '''
+    clear()
+    user1 = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    user2 = auth_register("ankitrai327@gmail.com", "12345678", "christian", "bale")
+    channel = channels_create(user1['token'], 'channel', True)
+    channel_join(user2['token'], channel['channel_id'])
+    message1 = message_send(user2['token'], channel['channel_id'], "what is up")
+    message_react(user1['token'], message1['message_id'], 1)
+
+    message_list1 = channel_messages(user1['token'], channel['channel_id'], 0)
+    message_list2 = channel_messages(user2['token'], channel['channel_id'], 0)
+    assert message_list1['messages'][0]['reacts'] == [
+        {'react_id': 1, 'u_ids': [user1['u_id']], 'is_this_user_reacted': True}
+    ]
+    assert message_list2['messages'][0]['reacts'] == [
+        {'react_id': 1, 'u_ids': [user1['u_id']], 'is_this_user_reacted': False}
+    ]
+    assert message_list1['messages'][0]['reacts'][0]['is_this_user_reacted']
+
 # tests for message_unreact
 def test_message_unreact_invalid_token():
     '''
@@ -2,14 +2,20 @@
 error imported to check for InputErrors and AccessErrors
 data imported for clear function
 datetime is used for finding the unix timestamps and finding the current time in standups
-threading is used for the buffering of standups
+heapq is used for keeping only the most recent matches of a search page
+scheduler is used for ending standups after their length
+schedule_store is used for saving standups so they still end after a restart
+data_log is used for keeping the in-memory data on disk
 '''
 from datetime import datetime, timezone
-import threading
+import heapq
 from error import InputError, AccessError
 from data import data
+from data_log import LoggedStorage
+from scheduler import schedule, cancel_all
+from schedule_store import store_standup, store_standup_message, clear_store
 from helper_functions import u_id_finder, valid_channel, channel_is_member
-from helper_functions import valid_user_id, standup_end
+from helper_functions import valid_user_id, standup_end, message_details, replay_schedule
 from user import user_profile
 
 def clear():
@@ -18,9 +24,35 @@ def clear():
     Used for tests
     Resets the internal data of the application to its initial state
     '''
-    data['users'].clear()
-    data['channels'].clear()
-    data['msg_later_list'].clear()
+    cancel_all()
+    clear_store()
+    data.clear()
+    return {}
+
+def schedule_replay():
+    '''
+    Schedules again the messages from message_sendlater and the standups that
+    were saved in the schedule store before the server restarted
+    '''
+    return replay_schedule(data)
+
+def data_log_open(directory):
+    '''
+    Loads the data saved in directory by the last run of the server, and
+    keeps every change from now on in it (the sqlite backend is already kept
+    on disk, so nothing is done for it)
+    '''
+    if isinstance(data.storage, LoggedStorage):
+        data.open_log(directory)
+    return {}
+
+def data_log_close():
+    '''
+    Writes every change not yet on disk to the directory opened by
+    data_log_open, used when the server stops
+    '''
+    if isinstance(data.storage, LoggedStorage):
+        data.close_log()
     return {}
 
 def users_all(token):
@@ -31,29 +63,24 @@ def users_all(token):
     details. This includes the user's user_id, email, first name, last name
     and handle
     '''
+    # checking for valid input token
+    if data.session_user(token) is None:
+        raise InputError('Invalid token entered')
+
     users_l = []
-    valid_token = False
     # looping through users and adding details to users list
-    for user in data['users']:
+    for user in data.all_users():
         user_detail = {
-            'u_id': data['users'][user]['u_id'],
-            'email': data['users'][user]['email'],
-            'name_first': data['users'][user]['name_first'],
-            'name_last': data['users'][user]['name_last'],
-            'handle_str': data['users'][user]['handle_str']
+            'u_id': user['u_id'],
+            'email': user['email'],
+            'name_first': user['name_first'],
+            'name_last': user['name_last'],
+            'handle_str': user['handle_str']
         }
-        if 'profile_img_url' in data['users'][user]:
-            user_detail['profile_img_url'] = data['users'][user]['profile_img_url']
+        if 'profile_img_url' in user:
+            user_detail['profile_img_url'] = user['profile_img_url']
         users_l.append(user_detail)
 
-        # checking for valid input token
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                valid_token = True
-
-    if not valid_token:
-        raise InputError('Invalid token entered')
-
     return {
         'users' : users_l
     }
@@ -71,38 +98,94 @@ def admin_userpermission_change(token, u_id, permission_id):
     admin = u_id_finder(token, data)
 
     # checking for owner permissions
-    if data['users'][admin]['permission_id'] == 2:
-        raise AccessError("Unauthorized user cannot change other's permissions")
-    if permission_id == 1 and data['users'][u_id]['permission_id'] == 1:
-        raise InputError("User is already an owner of flockr")
-    if permission_id == 2 and data['users'][u_id]['permission_id'] == 2:
-        raise InputError("User is already a member of flockr")
-
-    # checking for valid permission_id
-    if permission_id not in (2, 1):
-        raise InputError("Permission_id does not refer to a valid permission")
-
-    data['users'][u_id]['permission_id'] = permission_id
+    with data.users_lock:
+        if data.get_user(admin)['permission_id'] == 2:
+            raise AccessError("Unauthorized user cannot change other's permissions")
+        if permission_id == 1 and data.get_user(u_id)['permission_id'] == 1:
+            raise InputError("User is already an owner of flockr")
+        if permission_id == 2 and data.get_user(u_id)['permission_id'] == 2:
+            raise InputError("User is already a member of flockr")
+
+        # checking for valid permission_id
+        if permission_id not in (2, 1):
+            raise InputError("Permission_id does not refer to a valid permission")
+
+        data.update_user(u_id, permission_id=permission_id)
     return {}
 
-def search(token, query_str):
+def search(token, query_str, substring=False, limit=None, cursor=None):
     '''
     Search function takes in 2 parameters, token and query_str, which then
     returns a collection of messages in all of the channels that the user
-    has joined that match the query
+    has joined that have every word of the query (ignoring case), a word
+    ending with * matches any word starting with it. If substring is True,
+    the messages that contain query_str anywhere in their text (ignoring
+    case) are returned instead.
+    Messages are returned most recent first. If limit is given, at most limit
+    messages are returned and 'end' is the cursor to pass in for the next
+    page of results (or -1 if there are no more).
     '''
     # using helper function to find u_id from token, raises InputError if token is invalid
     u_id = u_id_finder(token, data)
 
-    matching_messages = []
-    #Find the channels that user is a part of
-    for channels in data['users'][u_id]['channel_membership']:
-        channel_id = channels['channel_id']
-    #Loop through the messages of every channel and see if we have a match
-        for messages in data['channels'][channel_id]['messages']:
-            if query_str == messages['message']:
-                matching_messages.append(messages)
-    return {'messages' : matching_messages}
+    if limit is not None and limit < 1:
+        raise InputError("Limit must be at least 1")
+    cursor_key = search_cursor_key(cursor)
+
+    # the channels that the user is a part of
+    channel_ids = {channels['channel_id'] for channels in data.user_channels(u_id)}
+
+    def matching_messages():
+        for message in data.search_messages(query_str, channel_ids, substring):
+            if cursor_key is None or search_key(message) < cursor_key:
+                yield message
+
+    with data.reading():
+        if limit is None:
+            matches = sorted(matching_messages(), key=search_key, reverse=True)
+        else:
+            # only the limit + 1 most recent matches are kept (the extra one shows
+            # whether there is another page) rather than every match
+            matches = heapq.nlargest(limit + 1, matching_messages(), key=search_key)
+
+        end = -1
+        if limit is not None and len(matches) > limit:
+            matches = matches[:limit]
+            time_created, message_id = search_key(matches[-1])
+            end = f'{time_created!r}:{message_id}'
+        return {
+            'messages': [message_details(message, u_id) for message in matches],
+            'end': end
+        }
+
+def search_key(message):
+    '''
+    Used by search to order messages, most recent first, with message_id
+    deciding between messages created at the same time
+    '''
+    return (message['time_created'], message['message_id'])
+
+def search_cursor_key(cursor):
+    '''
+    Used by search, turns a cursor ('end' of the previous page) back into the
+    search_key of the last message of the previous page
+    '''
+    if cursor is None:
+        return None
+    try:
+        time_created, message_id = str(cursor).split(':')
+        return (float(time_created), int(message_id))
+    except ValueError as err:
+        raise InputError("Invalid cursor") from err
+
+def search_substring_index():
+    '''
+    Turns on the trigram index used by search with substring=True, so it only
+    checks the messages that might contain query_str instead of every message
+    in the user's channels
+    '''
+    data.use_trigram_index(True)
+    return {}
 
 def standup_start(token, channel_id, length):
     '''
@@ -127,24 +210,23 @@ def standup_start(token, channel_id, length):
     if length < 0:
         raise InputError("Standup cannot be started with invalid length")
 
-    #check it is active
-    if standup_active(token, channel_id)['is_active']:
-        raise InputError("A standup is running in this channel.")
-
-    time_finish = datetime.now(timezone.utc).timestamp() + length
-    data['channels'][channel_id]['standup'] = {
-        'messages': [],
-        'time_finish': time_finish
-    }
+    with data.channel_lock(channel_id):
+        #check it is active
+        if standup_active(token, channel_id)['is_active']:
+            raise InputError("A standup is running in this channel.")
 
-    total_messages = 0
-    for channels in data['channels']:
-        total_messages += len(data['msg_later_list']) + len(data['channels'][channels]['messages'])
-        if channels == channel_id:
-            msg_id = total_messages + 1
+        time_finish = datetime.now(timezone.utc).timestamp() + length
+        msg_id = data.next_message_id()
+        data.start_standup(channel_id, {
+            'messages': [],
+            'time_finish': time_finish,
+            'u_id': uid,
+            'message_id': msg_id
+        })
 
-    time = threading.Timer(length, standup_end, [channel_id, token, msg_id, data])
-    time.start()
+        # saving the standup so it still ends if the server restarts
+        store_standup(channel_id, uid, msg_id, time_finish)
+        schedule(time_finish, standup_end, [channel_id, uid, msg_id, data])
     return {
         'time_finish': time_finish
     }
@@ -166,9 +248,10 @@ def standup_active(token, channel_id):
         raise AccessError("User is not a member of channel")
 
     #check if there is an active standup
-    if 'standup' in data['channels'][channel_id]:
+    standup = data.get_standup(channel_id)
+    if standup is not None:
         is_active = True
-        time_finish = data['channels'][channel_id]['standup']['time_finish']
+        time_finish = standup['time_finish']
     else:
         is_active = False
         time_finish = None
@@ -195,13 +278,15 @@ def standup_send(token, channel_id, message):
     if len(message) > 1000:
         raise InputError("The message can not be more than 1000 characters.")
 
-    #check standup is active
-    if not standup_active(token, channel_id)['is_active']:
-        raise InputError("This channel is not running a standup now.")
+    with data.channel_lock(channel_id):
+        #check standup is active
+        if not standup_active(token, channel_id)['is_active']:
+            raise InputError("This channel is not running a standup now.")
 
-    user = user_profile(token, u_id)
-    standup_msg = f"{user['user']['handle_str']}: " + message
-    data['channels'][channel_id]['standup']['messages'].append(standup_msg)
+        user = user_profile(token, u_id)
+        standup_msg = f"{user['user']['handle_str']}: " + message
+        data.add_standup_message(channel_id, standup_msg)
+        store_standup_message(channel_id, standup_msg)
 
     return {
 
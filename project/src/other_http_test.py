@@ -375,11 +375,77 @@ def test_search_http_multiple_channels(url):
             'channel_id': channel['channel_id'],
             'message': "Not to be returned"
         })
-        correct_list += messages['messages']
+        # most recent first, so messages in later channels come first
+        correct_list = messages['messages'] + correct_list
     response = requests.get(f"{url}/search?token={user['token']}&query_str=Testing")
     matched_list = response.json()
     assert matched_list['messages'] == correct_list
 
+def test_search_http_substring(url):
+    '''
+    Messages containing the query_str are returned when substring is true
+    '''
+    requests.delete(f'{url}/clear')
+    response = requests.post(f'{url}/auth/register', json={
+        'email': 'ankitrai326@gmail.com',
+        'password': '12345678',
+        'name_first': 'tom',
+        'name_last': 'hardy'
+    })
+    user = response.json()
+    response = requests.post(f'{url}/channels/create', json={
+        'token': user['token'],
+        'name': 'channel',
+        'is_public': True
+    })
+    channel = response.json()
+    requests.post(f'{url}/message/send', json={
+        'token': user['token'],
+        'channel_id': channel['channel_id'],
+        'message': "Testing"
+    })
+    response = requests.get(f"{url}/search?token={user['token']}&query_str=esti")
+    assert response.json()['messages'] == []
+    response = requests.get(f"{url}/search?token={user['token']}&query_str=esti&substring=true")
+    assert [message['message'] for message in response.json()['messages']] == ["Testing"]
+
+def test_search_http_limit_cursor(url):
+    '''
+    Results are returned a page of limit messages at a time
+    '''
+    requests.delete(f'{url}/clear')
+    response = requests.post(f'{url}/auth/register', json={
+        'email': 'ankitrai326@gmail.com',
+        'password': '12345678',
+        'name_first': 'tom',
+        'name_last': 'hardy'
+    })
+    user = response.json()
+    response = requests.post(f'{url}/channels/create', json={
+        'token': user['token'],
+        'name': 'channel',
+        'is_public': True
+    })
+    channel = response.json()
+    for i in range(3):
+        requests.post(f'{url}/message/send', json={
+            'token': user['token'],
+            'channel_id': channel['channel_id'],
+            'message': f"Testing {i}"
+        })
+    search_url = f"{url}/search?token={user['token']}&query_str=Testing&limit=2"
+    response = requests.get(search_url)
+    page = response.json()
+    assert [message['message'] for message in page['messages']] == ["Testing 2", "Testing 1"]
+
+    response = requests.get(search_url, params={'cursor': page['end']})
+    page = response.json()
+    assert [message['message'] for message in page['messages']] == ["Testing 0"]
+    assert page['end'] == -1
+
+    response = requests.get(f"{search_url}&cursor=invalid")
+    assert response.status_code == 400
+
 # standup_start tests
 def test_standup_start_invalid_channel_id(url):
     '''
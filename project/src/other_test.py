@@ -8,9 +8,10 @@ from channels import channels_create
 from channel import channel_join, channel_messages
 from error import InputError, AccessError
 from other import admin_userpermission_change, users_all, clear, search
-from other import standup_start, standup_active, standup_send
-from message import message_send
+from other import standup_start, standup_active, standup_send, search_substring_index
+from message import message_send, message_edit, message_remove
 from user import user_profile
+from data import data
 
 # Tests for admin_userpermission_change:
 def test_admin_userpermission_change_invalid_uid():
@@ -188,11 +189,165 @@ def test_search_multiple_channels():
         message_send(user['token'], channel['channel_id'], "Testing")
         messages = channel_messages(user['token'], channel['channel_id'], 0)
         message_send(user['token'], channel['channel_id'], "Not to be returned")
-        correct_list += messages['messages']
+        # most recent first, so messages in later channels come first
+        correct_list = messages['messages'] + correct_list
 
     matched_list = search(user['token'], "Testing")
     assert matched_list['messages'] == correct_list
 
+def test_search_words():
+    '''
+    Messages with every word of the query match, ignoring case and the order
+    of the words
+    '''
+    clear()
+    user = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+    channel = channels_create(user['token'], 'channel_one', True)
+    message_send(user['token'], channel['channel_id'], "Hello world")
+    message_send(user['token'], channel['channel_id'], "the WORLD says hello!")
+    message_send(user['token'], channel['channel_id'], "hello there")
+
+    matched_list = search(user['token'], "world hello")
+    assert [message['message'] for message in matched_list['messages']] == \
+        ["the WORLD says hello!", "Hello world"]
+    assert search(user['token'], "worlds")['messages'] == []
+    assert search(user['token'], "  ")['messages'] == []
+
+def test_search_prefix():
+    '''
+    A query word ending with * matches words starting with it
+    '''
+    clear()
+    user = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+    channel = channels_create(user['token'], 'channel_one', True)
+    message_send(user['token'], channel['channel_id'], "Testing")
+    message_send(user['token'], channel['channel_id'], "tested it")
+    message_send(user['token'], channel['channel_id'], "a test")
+    message_send(user['token'], channel['channel_id'], "contest")
+
+    matched_list = search(user['token'], "TEST*")
+    assert [message['message'] for message in matched_list['messages']] == \
+        ["a test", "tested it", "Testing"]
+    assert len(search(user['token'], "test* it")['messages']) == 1
+
+def test_search_edit_remove():
+    '''
+    Edited and removed messages are found by their new text only
+    '''
+    clear()
+    user = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+    channel = channels_create(user['token'], 'channel_one', True)
+    msg1 = message_send(user['token'], channel['channel_id'], "old text")
+    msg2 = message_send(user['token'], channel['channel_id'], "old news")
+
+    message_edit(user['token'], msg1['message_id'], "new text")
+    message_remove(user['token'], msg2['message_id'])
+    assert search(user['token'], "old")['messages'] == []
+    matched_list = search(user['token'], "new")
+    assert [message['message_id'] for message in matched_list['messages']] == \
+        [msg1['message_id']]
+
+def test_search_not_member():
+    '''
+    Messages in channels the user is not a member of are not returned
+    '''
+    clear()
+    user1 = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+    user2 = auth_register("examplenoodle2@gmail.com", "easypass", "Bruce", "Lee")
+    channel1 = channels_create(user1['token'], 'channel_one', True)
+    channel2 = channels_create(user2['token'], 'channel_two', True)
+    message_send(user1['token'], channel1['channel_id'], "shared word")
+    message_send(user2['token'], channel2['channel_id'], "shared word")
+
+    assert len(search(user1['token'], "shared")['messages']) == 1
+    channel_join(user1['token'], channel2['channel_id'])
+    assert len(search(user1['token'], "shared")['messages']) == 2
+
+def test_search_limit_cursor():
+    '''
+    Results are returned a page of limit messages at a time, most recent first
+    across every channel, following 'end' until it is -1
+    '''
+    clear()
+    user = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+    channel1 = channels_create(user['token'], 'channel_one', True)
+    channel2 = channels_create(user['token'], 'channel_two', True)
+    message_ids = []
+    for i in range(7):
+        channel = channel1 if i % 2 else channel2
+        msg = message_send(user['token'], channel['channel_id'], f"Testing {i}")
+        message_ids.append(msg['message_id'])
+    message_ids.reverse()
+
+    assert [message['message_id'] for message in search(user['token'], "testing")['messages']] \
+        == message_ids
+    assert search(user['token'], "testing")['end'] == -1
+
+    pages = []
+    cursor = None
+    while cursor != -1:
+        result = search(user['token'], "testing", limit=3, cursor=cursor)
+        pages.append([message['message_id'] for message in result['messages']])
+        cursor = result['end']
+    assert pages == [message_ids[0:3], message_ids[3:6], message_ids[6:7]]
+
+    result = search(user['token'], "testing", limit=7)
+    assert len(result['messages']) == 7
+    assert result['end'] == -1
+
+def test_search_limit_cursor_invalid():
+    '''
+    Raises InputError if the limit is less than 1 or the cursor is invalid
+    '''
+    clear()
+    user = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+    with pytest.raises(InputError):
+        search(user['token'], "testing", limit=0)
+    with pytest.raises(InputError):
+        search(user['token'], "testing", limit=5, cursor="not a cursor")
+
+def test_search_substring():
+    '''
+    With substring=True, messages containing the query anywhere match, with
+    or without the trigram index turned on
+    '''
+    for trigram_index in (False, True):
+        clear()
+        data.use_trigram_index(False)
+        if trigram_index:
+            search_substring_index()
+        user = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+        channel = channels_create(user['token'], 'channel_one', True)
+        message_send(user['token'], channel['channel_id'], "Testing")
+        msg = message_send(user['token'], channel['channel_id'], "the contest")
+        message_send(user['token'], channel['channel_id'], "nothing here")
+
+        matched_list = search(user['token'], "EST", True)
+        assert [message['message'] for message in matched_list['messages']] == \
+            ["the contest", "Testing"]
+        assert [message['message'] for message in search(user['token'], "e c", True)['messages']] \
+            == ["the contest"]
+        assert len(search(user['token'], "t", True)['messages']) == 3
+        assert search(user['token'], "", True)['messages'] == []
+
+        message_edit(user['token'], msg['message_id'], "changed")
+        assert len(search(user['token'], "est", True)['messages']) == 1
+    data.use_trigram_index(False)
+
+def test_search_substring_index_existing_messages():
+    '''
+    Messages sent before the trigram index is turned on are found by it
+    '''
+    clear()
+    data.use_trigram_index(False)
+    user = auth_register("examplenoodle@gmail.com", "easypass", "Michelle", "Seeto")
+    channel = channels_create(user['token'], 'channel_one', True)
+    message_send(user['token'], channel['channel_id'], "Testing")
+    search_substring_index()
+    assert len(search(user['token'], "sting", True)['messages']) == 1
+    assert search(user['token'], "stings", True)['messages'] == []
+    data.use_trigram_index(False)
+
 # Tests for standup_start
 def test_standup_start_invalid_channel_id():
     '''
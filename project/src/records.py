@@ -0,0 +1,143 @@
+'''
+Record types the in-memory storage backends keep users, channels and
+messages in, instead of one dictionary each. A class with __slots__ keeps
+its fields in a fixed array rather than a hash table, which is most of the
+memory of a small record when there are millions of messages.
+sys module provides intern, so names repeated across users are kept once
+types module provides the read-only empty mapping shared by every message
+with no reacts
+'''
+import sys
+from types import MappingProxyType
+
+# the reacts of a message that has none, a real dict is only made for a
+# message once it is reacted to
+NO_REACTS = MappingProxyType({})
+
+class Record:
+    '''
+    Base of the records. Fields are read with record[field] like the
+    dictionaries of the Storage interface, an optional field that is not set
+    raises KeyError and is not in the record. Only storage backends change
+    records, through their attributes.
+    '''
+    __slots__ = ()
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __contains__(self, field):
+        return hasattr(self, field)
+
+    def get(self, field, default=None):
+        '''Returns the field, or default if it is not set'''
+        return getattr(self, field, default)
+
+    def fields(self):
+        '''Returns the names of the fields that are set, in order'''
+        return [field for field in self.__slots__ if hasattr(self, field)]
+
+    def update(self, changes):
+        '''Changes the fields in the dictionary changes'''
+        for field, value in changes.items():
+            setattr(self, field, value)
+
+    def to_dict(self):
+        '''Returns the fields that are set as a dictionary'''
+        return {field: getattr(self, field) for field in self.fields()}
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+class UserRecord(Record):
+    '''
+    A user, with the optional fields profile_img_url and reset_code, and
+    channel_membership (a dict with the channel_id of each channel the user
+    is in as keys, in the order they were joined)
+    '''
+    __slots__ = ('u_id', 'email', 'password', 'name_first', 'name_last', 'handle_str',
+                 'permission_id', 'profile_img_url', 'reset_code', 'channel_membership')
+
+    def __init__(self, user):
+        for field in ('u_id', 'email', 'password', 'handle_str', 'permission_id'):
+            setattr(self, field, user[field])
+        self.set_name(user['name_first'], user['name_last'])
+        if 'profile_img_url' in user:
+            self.profile_img_url = user['profile_img_url']
+        self.channel_membership = {}
+
+    def set_name(self, name_first, name_last):
+        '''Changes the name of the user, names are interned as many users share them'''
+        self.name_first = sys.intern(name_first)
+        self.name_last = sys.intern(name_last)
+
+    def update(self, changes):
+        '''See Record.update, names are interned'''
+        super().update(changes)
+        self.set_name(self.name_first, self.name_last)
+
+class ChannelRecord(Record):
+    '''
+    A channel, with the sets owner_members and all_members, its messages
+    (oldest first), the optional field standup while one is running, and
+    message_seqs and last_seq for the backends that index messages
+    '''
+    __slots__ = ('channel_id', 'name', 'creator', 'is_public', 'owner_members', 'all_members',
+                 'messages', 'standup', 'message_seqs', 'last_seq')
+
+    def __init__(self, channel):
+        self.channel_id = channel['channel_id']
+        self.name = sys.intern(channel['name'])
+        self.creator = channel['creator']
+        self.is_public = channel['is_public']
+        self.owner_members = set()
+        self.all_members = set()
+        self.messages = []
+
+class MessageRecord(Record):
+    '''
+    A message. reacts is NO_REACTS until the message is first reacted to,
+    channel_id and seq are set by the backends that index messages
+    '''
+    __slots__ = ('message_id', 'u_id', 'message', 'time_created', 'reacts', 'is_pinned',
+                 'channel_id', 'seq')
+
+    def __init__(self, message):
+        self.message_id = message['message_id']
+        self.u_id = message['u_id']
+        self.message = message['message']
+        self.time_created = message['time_created']
+        self.reacts = {react_id: set(u_ids) for react_id, u_ids in message['reacts'].items()} \
+            if message['reacts'] else NO_REACTS
+        self.is_pinned = message['is_pinned']
+
+    def add_react(self, react_id, u_id):
+        '''Adds u_id to the users that reacted with react_id'''
+        if self.reacts is NO_REACTS:
+            self.reacts = {}
+        self.reacts.setdefault(react_id, set()).add(u_id)
+
+    def remove_react(self, react_id, u_id):
+        '''Removes u_id from the users that reacted with react_id'''
+        self.reacts.get(react_id, set()).discard(u_id)
+
+    def __getstate__(self):
+        # NO_REACTS cannot be pickled, it is saved as None
+        state = self.to_dict()
+        if self.reacts is NO_REACTS:
+            state['reacts'] = None
+        return None, state
+
+    def __setstate__(self, state):
+        for field, value in state[1].items():
+            setattr(self, field, value)
+        if self.reacts is None:
+            self.reacts = NO_REACTS
@@ -0,0 +1,66 @@
+'''Importing the record types to test records.py'''
+import pickle
+import tracemalloc
+import pytest
+from records import UserRecord, MessageRecord, NO_REACTS
+
+def new_message(message_id):
+    '''Returns a message as the modules pass it to the storage'''
+    return {
+        'message_id': message_id,
+        'u_id': 1,
+        'message': 'hello world',
+        'time_created': 1600000000.0 + message_id,
+        'reacts': {},
+        'is_pinned': False
+    }
+
+def test_records_read_like_dicts():
+    '''Records are read the same way as the dictionaries they replace'''
+    user = UserRecord({
+        'u_id': 1,
+        'email': 'bruce@gmail.com',
+        'password': 'password1234',
+        'name_first': 'bruce',
+        'name_last': 'lee',
+        'handle_str': 'brucelee',
+        'permission_id': 1
+    })
+    assert user['name_first'] == 'bruce'
+    assert 'profile_img_url' not in user
+    assert user.get('profile_img_url') is None
+    with pytest.raises(KeyError):
+        user['profile_img_url'] # pylint: disable=pointless-statement
+    user.update({'profile_img_url': 'http://localhost/photo.jpg'})
+    assert user['profile_img_url'] == 'http://localhost/photo.jpg'
+
+    message = MessageRecord(new_message(1))
+    assert message.to_dict() == new_message(1)
+    assert message['reacts'] is NO_REACTS
+    message.add_react(1, 2)
+    assert message['reacts'] == {1: {2}}
+    assert MessageRecord(new_message(1))['reacts'] is NO_REACTS
+
+def test_records_pickle():
+    '''Records are saved in snapshots and loaded back the same'''
+    message = MessageRecord(new_message(1))
+    reacted = MessageRecord(new_message(2))
+    reacted.add_react(1, 1)
+    loaded, loaded_reacted = pickle.loads(pickle.dumps([message, reacted]))
+    assert loaded == message
+    assert loaded['reacts'] is NO_REACTS
+    assert loaded_reacted == reacted
+
+def bytes_per_message(make_message, count=10000):
+    '''Returns the memory allocated for each of count messages made by make_message'''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = [make_message(new_message(message_id)) for message_id in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(messages) == count
+    return (after - before) / count
+
+def test_records_memory():
+    '''A message record takes less than half the memory of the dictionary it replaces'''
+    assert bytes_per_message(MessageRecord) * 2 < bytes_per_message(dict)
@@ -0,0 +1,155 @@
+'''
+On-disk store for the messages from message_sendlater that have not been
+sent yet and the standups that are running, so they are not lost when the
+server restarts (see replay_schedule in helper_functions)
+sqlite3 module provides the database file the schedule is kept in
+threading module provides a lock as the store is used by request threads and
+the scheduler thread
+'''
+import sqlite3
+import threading
+
+# the store is only used once open_store has been called (by server.py), until
+# then every function here does nothing
+STORE = {
+    'connection': None
+}
+STORE_LOCK = threading.Lock()
+
+def open_store(path):
+    '''
+    Opens (or creates) the schedule store at path
+    '''
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('''CREATE TABLE IF NOT EXISTS msg_later (
+        message_id INTEGER PRIMARY KEY,
+        u_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        time_sent REAL NOT NULL
+    )''')
+    connection.execute('''CREATE TABLE IF NOT EXISTS standups (
+        channel_id INTEGER PRIMARY KEY,
+        u_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        time_finish REAL NOT NULL
+    )''')
+    connection.execute('''CREATE TABLE IF NOT EXISTS standup_messages (
+        position INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id INTEGER NOT NULL,
+        message TEXT NOT NULL
+    )''')
+    connection.commit()
+    with STORE_LOCK:
+        STORE['connection'] = connection
+
+def close_store():
+    '''
+    Closes the schedule store, if it is open
+    '''
+    with STORE_LOCK:
+        if STORE['connection'] is not None:
+            STORE['connection'].close()
+            STORE['connection'] = None
+
+def store_write(statements):
+    '''
+    Used by the functions below, runs each (sql, parameters) in statements
+    and commits them together
+    '''
+    with STORE_LOCK:
+        connection = STORE['connection']
+        if connection is None:
+            return
+        with connection:
+            for sql, parameters in statements:
+                connection.execute(sql, parameters)
+
+def store_msg_later(future_msg):
+    '''
+    Saves a message from message_sendlater that has not been sent yet
+    '''
+    store_write([(
+        'INSERT OR REPLACE INTO msg_later VALUES (?, ?, ?, ?, ?)',
+        (future_msg['message_id'], future_msg['u_id'], future_msg['channel_id'],
+         future_msg['message'], future_msg['time_sent'])
+    )])
+
+def unstore_msg_later(message_id):
+    '''
+    Removes a message from message_sendlater once it has been sent
+    '''
+    store_write([('DELETE FROM msg_later WHERE message_id = ?', (message_id,))])
+
+def store_standup(channel_id, u_id, message_id, time_finish):
+    '''
+    Saves a standup that has been started in the channel with channel_id
+    '''
+    store_write([
+        ('DELETE FROM standup_messages WHERE channel_id = ?', (channel_id,)),
+        ('INSERT OR REPLACE INTO standups VALUES (?, ?, ?, ?)',
+         (channel_id, u_id, message_id, time_finish))
+    ])
+
+def store_standup_message(channel_id, message):
+    '''
+    Saves a message sent to the standup running in the channel with channel_id
+    '''
+    store_write([(
+        'INSERT INTO standup_messages (channel_id, message) VALUES (?, ?)',
+        (channel_id, message)
+    )])
+
+def unstore_standup(channel_id):
+    '''
+    Removes the standup of the channel with channel_id (and its messages) once
+    it has ended
+    '''
+    store_write([
+        ('DELETE FROM standup_messages WHERE channel_id = ?', (channel_id,)),
+        ('DELETE FROM standups WHERE channel_id = ?', (channel_id,))
+    ])
+
+def clear_store():
+    '''
+    Removes everything from the schedule store (used by clear)
+    '''
+    store_write([
+        ('DELETE FROM msg_later', ()),
+        ('DELETE FROM standups', ()),
+        ('DELETE FROM standup_messages', ())
+    ])
+
+def stored_schedule():
+    '''
+    Returns the saved messages from message_sendlater and the saved standups
+    (each with the messages sent to it, in order) as a dictionary
+    '''
+    with STORE_LOCK:
+        if STORE['connection'] is None:
+            return {'msg_later': [], 'standups': []}
+        connection = STORE['connection']
+        msg_later = []
+        for row in connection.execute('SELECT * FROM msg_later ORDER BY time_sent'):
+            msg_later.append({
+                'message_id': row[0],
+                'u_id': row[1],
+                'channel_id': row[2],
+                'message': row[3],
+                'time_sent': row[4]
+            })
+        standups = []
+        for row in connection.execute('SELECT * FROM standups ORDER BY time_finish'):
+            messages = connection.execute(
+                'SELECT message FROM standup_messages WHERE channel_id = ? ORDER BY position',
+                (row[0],)
+            )
+            standups.append({
+                'channel_id': row[0],
+                'u_id': row[1],
+                'message_id': row[2],
+                'time_finish': row[3],
+                'messages': [message[0] for message in messages]
+            })
+    return {'msg_later': msg_later, 'standups': standups}
@@ -0,0 +1,101 @@
+'''Importing functions to test schedule_store.py and replaying the schedule'''
+import time
+from datetime import datetime, timezone
+from auth import auth_register
+from channels import channels_create
+from channel import channel_messages
+from message import message_sendlater, message_sendlater_pending
+from other import clear, standup_start, standup_send, standup_active, schedule_replay
+from scheduler import cancel_all
+from schedule_store import open_store, close_store, stored_schedule
+from data import data
+
+def restart():
+    '''Loses the schedule kept in memory, like the server stopping would'''
+    cancel_all()
+    for user in data.all_users():
+        for future_msg in data.pending_messages(user['u_id']):
+            data.remove_pending_message(future_msg['message_id'])
+    for channel in data.all_channels():
+        if data.get_standup(channel['channel_id']) is not None:
+            data.end_standup(channel['channel_id'])
+
+def test_schedule_store_saved(tmp_path):
+    '''Messages from message_sendlater and standups are saved until they are sent'''
+    open_store(str(tmp_path / 'schedule.db'))
+    try:
+        clear()
+        user = auth_register("examplemail@gmail.com", "password1234", "bruce", "lee")
+        channel = channels_create(user['token'], 'channel_one', True)
+        time_sent = datetime.now(timezone.utc).timestamp() + 0.5
+        msg = message_sendlater(user['token'], channel['channel_id'], "later", time_sent)
+        standup_start(user['token'], channel['channel_id'], 0.5)
+        standup_send(user['token'], channel['channel_id'], "hello")
+
+        saved = stored_schedule()
+        assert [future_msg['message_id'] for future_msg in saved['msg_later']] == \
+            [msg['message_id']]
+        assert saved['standups'][0]['channel_id'] == channel['channel_id']
+        assert saved['standups'][0]['messages'] == ["brucelee: hello"]
+
+        time.sleep(1)
+        assert stored_schedule() == {'msg_later': [], 'standups': []}
+    finally:
+        close_store()
+
+def test_schedule_replay_overdue(tmp_path):
+    '''Messages and standups that were due while the server was down are all
+    sent when the schedule is replayed'''
+    open_store(str(tmp_path / 'schedule.db'))
+    try:
+        clear()
+        user = auth_register("examplemail@gmail.com", "password1234", "bruce", "lee")
+        channel = channels_create(user['token'], 'channel_one', True)
+        time_sent = datetime.now(timezone.utc).timestamp() + 0.2
+        msg1 = message_sendlater(user['token'], channel['channel_id'], "first", time_sent)
+        msg2 = message_sendlater(user['token'], channel['channel_id'], "second", time_sent)
+        standup_start(user['token'], channel['channel_id'], 0.2)
+        standup_send(user['token'], channel['channel_id'], "hello")
+        restart()
+
+        time.sleep(0.5)
+        messages = channel_messages(user['token'], channel['channel_id'], 0)['messages']
+        assert messages == []
+
+        assert schedule_replay() == 3
+        time.sleep(0.2)
+        messages = channel_messages(user['token'], channel['channel_id'], 0)['messages']
+        assert [message['message'] for message in messages] == \
+            ["brucelee: hello", "second", "first"]
+        assert {message['message_id'] for message in messages} >= \
+            {msg1['message_id'], msg2['message_id']}
+        assert not standup_active(user['token'], channel['channel_id'])['is_active']
+        assert stored_schedule() == {'msg_later': [], 'standups': []}
+    finally:
+        close_store()
+
+def test_schedule_replay_pending(tmp_path):
+    '''Messages and standups that are not due yet are scheduled again, and
+    new message_ids are not the same as the replayed ones'''
+    open_store(str(tmp_path / 'schedule.db'))
+    try:
+        clear()
+        user = auth_register("examplemail@gmail.com", "password1234", "bruce", "lee")
+        channel = channels_create(user['token'], 'channel_one', True)
+        time_sent = datetime.now(timezone.utc).timestamp() + 0.5
+        msg = message_sendlater(user['token'], channel['channel_id'], "later", time_sent)
+        standup_start(user['token'], channel['channel_id'], 0.5)
+        restart()
+
+        assert schedule_replay() == 2
+        assert standup_active(user['token'], channel['channel_id'])['is_active']
+        pending = message_sendlater_pending(user['token'])['messages']
+        assert [future_msg['message_id'] for future_msg in pending] == [msg['message_id']]
+        assert data.next_message_id() > msg['message_id']
+
+        time.sleep(1)
+        messages = channel_messages(user['token'], channel['channel_id'], 0)['messages']
+        assert len(messages) == 2
+        assert message_sendlater_pending(user['token'])['messages'] == []
+    finally:
+        close_store()
@@ -0,0 +1,120 @@
+'''
+Scheduler used to run functions at a given time in the future (used for
+message_sendlater and standups)
+heapq module provides the min-heap of scheduled jobs ordered by time
+threading module provides the single scheduler thread and the condition it
+waits on until the next job is due
+datetime is used for finding the current unix timestamp
+logging module reports the jobs that fail, with their traceback
+'''
+from datetime import datetime, timezone
+import heapq
+import logging
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+# every scheduled job is run by one thread, instead of one threading.Timer
+# (and one sleeping thread) per job
+SCHEDULE_CONDITION = threading.Condition()
+SCHEDULE = {
+    'heap': [],
+    'jobs': {},
+    'last_job_id': 0,
+    'thread': None
+}
+
+'''
+Note on usage:
+
+- SCHEDULE['heap'] is a min-heap of (time_due, job_id) so the next job due is
+  SCHEDULE['heap'][0]
+- SCHEDULE['jobs'][job_id] = (function, args) for every job that has not run
+  yet, a cancelled job is removed from SCHEDULE['jobs'] and skipped when its
+  time_due comes up in the heap
+'''
+
+def schedule(time_due, function, args):
+    '''
+    Schedules function(*args) to be run at time_due (a unix timestamp) by the
+    scheduler thread and returns the job_id of the scheduled job. If time_due
+    is in the past, the job is run as soon as possible.
+    '''
+    with SCHEDULE_CONDITION:
+        SCHEDULE['last_job_id'] += 1
+        job_id = SCHEDULE['last_job_id']
+        SCHEDULE['jobs'][job_id] = (function, args)
+        heapq.heappush(SCHEDULE['heap'], (time_due, job_id))
+
+        if SCHEDULE['thread'] is None:
+            SCHEDULE['thread'] = threading.Thread(target=run_scheduler, daemon=True)
+            SCHEDULE['thread'].start()
+        # wakes up the scheduler thread in case this job is due before the job
+        # it is waiting for
+        SCHEDULE_CONDITION.notify()
+    return job_id
+
+def cancel(job_id):
+    '''
+    Cancels the job with job_id so that it is never run. Returns True if the
+    job was cancelled, or False if it has already run or been cancelled.
+    '''
+    with SCHEDULE_CONDITION:
+        if job_id not in SCHEDULE['jobs']:
+            return False
+        del SCHEDULE['jobs'][job_id]
+
+        # cancelled jobs are left in the heap until they are due, the heap is
+        # rebuilt once most of it is cancelled jobs so it does not keep growing
+        if len(SCHEDULE['heap']) > 2 * len(SCHEDULE['jobs']) + 64:
+            SCHEDULE['heap'] = [job for job in SCHEDULE['heap'] if job[1] in SCHEDULE['jobs']]
+            heapq.heapify(SCHEDULE['heap'])
+        SCHEDULE_CONDITION.notify()
+    return True
+
+def cancel_all():
+    '''
+    Cancels every job that has not run yet (used by clear)
+    '''
+    with SCHEDULE_CONDITION:
+        SCHEDULE['heap'].clear()
+        SCHEDULE['jobs'].clear()
+        SCHEDULE_CONDITION.notify()
+
+def next_due_job():
+    '''
+    Used by the scheduler thread, waits until the next job is due, removes it
+    from the schedule and returns its (function, args)
+    '''
+    with SCHEDULE_CONDITION:
+        while True:
+            if not SCHEDULE['heap']:
+                SCHEDULE_CONDITION.wait()
+                continue
+
+            time_due, job_id = SCHEDULE['heap'][0]
+            if job_id not in SCHEDULE['jobs']:
+                # job has been cancelled
+                heapq.heappop(SCHEDULE['heap'])
+                continue
+
+            time_left = time_due - datetime.now(timezone.utc).timestamp()
+            if time_left > 0:
+                SCHEDULE_CONDITION.wait(time_left)
+                continue
+
+            heapq.heappop(SCHEDULE['heap'])
+            return SCHEDULE['jobs'].pop(job_id)
+
+def run_scheduler():
+    '''
+    Runs on the scheduler thread, running each job when it is due
+    '''
+    while True:
+        function, args = next_due_job()
+        try:
+            function(*args)
+        except Exception: # pylint: disable=broad-except
+            # a job that fails (e.g. its channel has been cleared) must not
+            # stop the jobs after it from running
+            LOGGER.exception('scheduled job %s failed', function.__name__)
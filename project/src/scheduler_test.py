@@ -0,0 +1,64 @@
+'''Importing functions to test scheduler.py'''
+import time
+import threading
+from datetime import datetime, timezone
+from scheduler import schedule, cancel, cancel_all
+
+def test_schedule_runs_in_time_order():
+    '''Jobs are run once they are due, in the order of their time_due and not
+    the order they were scheduled in'''
+    cancel_all()
+    results = []
+    now = datetime.now(timezone.utc).timestamp()
+    schedule(now + 0.6, results.append, ['third'])
+    schedule(now + 0.2, results.append, ['first'])
+    schedule(now + 0.4, results.append, ['second'])
+
+    assert results == []
+    time.sleep(1)
+    assert results == ['first', 'second', 'third']
+
+def test_schedule_past_time():
+    '''A job with a time_due in the past is run straight away'''
+    cancel_all()
+    results = []
+    schedule(datetime.now(timezone.utc).timestamp() - 10, results.append, ['late'])
+    time.sleep(0.2)
+    assert results == ['late']
+
+def test_cancel():
+    '''A cancelled job is never run, and cannot be cancelled twice'''
+    cancel_all()
+    results = []
+    now = datetime.now(timezone.utc).timestamp()
+    job_id = schedule(now + 0.2, results.append, ['cancelled'])
+    schedule(now + 0.3, results.append, ['kept'])
+
+    assert cancel(job_id)
+    assert not cancel(job_id)
+    time.sleep(0.6)
+    assert results == ['kept']
+    assert not cancel(12345)
+
+def test_failing_job(caplog):
+    '''A job that raises an error does not stop the jobs after it, and is logged'''
+    cancel_all()
+    results = []
+    now = datetime.now(timezone.utc).timestamp()
+    schedule(now + 0.1, results.remove, ['not in list'])
+    schedule(now + 0.2, results.append, ['after'])
+    time.sleep(0.5)
+    assert results == ['after']
+    failures = [record for record in caplog.records if 'remove failed' in record.getMessage()]
+    assert len(failures) == 1
+    assert failures[0].exc_info[0] is ValueError
+
+def test_single_thread():
+    '''Scheduling many jobs does not start a thread per job'''
+    cancel_all()
+    thread_count = threading.active_count()
+    now = datetime.now(timezone.utc).timestamp()
+    job_ids = [schedule(now + 60, print, ['never run']) for _ in range(1000)]
+    assert threading.active_count() <= thread_count + 1
+    for job_id in job_ids:
+        assert cancel(job_id)
@@ -1,12 +1,14 @@
 '''
+os module is used to read the FLOCKR_DATA and FLOCKR_SCHEDULE environment variables
 re module is used to substitute and cut off end of base url
 dumps from json module is used as a format of returning values in flask
 flask module is used to run app (flask server)
 all functions from all files are imported into here for flask implementation
 '''
+import os
 import re
 from json import dumps
-from flask import Flask, request, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
 from auth import auth_register, auth_login, auth_logout
 from auth import auth_passwordreset_request, auth_passwordreset_reset
@@ -17,9 +19,12 @@ from channel import channel_leave, channel_join, channel_addowner, channel_remov
 from channels import channels_list, channels_listall, channels_create
 from message import message_send, message_edit, message_remove, message_sendlater
 from message import message_react, message_unreact, message_pin, message_unpin
+from message import message_sendlater_pending
 from other import clear, users_all, admin_userpermission_change, search
-from other import standup_send, standup_start, standup_active
+from other import standup_send, standup_start, standup_active, schedule_replay
+from other import search_substring_index, data_log_open, data_log_close
 from error import InputError
+from schedule_store import open_store
 
 def default_handler(err):
     '''
@@ -143,8 +148,10 @@ def channel_messages_http():
     payload = request.args
     token = payload['token']
     channel_id = int(payload['channel_id'])
-    start = int(payload['start'])
-    result = channel_messages(token, channel_id, start)
+    start = int(payload.get('start', 0))
+    before_message_id = payload.get('before_message_id', type=int)
+    after_message_id = payload.get('after_message_id', type=int)
+    result = channel_messages(token, channel_id, start, before_message_id, after_message_id)
     return dumps(result)
 
 @APP.route('/channel/leave', methods=['POST'])
@@ -348,6 +355,16 @@ def message_sendlater_http():
     result = message_sendlater(token, channel_id, message, time_sent)
     return dumps(result)
 
+@APP.route('/message/sendlater/pending', methods=['GET'])
+def message_sendlater_pending_http():
+    '''
+    message_sendlater_pending_http function based on message_sendlater_pending function
+    '''
+    payload = request.args
+    token = payload['token']
+    result = message_sendlater_pending(token)
+    return dumps(result)
+
 @APP.route('/message/react', methods=['POST'])
 def message_react_http():
     '''
@@ -418,16 +435,34 @@ def admin_userpermission_change_http():
     result = admin_userpermission_change(token, u_id, permission_id)
     return dumps(result)
 
+# number of messages in a page of /search if no limit is given, and the most
+# that can be asked for, so a search never holds more than this many results
+SEARCH_PAGE_SIZE = 50
+SEARCH_LIMIT_MAX = 1000
+
 @APP.route('/search', methods=['GET'])
 def search_http():
     '''
-    search_http function based on search function
+    search_http function based on search function, the page of results is
+    streamed one message at a time rather than built into one string
     '''
     payload = request.args
     token = payload['token']
     query_str = payload['query_str']
-    result = search(token, query_str)
-    return dumps(result)
+    substring = payload.get('substring', 'false').lower() == 'true'
+    limit = min(payload.get('limit', SEARCH_PAGE_SIZE, type=int), SEARCH_LIMIT_MAX)
+    cursor = payload.get('cursor')
+    result = search(token, query_str, substring, limit, cursor)
+    return Response(stream_search(result), mimetype='application/json')
+
+def stream_search(result):
+    '''
+    Yields the result of search as JSON, one message at a time
+    '''
+    yield '{"messages": ['
+    for position, message in enumerate(result['messages']):
+        yield (', ' if position else '') + dumps(message)
+    yield '], "end": ' + dumps(result['end']) + '}'
 
 @APP.route('/clear', methods=['DELETE'])
 def clear_http():
@@ -472,5 +507,27 @@ def standup_send_http():
     result = standup_send(token, channel_id, message)
     return dumps(result)
 
+# directory the in-memory data is kept in, as snapshots and a log of changes,
+# e.g. FLOCKR_DATA=/var/flockr_data python3 src/server.py (none is kept if it
+# is not set)
+DATA_LOG_DIR = os.environ.get('FLOCKR_DATA')
+# file the messages from message_sendlater and standups are saved in, e.g.
+# FLOCKR_SCHEDULE=/var/schedule.db python3 src/server.py (none are saved if
+# it is not set)
+SCHEDULE_STORE_PATH = os.environ.get('FLOCKR_SCHEDULE')
+# whether search with substring=true is narrowed down by the trigram index,
+# which uses more memory for every message sent
+TRIGRAM_INDEX = True
+
 if __name__ == '__main__':
-    APP.run(port=0)
+    if DATA_LOG_DIR:
+        data_log_open(DATA_LOG_DIR)
+    if SCHEDULE_STORE_PATH:
+        open_store(SCHEDULE_STORE_PATH)
+    if TRIGRAM_INDEX:
+        search_substring_index()
+    schedule_replay()
+    try:
+        APP.run(port=0)
+    finally:
+        data_log_close()
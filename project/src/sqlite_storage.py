@@ -0,0 +1,627 @@
+'''
+Storage backend that keeps the data of flockr in an SQLite database file, so
+it survives a restart and does not need to fit in memory
+sqlite3 module provides the database
+threading module provides a lock as the one connection is used by request
+threads and the scheduler thread
+'''
+import sqlite3
+import threading
+from storage import Storage
+from helper_functions import normalise_email, message_terms, query_terms
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    u_id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    email_key TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    name_first TEXT NOT NULL,
+    name_last TEXT NOT NULL,
+    handle_str TEXT NOT NULL UNIQUE,
+    permission_id INTEGER NOT NULL,
+    profile_img_url TEXT,
+    reset_code TEXT UNIQUE
+);
+CREATE TABLE IF NOT EXISTS handle_suffixes (
+    base_handle TEXT PRIMARY KEY,
+    handle TEXT NOT NULL,
+    alphabet INTEGER NOT NULL,
+    replace_position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    u_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    creator INTEGER NOT NULL,
+    is_public INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    UNIQUE (channel_id, u_id)
+);
+CREATE INDEX IF NOT EXISTS members_by_user ON members (u_id, position);
+CREATE TABLE IF NOT EXISTS owners (
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, u_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id INTEGER NOT NULL UNIQUE,
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    time_created REAL NOT NULL,
+    is_pinned INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_channel ON messages (channel_id, seq);
+CREATE TABLE IF NOT EXISTS message_reacts (
+    message_id INTEGER NOT NULL,
+    react_id INTEGER NOT NULL,
+    PRIMARY KEY (message_id, react_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS reacts (
+    message_id INTEGER NOT NULL,
+    react_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    PRIMARY KEY (message_id, react_id, u_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS message_terms (
+    term TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (term, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS message_terms_by_message ON message_terms (message_id);
+CREATE TABLE IF NOT EXISTS msg_later (
+    message_id INTEGER PRIMARY KEY,
+    u_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    time_sent REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS msg_later_by_user ON msg_later (u_id);
+CREATE TABLE IF NOT EXISTS standups (
+    channel_id INTEGER PRIMARY KEY,
+    u_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    time_finish REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS standup_messages (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS standup_messages_by_channel ON standup_messages (channel_id, position);
+INSERT OR IGNORE INTO meta VALUES ('last_message_id', 0);
+'''
+
+# columns of the users and messages tables that update_user and
+# update_message can change
+USER_COLUMNS = ('email', 'password', 'name_first', 'name_last', 'handle_str',
+                'permission_id', 'profile_img_url')
+MESSAGE_COLUMNS = ('message', 'is_pinned')
+USER_SELECT = ('SELECT u_id, email, password, name_first, name_last, handle_str, '
+               'permission_id, profile_img_url FROM users')
+MESSAGE_SELECT = 'SELECT message_id, u_id, message, time_created, is_pinned FROM messages'
+# number of rows fetched at a time by search_messages
+SEARCH_BATCH = 500
+
+class SqliteStorage(Storage):
+    '''
+    Keeps everything in the SQLite database at path (in WAL mode, so reads are
+    not blocked by writes). Every lookup is an indexed query: sessions by
+    token, users by email_key (the normalised email) and handle_str, members
+    by (channel_id, u_id) and (u_id, position), messages by message_id and
+    (channel_id, seq), and search terms by (term, message_id). seq keeps the
+    order messages were added to their channel, as message_ids are not in
+    that order (e.g. messages from message_sendlater).
+
+    Each method runs as one transaction, under a lock as the connection is
+    shared by every thread. There is no trigram index, substring searches
+    check the messages of the user's channels.
+    '''
+
+    def __init__(self, path):
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False,
+                                          cached_statements=256)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA foreign_keys=OFF')
+        # the same lowercase as str.lower, which SQLite's lower does not match
+        # for letters outside ASCII
+        self.connection.create_function('py_lower', 1, str.lower, deterministic=True)
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        '''Closes the database'''
+        with self.lock:
+            self.connection.close()
+
+    def query(self, sql, parameters=()):
+        '''Returns every row of the query sql'''
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def query_one(self, sql, parameters=()):
+        '''Returns the first row of the query sql, or None'''
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchone()
+
+    def write(self, statements):
+        '''Runs each (sql, parameters) in statements in one transaction'''
+        with self.lock, self.connection:
+            for sql, parameters in statements:
+                self.connection.execute(sql, parameters)
+
+    def clear(self):
+        '''See Storage.clear'''
+        tables = ('users', 'handle_suffixes', 'sessions', 'channels', 'members', 'owners',
+                  'messages', 'message_reacts', 'reacts', 'message_terms', 'msg_later',
+                  'standups', 'standup_messages')
+        statements = [(f'DELETE FROM {table}', ()) for table in tables]
+        statements.append(("UPDATE meta SET value = 0 WHERE key = 'last_message_id'", ()))
+        statements.append(("DELETE FROM sqlite_sequence", ()))
+        self.write(statements)
+
+    # users
+    @staticmethod
+    def user_from_row(row):
+        '''Returns the user stored in a row of the users table'''
+        if row is None:
+            return None
+        user = {
+            'u_id': row[0],
+            'email': row[1],
+            'password': row[2],
+            'name_first': row[3],
+            'name_last': row[4],
+            'handle_str': row[5],
+            'permission_id': row[6]
+        }
+        if row[7] is not None:
+            user['profile_img_url'] = row[7]
+        return user
+
+    def add_user(self, user):
+        '''See Storage.add_user'''
+        self.write([(
+            'INSERT INTO users (u_id, email, email_key, password, name_first, name_last, '
+            'handle_str, permission_id, profile_img_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (user['u_id'], user['email'], normalise_email(user['email']), user['password'],
+             user['name_first'], user['name_last'], user['handle_str'],
+             user['permission_id'], user.get('profile_img_url'))
+        )])
+
+    def get_user(self, u_id):
+        '''See Storage.get_user'''
+        if not isinstance(u_id, int):
+            return None
+        return self.user_from_row(self.query_one(f'{USER_SELECT} WHERE u_id = ?', (u_id,)))
+
+    def update_user(self, u_id, **changes):
+        '''See Storage.update_user'''
+        columns = [column for column in USER_COLUMNS if column in changes]
+        values = [changes[column] for column in columns]
+        if 'email' in changes:
+            columns.append('email_key')
+            values.append(normalise_email(changes['email']))
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        self.write([(f'UPDATE users SET {assignments} WHERE u_id = ?', (*values, u_id))])
+
+    def user_count(self):
+        '''See Storage.user_count'''
+        return self.query_one('SELECT COUNT(*) FROM users')[0]
+
+    def all_users(self):
+        '''See Storage.all_users'''
+        return [self.user_from_row(row)
+                for row in self.query(f'{USER_SELECT} ORDER BY u_id')]
+
+    def user_by_email(self, email):
+        '''See Storage.user_by_email'''
+        row = self.query_one('SELECT u_id FROM users WHERE email_key = ?',
+                             (normalise_email(email),))
+        return None if row is None else row[0]
+
+    def user_by_handle(self, handle_str):
+        '''See Storage.user_by_handle'''
+        row = self.query_one('SELECT u_id FROM users WHERE handle_str = ?', (handle_str,))
+        return None if row is None else row[0]
+
+    def handle_suffix(self, base_handle):
+        '''See Storage.handle_suffix'''
+        row = self.query_one('SELECT handle, alphabet, replace_position FROM handle_suffixes '
+                             'WHERE base_handle = ?', (base_handle,))
+        return None if row is None else tuple(row)
+
+    def set_handle_suffix(self, base_handle, suffix):
+        '''See Storage.set_handle_suffix'''
+        self.write([('INSERT OR REPLACE INTO handle_suffixes VALUES (?, ?, ?, ?)',
+                     (base_handle, *suffix))])
+
+    # sessions and reset codes
+    def add_session(self, token, u_id):
+        '''See Storage.add_session'''
+        self.write([('INSERT INTO sessions VALUES (?, ?)', (token, u_id))])
+
+    def session_user(self, token):
+        '''See Storage.session_user'''
+        if not isinstance(token, str):
+            return None
+        row = self.query_one('SELECT u_id FROM sessions WHERE token = ?', (token,))
+        return None if row is None else row[0]
+
+    def remove_session(self, token):
+        '''See Storage.remove_session'''
+        if not isinstance(token, str):
+            return False
+        with self.lock, self.connection:
+            return self.connection.execute('DELETE FROM sessions WHERE token = ?',
+                                           (token,)).rowcount > 0
+
+    def set_reset_code(self, u_id, reset_code):
+        '''See Storage.set_reset_code'''
+        self.write([('UPDATE users SET reset_code = ? WHERE u_id = ?', (reset_code, u_id))])
+
+    def reset_code_user(self, reset_code):
+        '''See Storage.reset_code_user'''
+        row = self.query_one('SELECT u_id FROM users WHERE reset_code = ?', (reset_code,))
+        return None if row is None else row[0]
+
+    def remove_reset_code(self, reset_code):
+        '''See Storage.remove_reset_code'''
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT u_id FROM users WHERE reset_code = ?',
+                                          (reset_code,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE users SET reset_code = NULL WHERE u_id = ?',
+                                    (row[0],))
+            return row[0]
+
+    # channels
+    @staticmethod
+    def channel_from_row(row):
+        '''Returns the channel stored in a row of the channels table'''
+        if row is None:
+            return None
+        return {
+            'channel_id': row[0],
+            'name': row[1],
+            'creator': row[2],
+            'is_public': bool(row[3])
+        }
+
+    def add_channel(self, channel):
+        '''See Storage.add_channel'''
+        self.write([('INSERT INTO channels VALUES (?, ?, ?, ?)',
+                     (channel['channel_id'], channel['name'], channel['creator'],
+                      channel['is_public']))])
+
+    def get_channel(self, channel_id):
+        '''See Storage.get_channel'''
+        if not isinstance(channel_id, int):
+            return None
+        return self.channel_from_row(self.query_one(
+            'SELECT channel_id, name, creator, is_public FROM channels WHERE channel_id = ?',
+            (channel_id,)
+        ))
+
+    def channel_count(self):
+        '''See Storage.channel_count'''
+        return self.query_one('SELECT COUNT(*) FROM channels')[0]
+
+    def all_channels(self):
+        '''See Storage.all_channels'''
+        return [self.channel_from_row(row) for row in self.query(
+            'SELECT channel_id, name, creator, is_public FROM channels ORDER BY channel_id'
+        )]
+
+    def add_member(self, channel_id, u_id):
+        '''See Storage.add_member'''
+        self.write([('INSERT OR IGNORE INTO members (channel_id, u_id) VALUES (?, ?)',
+                     (channel_id, u_id))])
+
+    def remove_member(self, channel_id, u_id):
+        '''See Storage.remove_member'''
+        self.write([
+            ('DELETE FROM members WHERE channel_id = ? AND u_id = ?', (channel_id, u_id)),
+            ('DELETE FROM owners WHERE channel_id = ? AND u_id = ?', (channel_id, u_id))
+        ])
+
+    def add_owner(self, channel_id, u_id):
+        '''See Storage.add_owner'''
+        self.write([('INSERT OR IGNORE INTO owners VALUES (?, ?)', (channel_id, u_id))])
+
+    def remove_owner(self, channel_id, u_id):
+        '''See Storage.remove_owner'''
+        self.write([('DELETE FROM owners WHERE channel_id = ? AND u_id = ?',
+                     (channel_id, u_id))])
+
+    def is_member(self, channel_id, u_id):
+        '''See Storage.is_member'''
+        return self.query_one('SELECT 1 FROM members WHERE channel_id = ? AND u_id = ?',
+                              (channel_id, u_id)) is not None
+
+    def is_owner(self, channel_id, u_id):
+        '''See Storage.is_owner'''
+        return self.query_one('SELECT 1 FROM owners WHERE channel_id = ? AND u_id = ?',
+                              (channel_id, u_id)) is not None
+
+    def channel_members(self, channel_id):
+        '''See Storage.channel_members'''
+        return {row[0] for row in self.query('SELECT u_id FROM members WHERE channel_id = ?',
+                                             (channel_id,))}
+
+    def channel_owners(self, channel_id):
+        '''See Storage.channel_owners'''
+        return {row[0] for row in self.query('SELECT u_id FROM owners WHERE channel_id = ?',
+                                             (channel_id,))}
+
+    def user_channels(self, u_id):
+        '''See Storage.user_channels'''
+        return [{'channel_id': row[0], 'name': row[1]} for row in self.query(
+            'SELECT channels.channel_id, channels.name FROM members '
+            'JOIN channels ON channels.channel_id = members.channel_id '
+            'WHERE members.u_id = ? ORDER BY members.position', (u_id,)
+        )]
+
+    # messages
+    def next_message_id(self):
+        '''See Storage.next_message_id'''
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE meta SET value = value + 1 WHERE key = 'last_message_id'"
+            )
+            return self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'last_message_id'"
+            ).fetchone()[0]
+
+    def reserve_message_id(self, message_id):
+        '''See Storage.reserve_message_id'''
+        self.write([("UPDATE meta SET value = MAX(value, ?) WHERE key = 'last_message_id'",
+                     (message_id,))])
+
+    def terms_statements(self, message_id, text):
+        '''Returns the statements adding the search terms of text for the message'''
+        return [('INSERT OR IGNORE INTO message_terms VALUES (?, ?)', (term, message_id))
+                for term in message_terms(text)]
+
+    def add_message(self, channel_id, message):
+        '''See Storage.add_message'''
+        statements = [(
+            'INSERT INTO messages (message_id, channel_id, u_id, message, time_created, '
+            'is_pinned) VALUES (?, ?, ?, ?, ?, ?)',
+            (message['message_id'], channel_id, message['u_id'], message['message'],
+             message['time_created'], message['is_pinned'])
+        )]
+        statements += self.terms_statements(message['message_id'], message['message'])
+        self.write(statements)
+
+    def messages_from_rows(self, rows):
+        '''
+        Returns the messages stored in rows of the messages table (selected
+        with MESSAGE_SELECT), with their reacts
+        '''
+        messages = [{
+            'message_id': row[0],
+            'u_id': row[1],
+            'message': row[2],
+            'time_created': row[3],
+            'reacts': {},
+            'is_pinned': bool(row[4])
+        } for row in rows]
+        if not messages:
+            return messages
+        by_id = {message['message_id']: message for message in messages}
+        placeholders = ', '.join('?' * len(by_id))
+        for message_id, react_id in self.query(
+                'SELECT message_id, react_id FROM message_reacts '
+                f'WHERE message_id IN ({placeholders}) ORDER BY react_id', tuple(by_id)):
+            by_id[message_id]['reacts'][react_id] = set()
+        for message_id, react_id, u_id in self.query(
+                'SELECT message_id, react_id, u_id FROM reacts '
+                f'WHERE message_id IN ({placeholders})',
+                tuple(by_id)):
+            by_id[message_id]['reacts'][react_id].add(u_id)
+        return messages
+
+    def get_message(self, message_id):
+        '''See Storage.get_message'''
+        if not isinstance(message_id, int):
+            return None
+        messages = self.messages_from_rows(self.query(
+            f'{MESSAGE_SELECT} WHERE message_id = ?', (message_id,)
+        ))
+        return messages[0] if messages else None
+
+    def message_channel(self, message_id):
+        '''See Storage.message_channel'''
+        if not isinstance(message_id, int):
+            return None
+        row = self.query_one('SELECT channel_id FROM messages WHERE message_id = ?',
+                             (message_id,))
+        return None if row is None else row[0]
+
+    def update_message(self, message_id, **changes):
+        '''See Storage.update_message, a changed text is indexed again'''
+        columns = [column for column in MESSAGE_COLUMNS if column in changes]
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        statements = [(f'UPDATE messages SET {assignments} WHERE message_id = ?',
+                       (*[changes[column] for column in columns], message_id))]
+        if 'message' in changes:
+            statements.append(('DELETE FROM message_terms WHERE message_id = ?', (message_id,)))
+            statements += self.terms_statements(message_id, changes['message'])
+        self.write(statements)
+
+    def add_react(self, message_id, react_id, u_id):
+        '''See Storage.add_react'''
+        self.write([
+            ('INSERT OR IGNORE INTO message_reacts VALUES (?, ?)', (message_id, react_id)),
+            ('INSERT OR IGNORE INTO reacts VALUES (?, ?, ?)', (message_id, react_id, u_id))
+        ])
+
+    def remove_react(self, message_id, react_id, u_id):
+        '''See Storage.remove_react'''
+        self.write([('DELETE FROM reacts WHERE message_id = ? AND react_id = ? AND u_id = ?',
+                     (message_id, react_id, u_id))])
+
+    def remove_message(self, message_id):
+        '''See Storage.remove_message'''
+        self.write([
+            (f'DELETE FROM {table} WHERE message_id = ?', (message_id,))
+            for table in ('messages', 'message_reacts', 'reacts', 'message_terms')
+        ])
+
+    def message_count(self, channel_id):
+        '''See Storage.message_count'''
+        return self.query_one('SELECT COUNT(*) FROM messages WHERE channel_id = ?',
+                              (channel_id,))[0]
+
+    def channel_messages(self, channel_id, start, count):
+        '''See Storage.channel_messages'''
+        return self.messages_from_rows(self.query(
+            f'{MESSAGE_SELECT} WHERE channel_id = ? ORDER BY seq DESC LIMIT ? OFFSET ?',
+            (channel_id, count, start)
+        ))
+
+    def messages_before(self, message_id, count):
+        '''See Storage.messages_before, read from messages_by_channel starting at the message'''
+        channel_id, seq = self.query_one('SELECT channel_id, seq FROM messages '
+                                         'WHERE message_id = ?', (message_id,))
+        return self.messages_from_rows(self.query(
+            f'{MESSAGE_SELECT} WHERE channel_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?',
+            (channel_id, seq, count)
+        ))
+
+    def messages_after(self, message_id, count):
+        '''See Storage.messages_after, read from messages_by_channel starting at the message'''
+        channel_id, seq = self.query_one('SELECT channel_id, seq FROM messages '
+                                         'WHERE message_id = ?', (message_id,))
+        return self.messages_from_rows(self.query(
+            f'{MESSAGE_SELECT} WHERE channel_id = ? AND seq > ? ORDER BY seq LIMIT ?',
+            (channel_id, seq, count)
+        ))[::-1]
+
+    def search_messages(self, query_str, channel_ids, substring=False):
+        '''
+        See Storage.search_messages, word searches use the message_terms
+        table, a term ending with * is a range of it
+        '''
+        channel_ids = [channel_id for channel_id in channel_ids if isinstance(channel_id, int)]
+        if not channel_ids:
+            return
+        sql = f"{MESSAGE_SELECT} WHERE channel_id IN ({', '.join('?' * len(channel_ids))})"
+        parameters = list(channel_ids)
+        if substring:
+            if not query_str:
+                return
+            sql += ' AND instr(py_lower(message), ?) > 0'
+            parameters.append(query_str.lower())
+        else:
+            terms = query_terms(query_str)
+            if not terms:
+                return
+            for term in sorted(terms):
+                if term.endswith('*'):
+                    # search terms are letters, digits and underscores, none
+                    # of which are special to GLOB
+                    sql += ' AND message_id IN (SELECT message_id FROM message_terms ' \
+                           'WHERE term GLOB ?)'
+                else:
+                    sql += ' AND message_id IN (SELECT message_id FROM message_terms ' \
+                           'WHERE term = ?)'
+                parameters.append(term)
+
+        with self.lock:
+            cursor = self.connection.execute(sql, parameters)
+            rows = cursor.fetchmany(SEARCH_BATCH)
+        while rows:
+            yield from self.messages_from_rows(rows)
+            with self.lock:
+                rows = cursor.fetchmany(SEARCH_BATCH)
+
+    def use_trigram_index(self, enabled):
+        '''See Storage.use_trigram_index, there is no trigram index here'''
+
+    # pending messages and standups
+    def add_pending_message(self, future_msg):
+        '''See Storage.add_pending_message'''
+        self.write([('INSERT OR REPLACE INTO msg_later VALUES (?, ?, ?, ?, ?)',
+                     (future_msg['message_id'], future_msg['u_id'], future_msg['channel_id'],
+                      future_msg['message'], future_msg['time_sent']))])
+
+    def remove_pending_message(self, message_id):
+        '''See Storage.remove_pending_message'''
+        with self.lock, self.connection:
+            return self.connection.execute('DELETE FROM msg_later WHERE message_id = ?',
+                                           (message_id,)).rowcount > 0
+
+    def pending_messages(self, u_id):
+        '''See Storage.pending_messages'''
+        return [{
+            'message_id': row[0],
+            'u_id': row[1],
+            'channel_id': row[2],
+            'message': row[3],
+            'time_sent': row[4]
+        } for row in self.query('SELECT message_id, u_id, channel_id, message, time_sent '
+                                'FROM msg_later WHERE u_id = ?', (u_id,))]
+
+    def start_standup(self, channel_id, standup):
+        '''See Storage.start_standup'''
+        statements = [
+            ('DELETE FROM standup_messages WHERE channel_id = ?', (channel_id,)),
+            ('INSERT OR REPLACE INTO standups VALUES (?, ?, ?, ?)',
+             (channel_id, standup['u_id'], standup['message_id'], standup['time_finish']))
+        ]
+        statements += [('INSERT INTO standup_messages (channel_id, message) VALUES (?, ?)',
+                        (channel_id, message)) for message in standup['messages']]
+        self.write(statements)
+
+    def get_standup(self, channel_id):
+        '''See Storage.get_standup'''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT u_id, message_id, time_finish FROM standups WHERE channel_id = ?',
+                (channel_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            messages = self.connection.execute(
+                'SELECT message FROM standup_messages WHERE channel_id = ? ORDER BY position',
+                (channel_id,)
+            ).fetchall()
+        return {
+            'messages': [message[0] for message in messages],
+            'time_finish': row[2],
+            'u_id': row[0],
+            'message_id': row[1]
+        }
+
+    def add_standup_message(self, channel_id, message):
+        '''See Storage.add_standup_message'''
+        self.write([('INSERT INTO standup_messages (channel_id, message) VALUES (?, ?)',
+                     (channel_id, message))])
+
+    def end_standup(self, channel_id):
+        '''See Storage.end_standup'''
+        with self.lock:
+            standup = self.get_standup(channel_id)
+            self.write([
+                ('DELETE FROM standup_messages WHERE channel_id = ?', (channel_id,)),
+                ('DELETE FROM standups WHERE channel_id = ?', (channel_id,))
+            ])
+        return standup
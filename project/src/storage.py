@@ -0,0 +1,879 @@
+'''
+Storage backends for the data of flockr (users, sessions, channels, messages
+and the pending messages and standups). Every module uses the data object
+from data.py through the methods of Storage, so the backend can be chosen
+per deployment without changing them
+bisect module provides binary search for finding a message in its channel and
+for finding the search terms that start with a prefix
+threading module provides a lock so message ids are unique across threads
+abc module makes Storage an abstract class, so a backend missing one of its
+methods cannot be created
+'''
+import abc
+from bisect import bisect_left, insort
+import threading
+from helper_functions import normalise_email, message_terms, message_trigrams
+from helper_functions import query_terms, message_has_terms
+from records import UserRecord, ChannelRecord, MessageRecord
+
+class Storage(abc.ABC):
+    '''
+    The methods every storage backend provides. Records returned (users,
+    channels, messages, pending messages and standups) are read like
+    dictionaries (record[field], field in record) and must only be read, they
+    are changed through the methods below. The in-memory backends keep users,
+    channels and messages in the slotted records of records.py.
+
+    - user = {'u_id', 'email', 'password', 'name_first', 'name_last',
+      'handle_str', 'permission_id'} and 'profile_img_url' once one is uploaded
+    - channel = {'channel_id', 'name', 'creator', 'is_public'}
+    - message = {'message_id', 'u_id', 'message', 'time_created', 'reacts',
+      'is_pinned'}, where message['reacts'][react_id] is the set of u_ids that
+      reacted with react_id
+    - future_msg = {'message_id', 'u_id', 'channel_id', 'message', 'time_sent'}
+      for a message from message_sendlater that has not been sent yet
+    - standup = {'messages', 'time_finish', 'u_id', 'message_id'} for a
+      running standup, u_id is the user who started it and message_id is the
+      message_id of the summary message sent when it ends
+    '''
+
+    @abc.abstractmethod
+    def clear(self):
+        '''Removes everything from the storage'''
+
+    # users
+    @abc.abstractmethod
+    def add_user(self, user):
+        '''Adds user, with the u_id in user['u_id']'''
+
+    @abc.abstractmethod
+    def get_user(self, u_id):
+        '''Returns the user with u_id, or None if there is no such user'''
+
+    @abc.abstractmethod
+    def update_user(self, u_id, **changes):
+        '''Changes the fields of the user with u_id given in changes'''
+
+    @abc.abstractmethod
+    def user_count(self):
+        '''Returns the number of users'''
+
+    @abc.abstractmethod
+    def all_users(self):
+        '''Returns a list of every user, in u_id order'''
+
+    @abc.abstractmethod
+    def user_by_email(self, email):
+        '''Returns the u_id of the user with email (in any case), or None'''
+
+    @abc.abstractmethod
+    def user_by_handle(self, handle_str):
+        '''Returns the u_id of the user with handle_str, or None'''
+
+    @abc.abstractmethod
+    def handle_suffix(self, base_handle):
+        '''
+        Returns the (handle, alphabet, replace_position) that generate_handle
+        stopped at for base_handle, or None if it is not remembered
+        '''
+
+    @abc.abstractmethod
+    def set_handle_suffix(self, base_handle, suffix):
+        '''Remembers where generate_handle stopped for base_handle'''
+
+    # sessions and reset codes
+    @abc.abstractmethod
+    def add_session(self, token, u_id):
+        '''Starts a session for the user with u_id, logged in with token'''
+
+    @abc.abstractmethod
+    def session_user(self, token):
+        '''Returns the u_id logged in with token, or None if token is not active'''
+
+    @abc.abstractmethod
+    def remove_session(self, token):
+        '''Ends the session of token, returns False if token was not active'''
+
+    @abc.abstractmethod
+    def set_reset_code(self, u_id, reset_code):
+        '''Gives the user with u_id reset_code, replacing any older reset code'''
+
+    @abc.abstractmethod
+    def reset_code_user(self, reset_code):
+        '''Returns the u_id reset_code was given to, or None'''
+
+    @abc.abstractmethod
+    def remove_reset_code(self, reset_code):
+        '''Removes reset_code and returns the u_id it was given to, or None'''
+
+    # channels
+    @abc.abstractmethod
+    def add_channel(self, channel):
+        '''Adds channel (with no members), with the channel_id in channel['channel_id']'''
+
+    @abc.abstractmethod
+    def get_channel(self, channel_id):
+        '''Returns the channel with channel_id, or None if there is no such channel'''
+
+    @abc.abstractmethod
+    def channel_count(self):
+        '''Returns the number of channels'''
+
+    @abc.abstractmethod
+    def all_channels(self):
+        '''Returns a list of every channel, in channel_id order'''
+
+    @abc.abstractmethod
+    def add_member(self, channel_id, u_id):
+        '''Adds the user with u_id as a member of the channel with channel_id'''
+
+    @abc.abstractmethod
+    def remove_member(self, channel_id, u_id):
+        '''Removes the user with u_id as a member (and owner) of the channel'''
+
+    @abc.abstractmethod
+    def add_owner(self, channel_id, u_id):
+        '''Adds the user with u_id as an owner of the channel with channel_id'''
+
+    @abc.abstractmethod
+    def remove_owner(self, channel_id, u_id):
+        '''Removes the user with u_id as an owner of the channel with channel_id'''
+
+    @abc.abstractmethod
+    def is_member(self, channel_id, u_id):
+        '''
+        Returns whether the user with u_id is a member of the channel (False
+        if there is no such channel)
+        '''
+
+    @abc.abstractmethod
+    def is_owner(self, channel_id, u_id):
+        '''
+        Returns whether the user with u_id is an owner of the channel (False
+        if there is no such channel)
+        '''
+
+    @abc.abstractmethod
+    def channel_members(self, channel_id):
+        '''Returns the set of u_ids of the members of the channel'''
+
+    @abc.abstractmethod
+    def channel_owners(self, channel_id):
+        '''Returns the set of u_ids of the owners of the channel'''
+
+    @abc.abstractmethod
+    def user_channels(self, u_id):
+        '''
+        Returns a list of {'channel_id', 'name'} of the channels the user with
+        u_id is a member of, in the order they were joined
+        '''
+
+    # messages
+    @abc.abstractmethod
+    def next_message_id(self):
+        '''
+        Returns a new message_id, one more than the last one given out, so
+        message_ids are never reused (even after a message is removed)
+        '''
+
+    @abc.abstractmethod
+    def reserve_message_id(self, message_id):
+        '''Makes sure message_id (given out before a restart) is not given out again'''
+
+    @abc.abstractmethod
+    def add_message(self, channel_id, message):
+        '''Adds message as the most recent message of the channel with channel_id'''
+
+    @abc.abstractmethod
+    def get_message(self, message_id):
+        '''Returns the message with message_id, or None if there is no such message'''
+
+    @abc.abstractmethod
+    def message_channel(self, message_id):
+        '''Returns the channel_id of the message with message_id, or None'''
+
+    @abc.abstractmethod
+    def update_message(self, message_id, **changes):
+        '''Changes the fields of the message with message_id given in changes'''
+
+    @abc.abstractmethod
+    def add_react(self, message_id, react_id, u_id):
+        '''Adds a react with react_id from the user with u_id to the message'''
+
+    @abc.abstractmethod
+    def remove_react(self, message_id, react_id, u_id):
+        '''Removes the react with react_id of the user with u_id from the message'''
+
+    @abc.abstractmethod
+    def remove_message(self, message_id):
+        '''Removes the message with message_id from its channel'''
+
+    @abc.abstractmethod
+    def message_count(self, channel_id):
+        '''Returns the number of messages in the channel with channel_id'''
+
+    @abc.abstractmethod
+    def channel_messages(self, channel_id, start, count):
+        '''
+        Returns a list of up to count messages of the channel with channel_id,
+        most recent first, skipping the start most recent messages
+        '''
+
+    @abc.abstractmethod
+    def messages_before(self, message_id, count):
+        '''
+        Returns a list of up to count messages of the channel of the message
+        with message_id that are older than it, most recent first
+        '''
+
+    @abc.abstractmethod
+    def messages_after(self, message_id, count):
+        '''
+        Returns a list of the up to count messages of the channel of the
+        message with message_id that come straight after it, most recent first
+        '''
+
+    @abc.abstractmethod
+    def search_messages(self, query_str, channel_ids, substring=False):
+        '''
+        Yields the messages of the channels with channel_ids that have every
+        term of query_str (see query_terms), or if substring is True, that
+        have query_str anywhere in their text (ignoring case)
+        '''
+
+    @abc.abstractmethod
+    def use_trigram_index(self, enabled):
+        '''
+        Turns the trigram index used by substring searches on or off, for
+        backends that have one
+        '''
+
+    # pending messages and standups
+    @abc.abstractmethod
+    def add_pending_message(self, future_msg):
+        '''Adds a message from message_sendlater that has not been sent yet'''
+
+    @abc.abstractmethod
+    def remove_pending_message(self, message_id):
+        '''Removes the pending message with message_id, returns False if there is none'''
+
+    @abc.abstractmethod
+    def pending_messages(self, u_id):
+        '''Returns a list of the pending messages sent by the user with u_id'''
+
+    @abc.abstractmethod
+    def start_standup(self, channel_id, standup):
+        '''Starts standup in the channel with channel_id'''
+
+    @abc.abstractmethod
+    def get_standup(self, channel_id):
+        '''Returns the standup running in the channel with channel_id, or None'''
+
+    @abc.abstractmethod
+    def add_standup_message(self, channel_id, message):
+        '''Adds message to the standup running in the channel with channel_id'''
+
+    @abc.abstractmethod
+    def end_standup(self, channel_id):
+        '''Removes and returns the standup running in the channel with channel_id'''
+
+class DictStorage(Storage):
+    '''
+    Keeps everything in one dictionary, with each channel holding its own
+    messages. Nothing is indexed, so finding a user by email or handle, or a
+    message by message_id, looks through every user or message.
+
+    - self.data['users'][u_id] is the UserRecord of the user, with
+      channel_membership (a dict with the channel_id of each channel the user
+      is in as keys, in the order they were joined) and reset_code once one
+      is sent
+    - self.data['channels'][channel_id] is the ChannelRecord of the channel,
+      with the sets owner_members and all_members, the list messages of
+      MessageRecords (oldest first, so the most recent message is last) and
+      standup while one is running
+    - self.data['sessions'][token] = u_id
+    - self.data['reset_codes'][reset_code] = u_id
+    - self.data['msg_later'][message_id] = future_msg
+    '''
+
+    def __init__(self):
+        self.message_id_lock = threading.Lock()
+        self.data = {}
+        self.clear()
+
+    def clear(self):
+        '''See Storage.clear'''
+        self.data = {
+            'users': {},
+            'channels': {},
+            'sessions': {},
+            'reset_codes': {},
+            'msg_later': {},
+            'last_message_id': 0
+        }
+
+    def state(self):
+        '''
+        Returns everything kept by the storage, used by data_log to save a
+        snapshot of it
+        '''
+        return self.data
+
+    def load_state(self, state):
+        '''Replaces everything kept by the storage with a state from state()'''
+        self.data = state
+
+    def files(self):
+        '''
+        Returns the paths of the files outside the state that state() refers
+        to, which data_log keeps while a snapshot may need them (none here)
+        '''
+        return set()
+
+    def release_files(self, keep):
+        '''
+        Removes the files no longer used by the storage, apart from those in
+        keep. Once it has been called, files stop being removed as soon as
+        they are no longer used and wait for the next call (nothing here).
+        '''
+
+    # users
+    def add_user(self, user):
+        '''See Storage.add_user'''
+        self.data['users'][user['u_id']] = UserRecord(user)
+
+    def get_user(self, u_id):
+        '''See Storage.get_user'''
+        return self.data['users'].get(u_id)
+
+    def update_user(self, u_id, **changes):
+        '''See Storage.update_user'''
+        self.data['users'][u_id].update(changes)
+
+    def user_count(self):
+        '''See Storage.user_count'''
+        return len(self.data['users'])
+
+    def all_users(self):
+        '''See Storage.all_users'''
+        return list(self.data['users'].values())
+
+    def user_by_email(self, email):
+        '''See Storage.user_by_email'''
+        email = normalise_email(email)
+        for user in self.data['users'].values():
+            if normalise_email(user.email) == email:
+                return user.u_id
+        return None
+
+    def user_by_handle(self, handle_str):
+        '''See Storage.user_by_handle'''
+        for user in self.data['users'].values():
+            if user.handle_str == handle_str:
+                return user.u_id
+        return None
+
+    def handle_suffix(self, base_handle):
+        '''See Storage.handle_suffix, nothing is remembered here'''
+        return None
+
+    def set_handle_suffix(self, base_handle, suffix):
+        '''See Storage.set_handle_suffix, nothing is remembered here'''
+
+    # sessions and reset codes
+    def add_session(self, token, u_id):
+        '''See Storage.add_session'''
+        self.data['sessions'][token] = u_id
+
+    def session_user(self, token):
+        '''See Storage.session_user'''
+        return self.data['sessions'].get(token)
+
+    def remove_session(self, token):
+        '''See Storage.remove_session'''
+        return self.data['sessions'].pop(token, None) is not None
+
+    def set_reset_code(self, u_id, reset_code):
+        '''See Storage.set_reset_code'''
+        user = self.data['users'][u_id]
+        if 'reset_code' in user:
+            del self.data['reset_codes'][user.reset_code]
+        user.reset_code = reset_code
+        self.data['reset_codes'][reset_code] = u_id
+
+    def reset_code_user(self, reset_code):
+        '''See Storage.reset_code_user'''
+        return self.data['reset_codes'].get(reset_code)
+
+    def remove_reset_code(self, reset_code):
+        '''See Storage.remove_reset_code'''
+        u_id = self.data['reset_codes'].pop(reset_code, None)
+        if u_id is not None:
+            del self.data['users'][u_id].reset_code
+        return u_id
+
+    # channels
+    def add_channel(self, channel):
+        '''See Storage.add_channel'''
+        self.data['channels'][channel['channel_id']] = ChannelRecord(channel)
+
+    def get_channel(self, channel_id):
+        '''See Storage.get_channel'''
+        return self.data['channels'].get(channel_id)
+
+    def channel_count(self):
+        '''See Storage.channel_count'''
+        return len(self.data['channels'])
+
+    def all_channels(self):
+        '''See Storage.all_channels'''
+        return list(self.data['channels'].values())
+
+    def add_member(self, channel_id, u_id):
+        '''See Storage.add_member'''
+        self.data['channels'][channel_id].all_members.add(u_id)
+        self.data['users'][u_id].channel_membership[channel_id] = None
+
+    def remove_member(self, channel_id, u_id):
+        '''See Storage.remove_member'''
+        channel = self.data['channels'][channel_id]
+        channel.all_members.discard(u_id)
+        channel.owner_members.discard(u_id)
+        self.data['users'][u_id].channel_membership.pop(channel_id, None)
+
+    def add_owner(self, channel_id, u_id):
+        '''See Storage.add_owner'''
+        self.data['channels'][channel_id].owner_members.add(u_id)
+
+    def remove_owner(self, channel_id, u_id):
+        '''See Storage.remove_owner'''
+        self.data['channels'][channel_id].owner_members.discard(u_id)
+
+    def is_member(self, channel_id, u_id):
+        '''See Storage.is_member'''
+        channel = self.data['channels'].get(channel_id)
+        return channel is not None and u_id in channel.all_members
+
+    def is_owner(self, channel_id, u_id):
+        '''See Storage.is_owner'''
+        channel = self.data['channels'].get(channel_id)
+        return channel is not None and u_id in channel.owner_members
+
+    def channel_members(self, channel_id):
+        '''See Storage.channel_members'''
+        return set(self.data['channels'][channel_id].all_members)
+
+    def channel_owners(self, channel_id):
+        '''See Storage.channel_owners'''
+        return set(self.data['channels'][channel_id].owner_members)
+
+    def user_channels(self, u_id):
+        '''See Storage.user_channels, the names are looked up as they are asked for'''
+        return [{'channel_id': channel_id, 'name': self.data['channels'][channel_id].name}
+                for channel_id in self.data['users'][u_id].channel_membership]
+
+    # messages
+    def next_message_id(self):
+        '''See Storage.next_message_id'''
+        with self.message_id_lock:
+            self.data['last_message_id'] += 1
+            return self.data['last_message_id']
+
+    def reserve_message_id(self, message_id):
+        '''See Storage.reserve_message_id'''
+        with self.message_id_lock:
+            self.data['last_message_id'] = max(self.data['last_message_id'], message_id)
+
+    def add_message(self, channel_id, message):
+        '''See Storage.add_message'''
+        self.data['channels'][channel_id].messages.append(MessageRecord(message))
+
+    def message_location(self, message_id):
+        '''
+        Returns the (channel_id, position) of the message with message_id in
+        the messages of its channel, or None if there is no such message
+        '''
+        for channel_id, channel in self.data['channels'].items():
+            for position, message in enumerate(channel.messages):
+                if message.message_id == message_id:
+                    return channel_id, position
+        return None
+
+    def get_message(self, message_id):
+        '''See Storage.get_message'''
+        location = self.message_location(message_id)
+        if location is None:
+            return None
+        channel_id, position = location
+        return self.data['channels'][channel_id].messages[position]
+
+    def message_channel(self, message_id):
+        '''See Storage.message_channel'''
+        location = self.message_location(message_id)
+        return None if location is None else location[0]
+
+    def message_offset(self, message_id):
+        '''
+        Returns the number of messages in the channel of the message with
+        message_id that are more recent than it (0 for the most recent), used
+        by messages_before and messages_after
+        '''
+        channel_id, position = self.message_location(message_id)
+        return len(self.data['channels'][channel_id].messages) - 1 - position
+
+    def update_message(self, message_id, **changes):
+        '''See Storage.update_message'''
+        self.get_message(message_id).update(changes)
+
+    def add_react(self, message_id, react_id, u_id):
+        '''See Storage.add_react'''
+        self.get_message(message_id).add_react(react_id, u_id)
+
+    def remove_react(self, message_id, react_id, u_id):
+        '''See Storage.remove_react'''
+        self.get_message(message_id).remove_react(react_id, u_id)
+
+    def remove_message(self, message_id):
+        '''See Storage.remove_message'''
+        channel_id, position = self.message_location(message_id)
+        del self.data['channels'][channel_id].messages[position]
+
+    def message_count(self, channel_id):
+        '''See Storage.message_count'''
+        return len(self.data['channels'][channel_id].messages)
+
+    def channel_messages(self, channel_id, start, count):
+        '''See Storage.channel_messages'''
+        # messages are stored oldest first, so the message start is counted
+        # back from the end of the list
+        message_list = self.data['channels'][channel_id].messages
+        newest_position = len(message_list) - start
+        oldest_position = max(newest_position - count, 0)
+        return list(reversed(message_list[oldest_position:newest_position]))
+
+    def messages_before(self, message_id, count):
+        '''See Storage.messages_before'''
+        channel_id = self.message_channel(message_id)
+        return self.channel_messages(channel_id, self.message_offset(message_id) + 1, count)
+
+    def messages_after(self, message_id, count):
+        '''See Storage.messages_after'''
+        channel_id = self.message_channel(message_id)
+        offset = self.message_offset(message_id)
+        start = max(offset - count, 0)
+        return self.channel_messages(channel_id, start, offset - start)
+
+    def search_messages(self, query_str, channel_ids, substring=False):
+        '''See Storage.search_messages, every message of the channels is checked'''
+        terms = query_terms(query_str)
+        query_str = query_str.lower()
+        if not (query_str if substring else terms):
+            return
+        for channel_id in channel_ids:
+            for message in self.data['channels'][channel_id].messages:
+                if substring and query_str in message.message.lower():
+                    yield message
+                elif not substring and message_has_terms(message.message, terms):
+                    yield message
+
+    def use_trigram_index(self, enabled):
+        '''See Storage.use_trigram_index, there is no trigram index here'''
+
+    # pending messages and standups
+    def add_pending_message(self, future_msg):
+        '''See Storage.add_pending_message'''
+        self.data['msg_later'][future_msg['message_id']] = future_msg
+
+    def remove_pending_message(self, message_id):
+        '''See Storage.remove_pending_message'''
+        return self.data['msg_later'].pop(message_id, None) is not None
+
+    def pending_messages(self, u_id):
+        '''See Storage.pending_messages'''
+        return [future_msg for future_msg in self.data['msg_later'].values()
+                if future_msg['u_id'] == u_id]
+
+    def start_standup(self, channel_id, standup):
+        '''See Storage.start_standup'''
+        self.data['channels'][channel_id].standup = standup
+
+    def get_standup(self, channel_id):
+        '''See Storage.get_standup'''
+        return self.data['channels'][channel_id].get('standup')
+
+    def add_standup_message(self, channel_id, message):
+        '''See Storage.add_standup_message'''
+        self.data['channels'][channel_id].standup['messages'].append(message)
+
+    def end_standup(self, channel_id):
+        '''See Storage.end_standup'''
+        channel = self.data['channels'][channel_id]
+        standup = channel.standup
+        del channel.standup
+        return standup
+
+class IndexedStorage(DictStorage):
+    '''
+    DictStorage with indexes kept up to date on every change, so lookups do
+    not look through every user or message:
+
+    - self.data['emails'][normalise_email(email)] = u_id
+    - self.data['handles'][handle_str] = u_id
+    - self.data['handle_suffixes'][base_handle] = (handle, alphabet, replace_position),
+      the last handle generated from base_handle and where its suffixing stopped
+    - self.data['message_index'][message_id] is the message (the same
+      record as the one in the channel's messages), with its channel_id and
+      its seq. Each channel also has message_seqs (the seq of each of its
+      messages, increasing, given out from its last_seq) so a message is
+      found in its channel with a binary search, even though message_ids are
+      not in order (e.g. messages from message_sendlater)
+    - self.data['msg_later_ids'][u_id] = set of message_ids of the pending
+      messages sent by u_id
+    - self.data['search_index'][term] = set of message_ids of the messages
+      with the word term (lowercase), self.data['search_terms'] is every term
+      in sorted order so the terms starting with a prefix are next to each other
+    - self.data['trigram_index'][trigram] = set of message_ids of the messages
+      with the 3 characters trigram (lowercase) in their text, this index is
+      optional and is None until use_trigram_index turns it on
+    '''
+
+    def __init__(self):
+        self.trigram_index_enabled = False
+        super().__init__()
+
+    def clear(self):
+        '''See Storage.clear, the trigram index stays on if it was on'''
+        super().clear()
+        self.data.update({
+            'emails': {},
+            'handles': {},
+            'handle_suffixes': {},
+            'message_index': {},
+            'msg_later_ids': {},
+            'search_index': {},
+            'search_terms': [],
+            'trigram_index': {} if self.trigram_index_enabled else None
+        })
+
+    def load_state(self, state):
+        '''
+        See DictStorage.load_state, the trigram index is built or dropped if
+        the state was saved with it the other way
+        '''
+        super().load_state(state)
+        if self.trigram_index_enabled != (state['trigram_index'] is not None):
+            self.use_trigram_index(self.trigram_index_enabled)
+
+    # users
+    def add_user(self, user):
+        '''See Storage.add_user'''
+        super().add_user(user)
+        self.data['emails'][normalise_email(user['email'])] = user['u_id']
+        self.data['handles'][user['handle_str']] = user['u_id']
+        self.data['msg_later_ids'][user['u_id']] = set()
+
+    def update_user(self, u_id, **changes):
+        '''See Storage.update_user'''
+        user = self.data['users'][u_id]
+        if 'email' in changes:
+            del self.data['emails'][normalise_email(user.email)]
+            self.data['emails'][normalise_email(changes['email'])] = u_id
+        if 'handle_str' in changes:
+            del self.data['handles'][user.handle_str]
+            self.data['handles'][changes['handle_str']] = u_id
+        super().update_user(u_id, **changes)
+
+    def user_by_email(self, email):
+        '''See Storage.user_by_email'''
+        return self.data['emails'].get(normalise_email(email))
+
+    def user_by_handle(self, handle_str):
+        '''See Storage.user_by_handle'''
+        return self.data['handles'].get(handle_str)
+
+    def handle_suffix(self, base_handle):
+        '''See Storage.handle_suffix'''
+        return self.data['handle_suffixes'].get(base_handle)
+
+    def set_handle_suffix(self, base_handle, suffix):
+        '''See Storage.set_handle_suffix'''
+        self.data['handle_suffixes'][base_handle] = suffix
+
+    # channels
+    def add_channel(self, channel):
+        '''See Storage.add_channel'''
+        super().add_channel(channel)
+        self.data['channels'][channel['channel_id']].update({'message_seqs': [], 'last_seq': 0})
+
+    # messages
+    def add_message(self, channel_id, message):
+        '''
+        See Storage.add_message, the message is also given the next seq of
+        the channel and added to the message index and search index
+        '''
+        channel = self.data['channels'][channel_id]
+        channel.last_seq += 1
+        message = MessageRecord(message)
+        message.channel_id = channel_id
+        message.seq = channel.last_seq
+        channel.messages.append(message)
+        channel.message_seqs.append(message.seq)
+        self.data['message_index'][message.message_id] = message
+        self.index_text(message.message_id, message.message)
+
+    def message_position(self, message_id):
+        '''
+        Returns the position of the message with message_id in the messages
+        of its channel, with a binary search over the channel's seqs
+        '''
+        message = self.data['message_index'][message_id]
+        return bisect_left(self.data['channels'][message.channel_id].message_seqs, message.seq)
+
+    def get_message(self, message_id):
+        '''See Storage.get_message'''
+        return self.data['message_index'].get(message_id)
+
+    def message_channel(self, message_id):
+        '''See Storage.message_channel'''
+        message = self.data['message_index'].get(message_id)
+        return None if message is None else message.channel_id
+
+    def message_offset(self, message_id):
+        '''See DictStorage.message_offset'''
+        channel_id = self.data['message_index'][message_id].channel_id
+        return self.message_count(channel_id) - 1 - self.message_position(message_id)
+
+    def update_message(self, message_id, **changes):
+        '''See Storage.update_message, a changed text is indexed again'''
+        message = self.data['message_index'][message_id]
+        if 'message' in changes:
+            self.unindex_text(message_id, message.message)
+            self.index_text(message_id, changes['message'])
+        message.update(changes)
+
+    def remove_message(self, message_id):
+        '''See Storage.remove_message'''
+        position = self.message_position(message_id)
+        message = self.data['message_index'].pop(message_id)
+        channel = self.data['channels'][message.channel_id]
+        del channel.messages[position]
+        del channel.message_seqs[position]
+        self.unindex_text(message_id, message.message)
+
+    def index_text(self, message_id, text):
+        '''
+        Adds the message with message_id to the posting list of every search
+        term in its text (and of every trigram, if the trigram index is on)
+        '''
+        for term in message_terms(text):
+            if term not in self.data['search_index']:
+                self.data['search_index'][term] = set()
+                insort(self.data['search_terms'], term)
+            self.data['search_index'][term].add(message_id)
+        if self.data['trigram_index'] is not None:
+            for trigram in message_trigrams(text):
+                self.data['trigram_index'].setdefault(trigram, set()).add(message_id)
+
+    def unindex_text(self, message_id, text):
+        '''
+        Removes the message with message_id from the posting list of every
+        search term (and trigram) in its text, terms left with no messages
+        are removed
+        '''
+        for term in message_terms(text):
+            postings = self.data['search_index'].get(term)
+            if postings is None:
+                continue
+            postings.discard(message_id)
+            if not postings:
+                del self.data['search_index'][term]
+                del self.data['search_terms'][bisect_left(self.data['search_terms'], term)]
+        if self.data['trigram_index'] is not None:
+            for trigram in message_trigrams(text):
+                postings = self.data['trigram_index'].get(trigram)
+                if postings is None:
+                    continue
+                postings.discard(message_id)
+                if not postings:
+                    del self.data['trigram_index'][trigram]
+
+    def term_postings(self, term):
+        '''
+        Returns the set of message_ids matching one term of a search query, a
+        term ending with * matches messages with any word starting with it
+        '''
+        if not term.endswith('*'):
+            return self.data['search_index'].get(term, set())
+        prefix = term[:-1]
+        postings = set()
+        search_terms = self.data['search_terms']
+        position = bisect_left(search_terms, prefix)
+        while position < len(search_terms) and search_terms[position].startswith(prefix):
+            postings |= self.data['search_index'][search_terms[position]]
+            position += 1
+        return postings
+
+    def search_messages(self, query_str, channel_ids, substring=False):
+        '''
+        See Storage.search_messages, only the messages found in the search
+        index (or trigram index, for substring searches) are looked at
+        '''
+        if substring:
+            trigrams = message_trigrams(query_str)
+            if self.data['trigram_index'] is None or not trigrams:
+                # the trigram index cannot narrow this search down
+                yield from super().search_messages(query_str, channel_ids, substring)
+                return
+            postings = [self.data['trigram_index'].get(trigram, set()) for trigram in trigrams]
+        else:
+            postings = [self.term_postings(term) for term in query_terms(query_str)]
+            if not postings:
+                return
+
+        # intersecting from the smallest posting list keeps every step small
+        postings.sort(key=len)
+        message_ids = set(postings[0])
+        for term_ids in postings[1:]:
+            message_ids &= term_ids
+            if not message_ids:
+                break
+
+        query_str = query_str.lower()
+        for message_id in message_ids:
+            message = self.data['message_index'][message_id]
+            if message.channel_id not in channel_ids:
+                continue
+            # trigrams only show the message might contain query_str
+            if substring and query_str not in message.message.lower():
+                continue
+            yield message
+
+    def use_trigram_index(self, enabled):
+        '''See Storage.use_trigram_index, turning it on indexes every message'''
+        self.trigram_index_enabled = enabled
+        if not enabled:
+            self.data['trigram_index'] = None
+            return
+        self.data['trigram_index'] = {}
+        for message_id, message in self.data['message_index'].items():
+            for trigram in message_trigrams(message.message):
+                self.data['trigram_index'].setdefault(trigram, set()).add(message_id)
+
+    # pending messages
+    def add_pending_message(self, future_msg):
+        '''See Storage.add_pending_message'''
+        super().add_pending_message(future_msg)
+        self.data['msg_later_ids'][future_msg['u_id']].add(future_msg['message_id'])
+
+    def remove_pending_message(self, message_id):
+        '''See Storage.remove_pending_message'''
+        future_msg = self.data['msg_later'].pop(message_id, None)
+        if future_msg is None:
+            return False
+        self.data['msg_later_ids'][future_msg['u_id']].discard(message_id)
+        return True
+
+    def pending_messages(self, u_id):
+        '''See Storage.pending_messages'''
+        return [self.data['msg_later'][message_id]
+                for message_id in self.data['msg_later_ids'][u_id]]
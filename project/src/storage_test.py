@@ -0,0 +1,224 @@
+'''Importing the storage backends to test storage.py, every test is run on each backend'''
+import tempfile
+import pytest
+from storage import Storage, DictStorage, IndexedStorage
+from sqlite_storage import SqliteStorage
+from columnar_storage import ColumnarStorage
+from cold_storage import ColdStorage
+
+BACKENDS = [DictStorage, IndexedStorage, ColumnarStorage,
+            lambda: ColdStorage(tempfile.mkdtemp()), lambda: SqliteStorage(':memory:')]
+
+def new_storage(backend):
+    '''Returns a storage of backend with two users and a channel they are both in'''
+    storage = backend()
+    for u_id, name in ((1, 'bruce'), (2, 'jackie')):
+        storage.add_user({
+            'u_id': u_id,
+            'email': f'{name}@gmail.com',
+            'password': 'password1234',
+            'name_first': name,
+            'name_last': 'lee',
+            'handle_str': f'{name}lee',
+            'permission_id': u_id
+        })
+    storage.add_channel({'channel_id': 1, 'name': 'channel_one', 'creator': 1, 'is_public': True})
+    storage.add_member(1, 1)
+    storage.add_owner(1, 1)
+    storage.add_member(1, 2)
+    return storage
+
+def new_message(message_id, text):
+    '''Returns a message with message_id and text sent by the user with u_id 1'''
+    return {
+        'message_id': message_id,
+        'u_id': 1,
+        'message': text,
+        'time_created': float(message_id),
+        'reacts': {},
+        'is_pinned': False
+    }
+
+def test_storage_users():
+    '''Users are found by u_id, email (in any case) and handle, including after changes'''
+    for backend in BACKENDS:
+        storage = new_storage(backend)
+        assert storage.user_count() == 2
+        assert [user['u_id'] for user in storage.all_users()] == [1, 2]
+        assert storage.get_user(3) is None
+        assert storage.user_by_email('BRUCE@gmail.com') == 1
+        assert storage.user_by_handle('jackielee') == 2
+
+        storage.update_user(1, email='bruce2@gmail.com', handle_str='bruce')
+        assert storage.get_user(1)['email'] == 'bruce2@gmail.com'
+        assert storage.user_by_email('bruce@gmail.com') is None
+        assert storage.user_by_email('bruce2@gmail.com') == 1
+        assert storage.user_by_handle('brucelee') is None
+        assert storage.user_by_handle('bruce') == 1
+
+def test_storage_sessions_reset_codes():
+    '''Sessions and reset codes are added, looked up and removed'''
+    for backend in BACKENDS:
+        storage = new_storage(backend)
+        storage.add_session('token1', 1)
+        storage.add_session('token2', 1)
+        assert storage.session_user('token1') == 1
+        assert storage.remove_session('token1')
+        assert not storage.remove_session('token1')
+        assert storage.session_user('token1') is None
+        assert storage.session_user('token2') == 1
+
+        storage.set_reset_code(2, '12345678')
+        storage.set_reset_code(2, '87654321')
+        assert storage.reset_code_user('12345678') is None
+        assert storage.remove_reset_code('87654321') == 2
+        assert storage.remove_reset_code('87654321') is None
+
+def test_storage_members():
+    '''
+    Members and owners of a channel are kept, leaving a channel removes both,
+    and a user's channels are in the order they were joined
+    '''
+    for backend in BACKENDS:
+        storage = new_storage(backend)
+        assert storage.channel_members(1) == {1, 2}
+        assert storage.channel_owners(1) == {1}
+        assert storage.user_channels(2) == [{'channel_id': 1, 'name': 'channel_one'}]
+
+        storage.add_owner(1, 2)
+        storage.remove_member(1, 2)
+        assert not storage.is_member(1, 2)
+        assert not storage.is_owner(1, 2)
+        assert not storage.is_member(99, 1)
+        assert not storage.is_owner(99, 1)
+        assert storage.user_channels(2) == []
+
+        storage.add_channel({'channel_id': 2, 'name': 'channel_two', 'creator': 1,
+                             'is_public': True})
+        storage.add_member(2, 2)
+        storage.add_member(1, 2)
+        assert storage.user_channels(2) == [{'channel_id': 2, 'name': 'channel_two'},
+                                            {'channel_id': 1, 'name': 'channel_one'}]
+
+def test_storage_incomplete_backend():
+    '''A backend without every method of Storage cannot be created'''
+    methods = {name: lambda self, *args, **kwargs: None for name in Storage.__abstractmethods__}
+    assert isinstance(type('Complete', (Storage,), methods)(), Storage)
+    del methods['messages_after']
+    with pytest.raises(TypeError):
+        type('Incomplete', (Storage,), methods)()
+    assert all(isinstance(backend(), Storage) for backend in BACKENDS)
+
+def test_storage_messages():
+    '''Messages are paged most recent first and found by message_id after changes'''
+    for backend in BACKENDS:
+        storage = new_storage(backend)
+        for message_id in (3, 1, 2, 4):
+            storage.add_message(1, new_message(message_id, f'message {message_id}'))
+        assert storage.message_count(1) == 4
+        assert [message['message_id'] for message in storage.channel_messages(1, 1, 2)] == [2, 1]
+        assert [message['message_id'] for message in storage.messages_before(1, 5)] == [3]
+        assert [message['message_id'] for message in storage.messages_after(3, 2)] == [2, 1]
+        assert [message['message_id'] for message in storage.messages_after(3, 5)] == [4, 2, 1]
+        assert storage.message_channel(2) == 1
+
+        storage.remove_message(1)
+        storage.update_message(2, message='edited', is_pinned=True)
+        storage.add_react(2, 1, 2)
+        assert storage.get_message(1) is None
+        assert storage.get_message(2)['message'] == 'edited'
+        assert storage.get_message(2)['is_pinned']
+        assert storage.get_message(2)['reacts'] == {1: {2}}
+        assert [message['message_id'] for message in storage.messages_before(4, 5)] == [2, 3]
+        assert storage.messages_after(4, 5) == []
+        storage.remove_react(2, 1, 2)
+        assert storage.get_message(2)['reacts'] == {1: set()}
+
+def test_storage_message_ids():
+    '''message_ids are never given out twice, including reserved ones'''
+    for backend in BACKENDS:
+        storage = new_storage(backend)
+        assert storage.next_message_id() == 1
+        storage.reserve_message_id(10)
+        storage.reserve_message_id(5)
+        assert storage.next_message_id() == 11
+
+def test_storage_search():
+    '''Searches give the same messages on every backend, with and without the trigram index'''
+    for backend in BACKENDS:
+        for trigram_index in (False, True):
+            storage = new_storage(backend)
+            storage.use_trigram_index(trigram_index)
+            storage.add_message(1, new_message(1, 'Hello world'))
+            storage.add_message(1, new_message(2, 'the contest'))
+            storage.add_message(1, new_message(3, 'Testing the world'))
+            storage.update_message(2, message='contested')
+
+            def search(query_str, substring=False, channel_ids=frozenset({1})):
+                messages = storage.search_messages(query_str, channel_ids, substring)
+                return sorted(message['message_id'] for message in messages)
+            assert search('WORLD') == [1, 3]
+            assert search('the') == [3]
+            assert search('test* world') == [3]
+            assert search('con*') == [2]
+            assert search('') == []
+            assert search('est', True) == [2, 3]
+            assert search('o w', True) == [1]
+            assert search('', True) == []
+            assert search('world', channel_ids=frozenset()) == []
+
+def test_storage_pending_standups():
+    '''Pending messages and standups are kept until they are removed'''
+    for backend in BACKENDS:
+        storage = new_storage(backend)
+        future_msg = {
+            'message_id': 1,
+            'u_id': 2,
+            'channel_id': 1,
+            'message': 'later',
+            'time_sent': 100.0
+        }
+        storage.add_pending_message(future_msg)
+        assert storage.pending_messages(2) == [future_msg]
+        assert storage.pending_messages(1) == []
+        assert storage.remove_pending_message(1)
+        assert not storage.remove_pending_message(1)
+        assert storage.pending_messages(2) == []
+
+        storage.start_standup(1, {'messages': [], 'time_finish': 100.0, 'u_id': 1,
+                                  'message_id': 2})
+        storage.add_standup_message(1, 'brucelee: hello')
+        assert storage.get_standup(1)['messages'] == ['brucelee: hello']
+        assert storage.end_standup(1)['message_id'] == 2
+        assert storage.get_standup(1) is None
+
+def test_storage_clear():
+    '''clear removes everything'''
+    for backend in BACKENDS:
+        storage = new_storage(backend)
+        storage.add_session('token', 1)
+        storage.add_message(1, new_message(storage.next_message_id(), 'hello'))
+        storage.clear()
+        assert storage.user_count() == 0
+        assert storage.channel_count() == 0
+        assert storage.session_user('token') is None
+        assert storage.user_by_email('bruce@gmail.com') is None
+        assert storage.next_message_id() == 1
+
+def test_sqlite_storage_reopen(tmp_path):
+    '''Everything kept by the sqlite backend is still there when its database is opened again'''
+    path = str(tmp_path / 'flockr.db')
+    storage = new_storage(lambda: SqliteStorage(path))
+    storage.add_session('token', 1)
+    storage.add_message(1, new_message(storage.next_message_id(), 'hello world'))
+    storage.add_react(1, 1, 2)
+    storage.close()
+
+    storage = SqliteStorage(path)
+    assert storage.session_user('token') == 1
+    assert storage.user_by_email('jackie@gmail.com') == 2
+    assert storage.user_channels(1) == [{'channel_id': 1, 'name': 'channel_one'}]
+    assert storage.get_message(1)['reacts'] == {1: {2}}
+    assert [message['message_id'] for message in storage.search_messages('hello', {1})] == [1]
+    assert storage.next_message_id() == 2
+    storage.close()
@@ -10,7 +10,7 @@ import urllib
 import requests
 from PIL import Image
 from data import data
-from error import InputError, AccessError
+from error import InputError
 from helper_functions import u_id_finder
 
 def user_profile(token, u_id):
@@ -22,30 +22,23 @@ def user_profile(token, u_id):
     dictionaries, with information about the user's user_id, email,
     first name, last name and handle
     '''
-    valid_token = False
-    valid_u_id = False
-    user_detail = {}
-    for user in data['users']:
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                valid_token = True
-        if data['users'][user]['u_id'] == u_id:
-            valid_u_id = True
-            user_detail = {
-                'u_id': data['users'][user]['u_id'],
-                'email': data['users'][user]['email'],
-                'name_first': data['users'][user]['name_first'],
-                'name_last': data['users'][user]['name_last'],
-                'handle_str': data['users'][user]['handle_str']
-            }
-            if 'profile_img_url' in data['users'][user]:
-                user_detail['profile_img_url'] = data['users'][user]['profile_img_url']
-    if not valid_token:
-        raise AccessError('Invalid token entered')
-
-    if not valid_u_id:
+    # using helper function to raise AccessError if token is invalid
+    u_id_finder(token, data)
+
+    user = data.get_user(u_id)
+    if user is None:
         raise InputError('Invalid u_id entered')
 
+    user_detail = {
+        'u_id': user['u_id'],
+        'email': user['email'],
+        'name_first': user['name_first'],
+        'name_last': user['name_last'],
+        'handle_str': user['handle_str']
+    }
+    if 'profile_img_url' in user:
+        user_detail['profile_img_url'] = user['profile_img_url']
+
     return {'user': user_detail}
 
 def user_profile_setname(token, name_first, name_last):
@@ -70,17 +63,7 @@ def user_profile_setname(token, name_first, name_last):
         raise InputError('Last name cannot be less than 1 character long')
 
     u_id = u_id_finder(token, data)
-    data['users'][u_id]['name_first'] = name_first
-    data['users'][u_id]['name_last'] = name_last
-    for channel in data['users'][u_id]['channel_membership']:
-        for member in data['channels'][channel['channel_id']]['all_members']:
-            if member['u_id'] == u_id:
-                member['name_first'] = name_first
-                member['name_last'] = name_last
-        for owner in data['channels'][channel['channel_id']]['owner_members']:
-            if owner['u_id'] == u_id:
-                owner['name_first'] = name_first
-                owner['name_last'] = name_last
+    data.update_user(u_id, name_first=name_first, name_last=name_last)
     return {}
 
 def user_profile_setemail(token, email):
@@ -109,18 +92,12 @@ def user_profile_setemail(token, email):
     if not re.search(regex, email):
         raise InputError('Invalid email address entered')
 
-    if any(email == user['email'] for _, user in data['users'].items()):
-        raise InputError('Email address is already being used by another user')
+    with data.users_lock:
+        if data.user_by_email(email) is not None:
+            raise InputError('Email address is already being used by another user')
 
-    valid_token = False
-    for user in data['users']:
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                valid_token = True
-                data['users'][user]['email'] = email
-
-    if not valid_token:
-        raise AccessError('Invalid token entered')
+        u_id = u_id_finder(token, data)
+        data.update_user(u_id, email=email)
 
     return {
     }
@@ -140,18 +117,12 @@ def user_profile_sethandle(token, handle_str):
     if len(handle_str) < 3:
         raise InputError('Handle cannot be less than 3 characters long')
 
-    if any(handle_str == user['handle_str'] for _, user in data['users'].items()):
-        raise InputError('Handle is already being used by another user')
-
-    valid_token = False
-    for user in data['users']:
-        if 'token' in data['users'][user]:
-            if data['users'][user]['token'] == token:
-                valid_token = True
-                data['users'][user]['handle_str'] = handle_str
+    with data.users_lock:
+        if data.user_by_handle(handle_str) is not None:
+            raise InputError('Handle is already being used by another user')
 
-    if not valid_token:
-        raise AccessError('Invalid token entered')
+        u_id = u_id_finder(token, data)
+        data.update_user(u_id, handle_str=handle_str)
 
     return {
     }
@@ -195,12 +166,5 @@ def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end, bas
     u_id = u_id_finder(token, data)
     cropped_img.save(f'static/profile_img{u_id}.jpg')
     profile_img_url = f'{base_url}/imgurl/profile_img{u_id}.jpg'
-    data['users'][u_id]['profile_img_url'] = profile_img_url
-    for channel in data['users'][u_id]['channel_membership']:
-        for member in data['channels'][channel['channel_id']]['all_members']:
-            if member['u_id'] == u_id:
-                member['profile_img_url'] = profile_img_url
-        for owner in data['channels'][channel['channel_id']]['owner_members']:
-            if owner['u_id'] == u_id:
-                owner['profile_img_url'] = profile_img_url
+    data.update_user(u_id, profile_img_url=profile_img_url)
     return {}
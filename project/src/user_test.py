@@ -1,9 +1,11 @@
 '''pytest is imported to check for errors and to run the tests'''
 import pytest
-from auth import auth_register
+from auth import auth_register, auth_login
 from user import user_profile, user_profile_setname, user_profile_setemail, user_profile_sethandle
 from user import user_profile_uploadphoto
 from error import InputError, AccessError
+from channels import channels_create
+from channel import channel_details, channel_join
 from other import clear
 
 # Tests for user_profile:
@@ -131,6 +133,27 @@ def test_user_profile_setname_updated_name():
                                'handle_str': 'tomhardy'
                               }
 
+def test_user_profile_setname_channel_details():
+    '''
+    checks that the updated name is shown in the details of the channels the
+    user is an owner or member of
+    '''
+    clear()
+    user_dict = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    user_dict1 = auth_register("ankitrai001@gmail.com", "12345678", "christian", "bale")
+    channel = channels_create(user_dict['token'], 'channel', True)
+    channel_join(user_dict1['token'], channel['channel_id'])
+    assert user_profile_setname(user_dict['token'], "dark", "knight") == {}
+
+    details = channel_details(user_dict1['token'], channel['channel_id'])
+    assert details['owner_members'] == [
+        {'u_id': user_dict['u_id'], 'name_first': 'dark', 'name_last': 'knight'}
+    ]
+    assert details['all_members'] == [
+        {'u_id': user_dict['u_id'], 'name_first': 'dark', 'name_last': 'knight'},
+        {'u_id': user_dict1['u_id'], 'name_first': 'christian', 'name_last': 'bale'}
+    ]
+
 # Tests for user_profile_setemail:
 def test_user_profile_setemail_valid_email():
     '''
@@ -202,6 +225,19 @@ def test_user_profile_setemail_updated_email():
                                'handle_str': 'tomhardy'
                               }
 
+def test_user_profile_setemail_login_with_new_email():
+    '''
+    checks that the user logs in with their new email after updating it, and
+    that their old email is free to be registered by another user
+    '''
+    clear()
+    user_dict = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    assert user_profile_setemail(user_dict['token'], "ankitrai001@gmail.com") == {}
+    assert auth_login("ankitrai001@gmail.com", "12345678")['u_id'] == user_dict['u_id']
+    with pytest.raises(InputError):
+        assert auth_login("ankitrai326@gmail.com", "12345678")
+    assert auth_register("ankitrai326@gmail.com", "12345678", "christian", "bale")
+
 # Tests for user_profile_sethandle:
 def test_user_profile_sethandle_valid_handle():
     '''
@@ -278,6 +314,19 @@ def test_user_profile_sethandle_updated_handle():
                                'handle_str': 'ChristianBale'
                               }
 
+def test_user_profile_sethandle_old_handle_released():
+    '''
+    checks that a user's old handle can be taken by another user once the
+    user changes their handle
+    '''
+    clear()
+    user_dict = auth_register("ankitrai326@gmail.com", "12345678", "tom", "hardy")
+    user_dict1 = auth_register("ankitrai001@gmail.com", "12345678", "christian", "bale")
+    assert user_profile_sethandle(user_dict['token'], "batman") == {}
+    assert user_profile_sethandle(user_dict1['token'], "tomhardy") == {}
+    with pytest.raises(InputError):
+        assert user_profile_sethandle(user_dict['token'], "tomhardy")
+
 # Tests for user_profile_uploadphoto:
 def test_user_profile_uploadphoto_invalid_http_status():
     '''